@@ -0,0 +1,361 @@
+"""
+active_learning.py - Active-Learning Dataset Generation
+
+PURPOSE:
+    Spends the simulation budget where the surrogate is weakest instead of on a
+    uniform sweep. Each round:
+      1. Train / fine-tune the PointNet surrogate (an ensemble, or one model with
+         MC-dropout) on the cases simulated so far.
+      2. Evaluate it on a fixed held-out test set drawn uniformly at random.
+      3. Propose CANDIDATES_PER_SHAPE candidates per shape (space-filling, via doe.py),
+         mesh them only (blockMesh, no solver) and score each one by the predictive
+         variance of the surrogate over its fluid points.
+      4. Simulate only the PICK_PER_ROUND highest-variance candidates.
+    With --strategy random the picks are independent uniform draws (the old random
+    sweep, no meshing or scoring): the baseline to compare against.
+
+USAGE:
+    python active_learning.py --strategy uncertainty
+    python active_learning.py --strategy random          # uniform baseline, same budget
+    python active_learning.py --report                   # error vs. simulations, both strategies
+    python active_learning.py --strategy uncertainty --uncertainty mc_dropout
+
+OUTPUT (WORK_DIR):
+    shared/initial/, shared/test/         : seed cases and held-out test cases (shared by strategies)
+    <strategy>/cases/                      : cases simulated by that strategy (+ doe_design.json, catalog)
+    <strategy>/candidates/round_<r>/       : meshed candidates (inputs only)
+    <strategy>/models/member_<k>.pth       : surrogate weights (fine-tuned round to round)
+    <strategy>/state.json                  : rounds, picks and scores (resumable)
+    <strategy>/report.csv                  : round, simulations, test MSE
+    error_vs_simulations.png               : written by --report
+
+NOTES:
+    - The surrogate only sees geometry (coords, y_wall, flags), so uncertainty steers
+      the geometry and refinement parameters; physics-only parameters (nu_val,
+      turb_intensity) are carried along but cannot be told apart by the model.
+    - Targets use per-sample normalization (FluidDataset default), so the test MSE is
+      the same normalized MSE train_pointnetv1.py reports as val loss.
+"""
+
+import argparse
+import csv
+import functools
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader
+
+import generate_dataset as gen
+from doe import base_space, decode_point, extend_design, parameter_space
+from train_pointnetv1 import FluidDataset, PointNetFluid, masked_loss
+
+# --- Configuration ---
+WORK_DIR = "./al_runs"
+N_CORES = gen.N_CORES
+SHAPES = list(gen.SHAPE_HANDLERS)
+
+ROUNDS = 6
+INITIAL_PER_SHAPE = 4           # Sobol seed design, shared by both strategies
+TEST_PER_SHAPE = 4              # Uniform random held-out cases
+CANDIDATES_PER_SHAPE = 16       # Proposed (meshed) per shape and round
+PICK_PER_ROUND = 8              # Simulated per round, across all shapes
+SEED = 0
+
+UNCERTAINTY = "ensemble"        # "ensemble" | "mc_dropout"
+ENSEMBLE_SIZE = 4
+MC_SAMPLES = 16
+DROPOUT = 0.2                   # Head dropout for mc_dropout
+
+NUM_POINTS = 4096
+BATCH_SIZE = 8
+LEARNING_RATE = 1e-3
+EPOCHS_INITIAL = 150
+EPOCHS_FINETUNE = 40            # Warm start from the previous round (--retrain: EPOCHS_INITIAL from scratch)
+SCALING = 1.0
+
+# ==========================================
+# 1. Simulation
+# ==========================================
+
+def case_path(data_dir, shape, point):
+    return os.path.join(data_dir, f"{shape}_{point['id']}.npy")
+
+def case_task(shape, point):
+    return (shape, point["L"], point["D"], point["Ux"], point["ref"], point["params"], point["id"])
+
+def run_pool(fn, tasks, label):
+    if not tasks:
+        return
+    print(f"{label}: {len(tasks)} cases on {N_CORES} cores")
+    with Pool(N_CORES) as pool:
+        for i, res in enumerate(pool.imap_unordered(fn, tasks)):
+            if res: print(f"\n{res}")
+            sys.stdout.write(f"\rProgress: {((i+1)/len(tasks))*100:.1f}%")
+            sys.stdout.flush()
+    print()
+
+def simulate(points, data_dir):
+    """Runs generate_dataset.run_case for every {shape, point} not yet on disk; returns existing paths."""
+    os.makedirs(data_dir, exist_ok=True)
+    todo = [case_task(p["shape"], p) for p in points if not os.path.exists(case_path(data_dir, p["shape"], p))]
+    run_pool(functools.partial(gen.run_case, output_dir=data_dir), todo, "Simulating")
+    return [case_path(data_dir, p["shape"], p) for p in points if os.path.exists(case_path(data_dir, p["shape"], p))]
+
+def shared_points(base):
+    """Seed design (Sobol) and uniform random test points; identical for every strategy."""
+    initial, test, next_id = [], [], 0
+    rng = np.random.default_rng(SEED + 1)
+    for shape in SHAPES:
+        for point in extend_design(shape, INITIAL_PER_SHAPE, "sobol", SEED, base=base):
+            initial.append({**point, "shape": shape, "id": next_id})
+            next_id += 1
+        space = parameter_space(shape, base)
+        for _ in range(TEST_PER_SHAPE):
+            test.append({**decode_point(rng.random(len(space)), space, base), "shape": shape, "id": next_id})
+            next_id += 1
+    return initial, test, next_id
+
+# ==========================================
+# 2. Surrogate
+# ==========================================
+
+def new_model(device):
+    dropout = DROPOUT if UNCERTAINTY == "mc_dropout" else 0.0
+    return PointNetFluid(scaling=SCALING, dropout=dropout).to(device)
+
+def fit(model, files, epochs, device, seed):
+    ds = FluidDataset(files, num_points=NUM_POINTS, seed=seed)
+    gen_ = torch.Generator()
+    gen_.manual_seed(seed)
+    loader = DataLoader(ds, batch_size=BATCH_SIZE, shuffle=True, generator=gen_, drop_last=len(files) > BATCH_SIZE)
+    optimizer = torch.optim.Adam(model.parameters(), lr=LEARNING_RATE)
+    criterion = nn.MSELoss(reduction='none')
+
+    model.train()
+    for epoch in range(epochs):
+        ds.set_epoch(epoch)
+        for inputs, targets, masks in loader:
+            inputs, targets, masks = inputs.to(device), targets.to(device), masks.to(device)
+            optimizer.zero_grad()
+            loss = masked_loss(criterion(model(inputs), targets), masks)
+            loss.backward()
+            total_norm = torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+            # Skip corrupt batches entirely (Adam would still apply momentum on zeroed grads)
+            if torch.isfinite(loss) and torch.isfinite(total_norm):
+                optimizer.step()
+
+def sample_predictions(models, inputs):
+    """(S, B, 4, N) predictions: one per ensemble member, or MC_SAMPLES dropout passes."""
+    for m in models:
+        m.eval()
+    with torch.no_grad():
+        if UNCERTAINTY == "mc_dropout":
+            model = models[0]
+            for m in model.modules():
+                if isinstance(m, nn.Dropout):
+                    m.train()   # BatchNorm stays in eval mode
+            preds = torch.stack([model(inputs) for _ in range(MC_SAMPLES)])
+            model.eval()
+            return preds
+        return torch.stack([m(inputs) for m in models])
+
+def evaluate(models, files, device):
+    """Masked MSE of the mean prediction on the test cases (fixed point subsets)."""
+    loader = DataLoader(FluidDataset(files, num_points=NUM_POINTS, seed=SEED), batch_size=BATCH_SIZE)
+    criterion = nn.MSELoss(reduction='none')
+    total, count = 0.0, 0
+    for inputs, targets, masks in loader:
+        inputs, targets, masks = inputs.to(device), targets.to(device), masks.to(device)
+        pred = sample_predictions(models, inputs).mean(dim=0)
+        loss = masked_loss(criterion(pred, targets), masks)
+        if torch.isfinite(loss):
+            total += loss.item() * inputs.size(0)
+            count += inputs.size(0)
+    return total / max(count, 1)
+
+def score_candidates(models, files, device):
+    """Mean predictive variance (summed over u, v, w, p) over each candidate's fluid points."""
+    loader = DataLoader(FluidDataset(files, num_points=NUM_POINTS, seed=SEED), batch_size=BATCH_SIZE)
+    scores = []
+    for inputs, _, masks in loader:
+        inputs, masks = inputs.to(device), masks.to(device).float()
+        var = sample_predictions(models, inputs).var(dim=0).sum(dim=1)   # (B, N)
+        scores.extend(((var * masks).sum(dim=1) / masks.sum(dim=1).clamp(min=1)).tolist())
+    return scores
+
+# ==========================================
+# 3. Loop
+# ==========================================
+
+def load_state(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_state(state, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, path)
+
+def write_report(history, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["round", "simulations", "test_mse"])
+        writer.writeheader()
+        for row in history:
+            writer.writerow({k: row[k] for k in writer.fieldnames})
+
+def propose(strategy, state, rnd, base, run_dir, models, device):
+    """The PICK_PER_ROUND points to simulate this round."""
+    if strategy == "random":
+        # Independent uniform draws, shapes in rotation: the old random sweep
+        rng = np.random.default_rng([SEED, rnd])
+        picks = []
+        for i in range(PICK_PER_ROUND):
+            shape = SHAPES[(rnd * PICK_PER_ROUND + i) % len(SHAPES)]
+            space = parameter_space(shape, base)
+            picks.append({**decode_point(rng.random(len(space)), space, base), "shape": shape})
+        return picks
+
+    existing = {}
+    for p in state["initial"] + state["test"] + state["picked"]:
+        existing.setdefault(p["shape"], []).append(p)
+    candidates = []
+    for shape in SHAPES:
+        for point in extend_design(shape, CANDIDATES_PER_SHAPE, "maximin", SEED + 1000 * (rnd + 1),
+                                   existing.get(shape, []), base):
+            candidates.append({**point, "shape": shape})
+
+    cand_dir = os.path.join(run_dir, "candidates", f"round_{rnd}")
+    os.makedirs(cand_dir, exist_ok=True)
+    for i, c in enumerate(candidates):
+        c["name"] = f"{c['shape']}_c{i}"
+    tasks = [(c["shape"], c["L"], c["D"], c["Ux"], c["ref"], c["params"], c["name"]) for c in candidates]
+    run_pool(functools.partial(gen.mesh_case, output_dir=cand_dir), tasks, "Meshing candidates")
+
+    meshed = [c for c in candidates if os.path.exists(os.path.join(cand_dir, f"{c['name']}.npy"))]
+    scores = score_candidates(models, [os.path.join(cand_dir, f"{c['name']}.npy") for c in meshed], device)
+    for c, s in zip(meshed, scores):
+        c["score"] = s
+    ranked = sorted(meshed, key=lambda c: -c["score"])
+    return ranked[:PICK_PER_ROUND]
+
+def run(strategy, retrain=False):
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    base = base_space(gen.LENGTHS, gen.DIAMETERS, gen.VELOCITIES, gen.REFINEMENTS)
+    run_dir = os.path.join(WORK_DIR, strategy)
+    data_dir = os.path.join(run_dir, "cases")
+    model_dir = os.path.join(run_dir, "models")
+    state_path = os.path.join(run_dir, "state.json")
+    os.makedirs(model_dir, exist_ok=True)
+    os.makedirs("temp_runs", exist_ok=True)
+
+    state = load_state(state_path)
+    if state is None:
+        initial, test, next_id = shared_points(base)
+        state = {"strategy": strategy, "uncertainty": UNCERTAINTY, "round": 0, "next_id": next_id,
+                 "initial": initial, "test": test, "picked": [], "history": []}
+
+    initial_files = simulate(state["initial"], os.path.join(WORK_DIR, "shared", "initial"))
+    test_files = simulate(state["test"], os.path.join(WORK_DIR, "shared", "test"))
+    if not initial_files or not test_files:
+        print("No initial/test cases could be simulated; check the OpenFOAM setup.")
+        sys.exit(1)
+
+    n_models = ENSEMBLE_SIZE if UNCERTAINTY == "ensemble" else 1
+    model_paths = [os.path.join(model_dir, f"member_{k}.pth") for k in range(n_models)]
+    models = [new_model(device) for _ in range(n_models)]
+
+    while state["round"] <= ROUNDS:
+        rnd = state["round"]
+        train_files = initial_files + simulate(state["picked"], data_dir)
+
+        for k, (model, path) in enumerate(zip(models, model_paths)):
+            warm = not retrain and os.path.exists(path)
+            if warm:
+                model.load_state_dict(torch.load(path, map_location=device))
+            else:
+                models[k] = model = new_model(device)
+            # Ensemble members differ by init, shuffling and point subsets
+            torch.manual_seed(SEED + 100 * k + rnd)
+            fit(model, train_files, EPOCHS_FINETUNE if warm else EPOCHS_INITIAL, device, SEED + 100 * k + rnd)
+            torch.save(model.state_dict(), path)
+
+        test_mse = evaluate(models, test_files, device)
+        state["history"].append({"round": rnd, "simulations": len(train_files), "test_mse": test_mse})
+        print(f"[{strategy}] round {rnd} | simulations {len(train_files)} | test MSE {test_mse:.5f}")
+
+        if rnd < ROUNDS:
+            for c in propose(strategy, state, rnd, base, run_dir, models, device):
+                c["id"] = state["next_id"]
+                c["round"] = rnd
+                state["next_id"] += 1
+                state["picked"].append(c)
+        state["round"] = rnd + 1
+        save_state(state, state_path)
+        write_report(state["history"], os.path.join(run_dir, "report.csv"))
+
+    # Record the picks as a design, like generate_dataset.py, so the cases can be regenerated
+    design = {"next_id": state["next_id"], "shapes": {}}
+    for p in state["initial"] + state["picked"]:
+        entry = design["shapes"].setdefault(p["shape"], {"method": f"active:{strategy}", "seed": SEED, "points": []})
+        entry["points"].append({k: p[k] for k in ("L", "D", "Ux", "ref", "params", "id")})
+    save_state(design, os.path.join(data_dir, "doe_design.json"))
+
+def report():
+    runs = {}
+    for strategy in ("uncertainty", "random"):
+        state = load_state(os.path.join(WORK_DIR, strategy, "state.json"))
+        if state:
+            runs[strategy] = state["history"]
+    if not runs:
+        print(f"No runs in {WORK_DIR}")
+        return
+
+    print(f"\n{'round':>6}" + "".join(f"{s + ' sims':>18}{s + ' MSE':>18}" for s in runs))
+    for r in range(max(len(h) for h in runs.values())):
+        line = f"{r:>6}"
+        for h in runs.values():
+            line += f"{h[r]['simulations']:>18}{h[r]['test_mse']:>18.5f}" if r < len(h) else " " * 36
+        print(line)
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    fig, ax = plt.subplots(figsize=(6, 4))
+    for strategy, h in runs.items():
+        ax.plot([row["simulations"] for row in h], [row["test_mse"] for row in h], marker="o", label=strategy)
+    ax.set_xlabel("Simulations")
+    ax.set_ylabel("Test MSE (normalized)")
+    ax.set_yscale("log")
+    ax.legend()
+    out_path = os.path.join(WORK_DIR, "error_vs_simulations.png")
+    fig.savefig(out_path, dpi=120, bbox_inches="tight")
+    print(f"\nPlot: {out_path}")
+
+def main():
+    global UNCERTAINTY
+    parser = argparse.ArgumentParser(description="Active-learning loop over the dataset generator.")
+    parser.add_argument("--strategy", default="uncertainty", choices=["uncertainty", "random"])
+    parser.add_argument("--uncertainty", default=UNCERTAINTY, choices=["ensemble", "mc_dropout"])
+    parser.add_argument("--retrain", action="store_true", help="Retrain from scratch every round")
+    parser.add_argument("--report", action="store_true", help="Compare finished runs and plot")
+    args = parser.parse_args()
+
+    if args.report:
+        report()
+        return
+    if not os.path.exists("shapes"):
+        print("Run setup_shapes.py first!")
+        sys.exit(1)
+    UNCERTAINTY = args.uncertainty
+    run(args.strategy, args.retrain)
+
+if __name__ == "__main__":
+    main()
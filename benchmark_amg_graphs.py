@@ -0,0 +1,143 @@
+"""
+benchmark_amg_graphs.py - FluidAMG Graph-Construction Benchmark
+
+PURPOSE:
+    Measures what hoisting graph construction out of the FluidAMG layer loop
+    saves. Times one forward+backward pass with graphs built once per forward
+    (current), with graphs supplied by the dataset cache (cache_graphs=True),
+    and with the old per-layer rebuild of radius/FPS/kNN graphs
+    (FluidAMG(rebuild_graphs_per_layer=True)).
+
+    With --checkpoint, layers use activation checkpointing. The measured peak
+    CUDA memory is printed next to estimate_amg_memory()'s prediction.
+
+    With --check-attention, instead compares the padding-free (varlen) and the
+    to_dense_batch PhysicsGraphBlock paths on a batch of very different graph
+    sizes: max abs difference, time and peak CUDA memory of each.
+
+USAGE:
+    python benchmark_amg_graphs.py                     # 50k nodes, batch of 1
+    python benchmark_amg_graphs.py --nodes 50000 --batch 2 --layers 4 --repeats 10
+    python benchmark_amg_graphs.py --nodes 200000 --checkpoint
+    python benchmark_amg_graphs.py --check-attention --sizes 2000 50000 8000
+
+OUTPUT:
+    Build time per graph set, fwd+bwd time per mode and the speedup over the
+    per-layer rebuild baseline; measured vs estimated peak memory.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch_geometric.data import Batch, Data
+
+from benchmark_dataloading import make_synthetic_case
+from train_amg import FluidAMG, PhysicsGraphBlock, build_amg_graphs, estimate_amg_memory, masked_mse
+
+def synchronize(device):
+    if device.type == "cuda":
+        torch.cuda.synchronize()
+
+def timed(fn, device, repeats):
+    fn()  # warm-up
+    synchronize(device)
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    synchronize(device)
+    return (time.perf_counter() - t0) / repeats
+
+def make_batch(n_nodes, n_graphs, seed=0):
+    rng = np.random.default_rng(seed)
+    graphs = []
+    for _ in range(n_graphs):
+        case = make_synthetic_case(n_nodes, rng).astype(np.float32)
+        pos = case[:, 0:3] - case[:, 0:3].mean(axis=0)
+        pos /= np.max(np.linalg.norm(pos, axis=1)) + 1e-6
+        graphs.append(Data(x=torch.from_numpy(np.concatenate([pos, case[:, 7:12]], axis=1)),
+                           pos=torch.from_numpy(pos), y=torch.from_numpy(case[:, 3:7]),
+                           mask=torch.from_numpy(case[:, 8].astype(bool))))
+    return Batch.from_data_list(graphs)
+
+def check_physics_attention(sizes, dim, device, repeats):
+    block = PhysicsGraphBlock(dim).to(device)
+    x = torch.randn(sum(sizes), dim, device=device, requires_grad=True)
+    batch = torch.cat([torch.full((n,), g, dtype=torch.long) for g, n in enumerate(sizes)]).to(device)
+
+    results = {}
+    for varlen in (False, True):
+        block.varlen = varlen
+        if device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats()
+        t = timed(lambda: block(x, batch).sum().backward(), device, repeats)
+        peak = torch.cuda.max_memory_allocated() / 1e6 if device.type == "cuda" else float("nan")
+        with torch.no_grad():
+            results[varlen] = (block(x, batch), t, peak)
+
+    diff = (results[True][0] - results[False][0]).abs().max().item()
+    print(f"Graph sizes: {sizes} (padded to {len(sizes)} x {max(sizes)})")
+    for varlen, name in ((False, "dense (to_dense_batch)"), (True, "varlen (flat)")):
+        _, t, peak = results[varlen]
+        print(f"{name:<24} fwd+bwd {1000 * t:9.2f} ms | peak {peak:9.1f} MB")
+    print(f"Max abs difference: {diff:.3e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FluidAMG graph construction.")
+    parser.add_argument("--nodes", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--model-dim", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--checkpoint", action="store_true", help="Per-layer activation checkpointing")
+    parser.add_argument("--check-attention", action="store_true")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[2000, 50000, 8000])
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if args.check_attention:
+        check_physics_attention(args.sizes, args.model_dim, device, args.repeats)
+        return
+
+    model = FluidAMG(in_channels=8+3, out_channels=4, model_dim=args.model_dim,
+                     num_layers=args.layers, checkpoint_activations=args.checkpoint).to(device)
+    batch = make_batch(args.nodes, args.batch).to(device)
+
+    def build_all():
+        build_amg_graphs(batch.pos, batch.batch, r_local=model.r_local, ratio_global=model.ratio_global)
+
+    def fwd_bwd(data):
+        model.zero_grad()
+        loss = masked_mse(model(data), data.y, data.mask)
+        loss.backward()
+
+    t_build = timed(build_all, device, args.repeats)
+    t_hoisted = timed(lambda: fwd_bwd(batch), device, args.repeats)
+    model.rebuild_graphs_per_layer = True
+    t_per_layer = timed(lambda: fwd_bwd(batch), device, args.repeats)
+    model.rebuild_graphs_per_layer = False
+
+    cached = batch.clone()
+    for key, value in build_amg_graphs(cached.pos, cached.batch, r_local=model.r_local,
+                                       ratio_global=model.ratio_global).items():
+        cached[key] = value
+    if device.type == "cuda":
+        torch.cuda.reset_peak_memory_stats()
+    t_cached = timed(lambda: fwd_bwd(cached), device, args.repeats)
+    peak = torch.cuda.max_memory_allocated() / 1e9 if device.type == "cuda" else float("nan")
+    est = estimate_amg_memory(batch.num_nodes, num_edges=cached.edge_index_local.size(1),
+                              model_dim=args.model_dim, num_layers=args.layers,
+                              ratio_global=model.ratio_global, checkpoint_activations=args.checkpoint,
+                              num_params=sum(p.numel() for p in model.parameters()))
+
+    print(f"Device: {device} | nodes/graph: {args.nodes} | graphs: {args.batch} | layers: {args.layers}")
+    print(f"Graph build (all graphs):      {1000 * t_build:9.2f} ms")
+    print(f"fwd+bwd, per-layer rebuild:    {1000 * t_per_layer:9.2f} ms")
+    print(f"fwd+bwd, built once/forward:   {1000 * t_hoisted:9.2f} ms  ({t_per_layer / t_hoisted:.2f}x)")
+    print(f"fwd+bwd, cached across epochs: {1000 * t_cached:9.2f} ms  ({t_per_layer / t_cached:.2f}x)")
+    print(f"Peak memory (cached): measured {peak:.2f} GB | estimated {est['total'] / 1e9:.2f} GB "
+          f"(checkpointing {'on' if args.checkpoint else 'off'})")
+
+if __name__ == "__main__":
+    main()
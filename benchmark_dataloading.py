@@ -0,0 +1,276 @@
+"""
+benchmark_dataloading.py - Data-Loading Throughput Benchmark
+
+PURPOSE:
+    Measures how fast FluidDataset (train_pointnetv1.py) and FluidPyGDataset
+    (train_amg.py) can feed a trainer, without any model in the loop. Sweeps
+    num_workers, batch_size, num_points, pin_memory and storage format and
+    reports samples/sec, MB/sec read and per-sample latency percentiles.
+
+USAGE:
+    python benchmark_dataloading.py                                  # synthetic data
+    python benchmark_dataloading.py --cases 256 --points 200000 --workers 0 4 8
+    python benchmark_dataloading.py --data-dir data_output --formats dict_npy
+
+SYNTHETIC DATA:
+    Without --data-dir, writes --cases straight-channel cases of --points rows in
+    the real 12-column layout (Poiseuille velocity, linear pressure drop, exact
+    y_wall, one-hot fluid/wall/inlet/outlet flags) to bench_data/<format>/.
+    No OpenFOAM needed. bench_data/<format>/synthetic.json records the points and
+    seed; cases written with other settings are regenerated, not reused.
+
+STORAGE FORMATS:
+    dict_npy : 0-D object array wrapping {"data", "shape_name", "params"} (generate_dataset.py)
+    raw_npy  : plain (N, 12) float array (extracted_data/)
+    npz      : zipped archive with a 'data' member (legacy)
+    cfdz     : quantized, chunk-compressed case (case_codec.py)
+
+OUTPUT:
+    One table row per setting:
+    dataset, format, workers, batch, points, pin, samples/s, MB/s, p50/p90/p99 ms per sample
+
+NOTES:
+    - Latency is measured inside the workers (load + preprocess of one sample).
+    - MB/s counts on-disk bytes of every file opened; repeated runs hit the page
+      cache, so drop caches between runs for cold-read numbers.
+"""
+
+import argparse
+import functools
+import glob
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset, default_collate
+
+BENCH_DIR = "bench_data"
+
+# ==========================================
+# 1. Synthetic Dataset
+# ==========================================
+
+def make_synthetic_case(n_points, rng, L=5.0, D=0.25, Ux=0.5):
+    """Straight 2D channel in the generate_dataset.py column layout."""
+    r = D / 2.0
+    n_bnd = max(4, int(0.05 * n_points))
+    n_fluid = n_points - n_bnd
+
+    # Fluid cell centres
+    x = rng.uniform(0, L, n_fluid)
+    y = rng.uniform(-r, r, n_fluid)
+    fluid_pos = np.column_stack([x, y, np.zeros(n_fluid)])
+
+    # Boundary faces: half walls, quarter inlet, quarter outlet
+    n_wall = n_bnd // 2
+    n_in = n_bnd // 4
+    n_out = n_bnd - n_wall - n_in
+    wall_pos = np.column_stack([rng.uniform(0, L, n_wall), rng.choice([-r, r], n_wall), np.zeros(n_wall)])
+    in_pos = np.column_stack([np.zeros(n_in), rng.uniform(-r, r, n_in), np.zeros(n_in)])
+    out_pos = np.column_stack([np.full(n_out, L), rng.uniform(-r, r, n_out), np.zeros(n_out)])
+
+    pos = np.vstack([fluid_pos, wall_pos, in_pos, out_pos])
+    u = 1.5 * Ux * (1.0 - (pos[:, 1] / r) ** 2)
+    U = np.column_stack([u, np.zeros(n_points), np.zeros(n_points)])
+    p = 12.0 * 1e-6 * Ux / D ** 2 * (L - pos[:, 0])   # laminar dp/dx, p=0 at outlet
+    y_wall = r - np.abs(pos[:, 1])
+    y_wall[n_fluid:] = 0.0
+
+    flags = np.zeros((n_points, 4))
+    flags[:n_fluid, 0] = 1
+    flags[n_fluid:n_fluid + n_wall, 1] = 1
+    flags[n_fluid + n_wall:n_fluid + n_wall + n_in, 2] = 1
+    flags[n_fluid + n_wall + n_in:, 3] = 1
+
+    return np.column_stack([pos, U, p, y_wall, flags])
+
+def _write_dict_npy(path, data, params):
+    np.save(path + ".npy", {"data": data, "shape_name": "straight", "params": params})
+
+def _write_raw_npy(path, data, params):
+    np.save(path + ".npy", data)
+
+def _write_npz(path, data, params):
+    np.savez(path + ".npz", data=data)
+
+def _write_cfdz(path, data, params):
+    from case_codec import CASE_EXT, write_case
+    write_case(path + CASE_EXT, data, shape_name="straight", params=params)
+
+FORMAT_WRITERS = {
+    "dict_npy": _write_dict_npy,
+    "raw_npy": _write_raw_npy,
+    "npz": _write_npz,
+    "cfdz": _write_cfdz,
+}
+
+FORMAT_PATTERNS = {
+    "dict_npy": "*.npy",
+    "raw_npy": "*.npy",
+    "npz": "*.npz",
+    "cfdz": "*.cfdz",
+}
+
+def npy_format(path):
+    """"dict_npy" (pickled object array) or "raw_npy"; memory-mapping reads only the header."""
+    try:
+        np.load(path, mmap_mode='r')
+    except ValueError:
+        return "dict_npy"   # Object arrays cannot be memory-mapped
+    return "raw_npy"
+
+def existing_files(data_dir, fmt):
+    """Files of one format in data_dir; *.npy files are split by payload type."""
+    files = sorted(glob.glob(os.path.join(data_dir, FORMAT_PATTERNS[fmt])))
+    if fmt in ("dict_npy", "raw_npy"):
+        files = [f for f in files if npy_format(f) == fmt]
+    return files
+
+def generate_synthetic_dataset(out_dir, n_cases, n_points, fmt, seed=0):
+    """Writes n_cases synthetic (n_points, 12) cases; reuses them if written with the same settings."""
+    os.makedirs(out_dir, exist_ok=True)
+    stamp_path = os.path.join(out_dir, "synthetic.json")
+    stamp = {"format": fmt, "points": n_points, "seed": seed}
+    existing = sorted(glob.glob(os.path.join(out_dir, FORMAT_PATTERNS[fmt])))
+    if os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if json.load(f) == stamp and len(existing) >= n_cases:
+                return existing[:n_cases]
+
+    # Missing, short or written with other settings: start over
+    for path in existing:
+        os.remove(path)
+    if os.path.exists(stamp_path):
+        os.remove(stamp_path)
+    rng = np.random.default_rng(seed)
+    writer = FORMAT_WRITERS[fmt]
+    for i in range(n_cases):
+        params = {"nu_val": round(rng.uniform(0.8e-6, 1.3e-6), 9), "turb_intensity": 0.05}
+        writer(os.path.join(out_dir, f"straight_{i}"), make_synthetic_case(n_points, rng), params)
+    with open(stamp_path, "w") as f:
+        json.dump(stamp, f)
+    return sorted(glob.glob(os.path.join(out_dir, FORMAT_PATTERNS[fmt])))
+
+# ==========================================
+# 2. Timing Wrappers
+# ==========================================
+
+class TimedDataset(Dataset):
+    """Returns (item, seconds to produce it, bytes on disk) for every sample."""
+    def __init__(self, inner, file_list):
+        self.inner = inner
+        self.file_list = file_list
+
+    def __len__(self):
+        return len(self.file_list)
+
+    def __getitem__(self, idx):
+        t0 = time.perf_counter()
+        item = self.inner[idx]
+        return item, time.perf_counter() - t0, os.path.getsize(self.file_list[idx])
+
+def timed_collate(batch, inner_collate):
+    items, times, sizes = zip(*batch)
+    return inner_collate(list(items)), list(times), list(sizes)
+
+def _pyg_collate(items):
+    from torch_geometric.data import Batch
+    return Batch.from_data_list(items)
+
+def build_dataset(kind, files, num_points):
+    if kind == "pointnet":
+        from train_pointnetv1 import FluidDataset
+        return FluidDataset(files, num_points=num_points), default_collate
+    if kind == "amg":
+        from train_amg import FluidPyGDataset
+        return FluidPyGDataset(files), _pyg_collate
+    raise ValueError(f"Unknown dataset '{kind}'")
+
+# FluidPyGDataset uses np.load without allow_pickle and expects a plain array
+DATASET_FORMATS = {
+    "pointnet": {"dict_npy", "raw_npy", "npz", "cfdz"},
+    "amg": {"raw_npy"},
+}
+
+# ==========================================
+# 3. Benchmark
+# ==========================================
+
+def run_setting(kind, files, num_workers, batch_size, num_points, pin_memory, max_batches=None):
+    inner, inner_collate = build_dataset(kind, files, num_points)
+    ds = TimedDataset(inner, files)
+    loader = DataLoader(ds, batch_size=batch_size, shuffle=True, num_workers=num_workers,
+                        pin_memory=pin_memory and torch.cuda.is_available(),
+                        collate_fn=functools.partial(timed_collate, inner_collate=inner_collate))
+
+    latencies = []
+    n_bytes = 0
+    t0 = time.perf_counter()
+    for b, (_, times, sizes) in enumerate(loader):
+        latencies.extend(times)
+        n_bytes += sum(sizes)
+        if max_batches and b + 1 >= max_batches:
+            break
+    elapsed = time.perf_counter() - t0
+
+    lat_ms = 1000.0 * np.asarray(latencies)
+    return {
+        "samples_per_s": len(latencies) / elapsed,
+        "mb_per_s": n_bytes / 1e6 / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p90_ms": float(np.percentile(lat_ms, 90)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark FluidDataset / FluidPyGDataset loading throughput.")
+    parser.add_argument("--data-dir", default=None, help="Use existing cases instead of synthetic data")
+    parser.add_argument("--cases", type=int, default=64, help="Synthetic cases to generate")
+    parser.add_argument("--points", type=int, default=50000, help="Rows per synthetic case")
+    parser.add_argument("--datasets", nargs="+", default=["pointnet", "amg"], choices=["pointnet", "amg"])
+    parser.add_argument("--formats", nargs="+", default=list(FORMAT_WRITERS), choices=list(FORMAT_WRITERS))
+    parser.add_argument("--workers", nargs="+", type=int, default=[0, 2, 4])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[8, 32])
+    parser.add_argument("--num-points", nargs="+", type=int, default=[4096], help="PointNet subsample sizes")
+    parser.add_argument("--pin-memory", nargs="+", type=int, default=[0, 1], choices=[0, 1])
+    parser.add_argument("--max-batches", type=int, default=None)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    file_sets = {}
+    for fmt in args.formats:
+        if args.data_dir:
+            files = existing_files(args.data_dir, fmt)
+        else:
+            files = generate_synthetic_dataset(os.path.join(BENCH_DIR, fmt), args.cases, args.points, fmt)
+        if files:
+            file_sets[fmt] = files
+
+    header = f"{'dataset':<9}{'format':<10}{'workers':>8}{'batch':>7}{'points':>8}{'pin':>5}" \
+             f"{'samples/s':>11}{'MB/s':>9}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for kind in args.datasets:
+        point_sweep = args.num_points if kind == "pointnet" else [None]
+        for fmt, files in file_sets.items():
+            if fmt not in DATASET_FORMATS[kind]:
+                continue
+            for workers, batch, npts, pin in itertools.product(args.workers, args.batch_sizes,
+                                                                point_sweep, args.pin_memory):
+                try:
+                    r = run_setting(kind, files, workers, batch, npts, bool(pin), args.max_batches)
+                except ImportError as e:
+                    print(f"{kind:<9}{fmt:<10} skipped: {e}")
+                    break
+                print(f"{kind:<9}{fmt:<10}{workers:>8}{batch:>7}{str(npts or '-'):>8}{pin:>5}"
+                      f"{r['samples_per_s']:>11.1f}{r['mb_per_s']:>9.1f}"
+                      f"{r['p50_ms']:>9.2f}{r['p90_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
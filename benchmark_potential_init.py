@@ -0,0 +1,179 @@
+"""
+benchmark_potential_init.py - Gain of the potentialFoam Pre-Stage per Shape
+
+PURPOSE:
+    run_case can run potentialFoam before simpleFoam (generate_dataset.POTENTIAL_INIT),
+    so SIMPLE starts from potential flow instead of uniform fields. This solves the
+    same representative cases of each shape with and without the pre-stage and
+    reports the change in simpleFoam iterations and in total wall time
+    (potentialFoam + simpleFoam), to decide which shapes should use it.
+
+USAGE:
+    python benchmark_potential_init.py                       # all shapes, 2 cases each
+    python benchmark_potential_init.py --shapes valve manifold --cases-per-shape 4 --cores 8
+    python benchmark_potential_init.py --from-data data_output   # from already generated cases
+
+OUTPUT:
+    Per-shape table and solver_tuning/potential_init.csv:
+    shape, cases, iterations off/on, simpleFoam s off/on, total s off/on, change in %
+    (negative = faster with the pre-stage), current POTENTIAL_INIT setting.
+
+NOTES:
+    - Cases are tune_solver.py's representative design points, solved with the shape's
+      tuned fvSolution profile if there is one. Each case is meshed once and solved
+      twice in the same worker, so both runs see the same load.
+    - --from-data compares whatever cases exist with and without the pre-stage (the
+      "solver" entry run_case saves); the two groups are different design points, so
+      use it as a rough check only.
+"""
+
+import argparse
+import csv
+import glob
+import os
+import shutil
+import subprocess
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+from generate_dataset import POTENTIAL_INIT, SHAPE_HANDLERS, solver_profile_for
+from solver_backends import DEFAULT_SOLVER_PROFILE, get_backend
+from tune_solver import CASES_PER_SHAPE, N_CORES, TUNE_DIR, TUNE_REFINEMENT, clear_results, \
+    prepare_case, representative_cases
+
+RUN_ROOT = os.path.join(TUNE_DIR, "potential_runs")
+REPORT_FILE = os.path.join(TUNE_DIR, "potential_init.csv")
+
+# ==========================================
+# 1. Paired Runs
+# ==========================================
+
+def compare_case(job):
+    """Worker: (task, result without pre-stage, result with it) or (task, None, error)."""
+    task, backend = job
+    shape, L, D, Ux, ref, params, case_id = task
+    case = {"shape": shape, "L": L, "D": D, "Ux": Ux, "ref": ref, "params": params}
+    run_dir = None
+    try:
+        profile = solver_profile_for(shape) or DEFAULT_SOLVER_PROFILE
+        run_dir = prepare_case(task, backend, run_root=RUN_ROOT, solver_profile=profile)
+        clear_results(run_dir)
+        off = {**backend.solve(run_dir, case), "init_wall_s": 0.0}
+        clear_results(run_dir)
+        init = backend.initialize(run_dir, case)
+        on = {**backend.solve(run_dir, case), **init}
+        return task, off, on
+    except subprocess.CalledProcessError as e:
+        return task, None, f"Err: {shape}_{case_id} - CMD {e.cmd[0]} failed"
+    except Exception as e:
+        return task, None, f"Err: {shape}_{case_id} - {e}"
+    finally:
+        if run_dir and os.path.exists(run_dir): shutil.rmtree(run_dir)
+
+def run_paired(shapes, n_cases, ref, backend, cores):
+    """{shape: {"off": [result], "on": [result]}}"""
+    jobs = [(task, backend) for shape in shapes for task in representative_cases(shape, n_cases, ref)]
+    runs = {shape: {"off": [], "on": []} for shape in shapes}
+    os.makedirs(RUN_ROOT, exist_ok=True)
+    print(f"Solving {len(jobs)} cases with and without potentialFoam on {cores} cores...")
+    with Pool(cores) as pool:
+        for i, (task, off, on) in enumerate(pool.imap_unordered(compare_case, jobs)):
+            if off is None:
+                print(f"\n{on}")
+            else:
+                runs[task[0]]["off"].append(off)
+                runs[task[0]]["on"].append(on)
+            sys.stdout.write(f"\rProgress: {((i+1)/len(jobs))*100:.1f}%")
+            sys.stdout.flush()
+    print()
+    return runs
+
+def runs_from_data(data_dir):
+    """Same layout from the "solver" entries of generated cases."""
+    runs = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, "*.npy"))):
+        try:
+            content = np.load(path, allow_pickle=True).item()
+        except Exception:
+            continue   # Plain arrays carry no solver info
+        solver = content.get("solver")
+        if not solver or solver.get("backend") != "openfoam":
+            continue
+        group = "on" if solver.get("potential_init") else "off"
+        runs.setdefault(content["shape_name"], {"off": [], "on": []})[group].append(solver)
+    return runs
+
+# ==========================================
+# 2. Report
+# ==========================================
+
+def summarize(results):
+    it = [r["iterations"] for r in results if r.get("iterations") is not None]
+    return {"iterations": float(np.mean(it)) if it else float("nan"),
+            "simple_s": float(np.mean([r["wall_s"] for r in results])),
+            "total_s": float(np.mean([r["wall_s"] + r.get("init_wall_s", 0.0) for r in results]))}
+
+def change(off, on):
+    return 100.0 * (on - off) / off if off > 0 else float("nan")
+
+def report(runs, path):
+    rows = []
+    for shape, groups in runs.items():
+        if not groups["off"] or not groups["on"]:
+            print(f"{shape}: needs cases with and without the pre-stage, skipped")
+            continue
+        off, on = summarize(groups["off"]), summarize(groups["on"])
+        rows.append({"shape": shape, "cases_off": len(groups["off"]), "cases_on": len(groups["on"]),
+                     "iterations_off": off["iterations"], "iterations_on": on["iterations"],
+                     "iterations_change_pct": change(off["iterations"], on["iterations"]),
+                     "simple_s_off": off["simple_s"], "simple_s_on": on["simple_s"],
+                     "total_s_off": off["total_s"], "total_s_on": on["total_s"],
+                     "total_change_pct": change(off["total_s"], on["total_s"]),
+                     "potential_init": POTENTIAL_INIT.get(shape, False)})
+    if not rows:
+        return
+
+    print(f"\n{'shape':<10} {'it off':>7} {'it on':>7} {'d it':>7} {'total s off':>12} {'total s on':>11} "
+          f"{'d total':>8}  POTENTIAL_INIT")
+    for r in rows:
+        print(f"{r['shape']:<10} {r['iterations_off']:>7.0f} {r['iterations_on']:>7.0f} "
+              f"{r['iterations_change_pct']:>6.1f}% {r['total_s_off']:>12.1f} {r['total_s_on']:>11.1f} "
+              f"{r['total_change_pct']:>7.1f}%  {r['potential_init']}")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\nReport -> {path}. Enable the pre-stage in POTENTIAL_INIT where total time drops.")
+
+# ==========================================
+# 3. Main
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the potentialFoam pre-stage gain per shape.")
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPE_HANDLERS), choices=list(SHAPE_HANDLERS))
+    parser.add_argument("--cases-per-shape", type=int, default=CASES_PER_SHAPE)
+    parser.add_argument("--ref", type=int, default=TUNE_REFINEMENT, help="Refinement level of the cases")
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    parser.add_argument("--backend", default="openfoam", choices=["openfoam", "mock"])
+    parser.add_argument("--from-data", default=None, metavar="DATA_DIR",
+                        help="Report from generated cases instead of running new ones")
+    parser.add_argument("--output", default=REPORT_FILE)
+    args = parser.parse_args()
+
+    if args.from_data:
+        runs = runs_from_data(args.from_data)
+    else:
+        if not os.path.exists("shapes") or not os.path.exists("base_template"):
+            print("Run setup_shapes.py and reset_template.py first!")
+            sys.exit(1)
+        runs = run_paired(args.shapes, args.cases_per_shape, args.ref, get_backend(args.backend), args.cores)
+        shutil.rmtree(RUN_ROOT, ignore_errors=True)
+    report(runs, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+benchmark_run_case.py - Per-Case Orchestration Overhead Benchmark
+
+PURPOSE:
+    Runs generate_dataset.run_case on the mock solver backend (solver_backends.py),
+    so everything around the solver - template copy, case files, pyvista extraction,
+    y_wall KD-tree, saving, catalog update and run-directory cleanup - is timed on
+    any Linux box without OpenFOAM. Use it to profile that overhead and to catch
+    regressions in it.
+
+USAGE:
+    python setup_shapes.py && python reset_template.py      # shapes/ + base_template/
+    python benchmark_run_case.py                             # 20 cases, 20k cells, serial
+    python benchmark_run_case.py --cases 64 --cells 100000 --cores 8
+    python benchmark_run_case.py --max-overhead-ms 800       # exit 1 if mean overhead is higher
+
+OUTPUT:
+    Mean / p90 ms per phase and the overhead per case (all phases except mesh/initialize/solve).
+    Cases are written to a temporary directory that is removed afterwards.
+
+NOTES:
+    - "mesh", "initialize" and "solve" time the mock backend; they stand in for
+      blockMesh / potentialFoam / simpleFoam and are reported but are not part of the overhead.
+    - "catalog+cleanup" is the case wall time minus the phases run_case records
+      itself (the catalog insert and rmtree happen after the payload is saved).
+"""
+
+import argparse
+import functools
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from generate_dataset import build_tasks, run_case
+from solver_backends import get_backend
+
+PHASES = ["copy_template", "case_files", "mesh", "initialize", "solve", "extract", "save", "catalog+cleanup"]
+SOLVER_PHASES = {"mesh", "initialize", "solve"}
+
+# ==========================================
+# 1. Timed Runs
+# ==========================================
+
+def timed_run_case(task, output_dir, backend):
+    t0 = time.perf_counter()
+    msg = run_case(task, output_dir=output_dir, backend=backend)
+    return msg, time.perf_counter() - t0
+
+def collect_timings(output_dir, totals):
+    """{phase: [seconds per case]} from the saved payloads and the measured wall times."""
+    rows = {phase: [] for phase in PHASES + ["total", "overhead"]}
+    for path in sorted(glob.glob(os.path.join(output_dir, "*.npy"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name not in totals:
+            continue
+        timings = np.load(path, allow_pickle=True).item()["timings"]
+        for phase, dt in timings.items():
+            rows[phase].append(dt)
+        rows["catalog+cleanup"].append(totals[name] - sum(timings.values()))
+        rows["total"].append(totals[name])
+        rows["overhead"].append(totals[name] - sum(dt for p, dt in timings.items() if p in SOLVER_PHASES))
+    return rows
+
+# ==========================================
+# 2. Main
+# ==========================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark run_case overhead with the mock solver.")
+    parser.add_argument("--cases", type=int, default=20)
+    parser.add_argument("--cells", type=int, default=20000, help="Mock mesh size")
+    parser.add_argument("--delay", type=float, default=0.0, help="Mock solver seconds per case")
+    parser.add_argument("--cores", type=int, default=1, help="1 = serial, in-process")
+    parser.add_argument("--max-overhead-ms", type=float, default=None,
+                        help="Exit 1 if the mean overhead per case exceeds this")
+    parser.add_argument("--keep", action="store_true", help="Keep the output directory")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    backend = get_backend("mock", cells=args.cells, delay_s=args.delay)
+    output_dir = tempfile.mkdtemp(prefix="bench_run_case_")
+    os.makedirs("temp_runs", exist_ok=True)
+
+    try:
+        tasks = build_tasks(output_dir)[:args.cases]
+        names = [f"{t[0]}_{t[-1]}" for t in tasks]
+        print(f"Running {len(tasks)} mock cases ({args.cells} cells, {args.delay:.2f}s delay) "
+              f"on {args.cores} core(s)...")
+
+        job = functools.partial(timed_run_case, output_dir=output_dir, backend=backend)
+        t0 = time.perf_counter()
+        if args.cores > 1:
+            with Pool(args.cores) as pool:
+                results = pool.map(job, tasks)
+        else:
+            results = [job(t) for t in tasks]
+        elapsed = time.perf_counter() - t0
+
+        for msg, _ in results:
+            if msg: print(msg)
+        totals = {name: dt for name, (msg, dt) in zip(names, results) if not (msg and msg.startswith("Err"))}
+        rows = collect_timings(output_dir, totals)
+        n_ok = len(rows["total"])
+        if n_ok == 0:
+            print("No case finished.")
+            sys.exit(1)
+
+        print(f"\n{'phase':<16} {'mean ms':>10} {'p90 ms':>10}")
+        for phase in PHASES + ["total"]:
+            if not rows[phase]:
+                continue   # e.g. "initialize" when no shape uses the potentialFoam pre-stage
+            vals = np.asarray(rows[phase]) * 1e3
+            tag = " (solver)" if phase in SOLVER_PHASES else ""
+            print(f"{phase:<16} {vals.mean():>10.1f} {np.percentile(vals, 90):>10.1f}{tag}")
+
+        overhead = np.asarray(rows["overhead"]) * 1e3
+        print(f"\nOverhead per case (excluding mesh/initialize/solve): mean {overhead.mean():.1f} ms, "
+              f"p90 {np.percentile(overhead, 90):.1f} ms")
+        print(f"{n_ok}/{len(tasks)} cases in {elapsed:.1f}s -> {n_ok / elapsed:.2f} cases/s")
+
+        if args.max_overhead_ms is not None and overhead.mean() > args.max_overhead_ms:
+            print(f"FAIL: mean overhead {overhead.mean():.1f} ms > {args.max_overhead_ms:.1f} ms")
+            sys.exit(1)
+    finally:
+        if not args.keep:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        else:
+            print(f"Cases kept in {output_dir}")
+
+if __name__ == "__main__":
+    main()
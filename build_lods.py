@@ -0,0 +1,236 @@
+"""
+build_lods.py - Nested Farthest-Point LOD Subsets per Case
+
+PURPOSE:
+    Reorders every case so its first rows are a farthest-point sampling (FPS) of
+    the case: rows [0, 1024), [0, 4096), [0, 16384), [0, 65536) are nested,
+    spatially well-covered subsets (levels of detail). Trainers and inference
+    then read a contiguous prefix instead of gathering random rows from the
+    whole array:
+    - plain .npy cases are memory-mapped, so only the prefix is read;
+    - .cfdz cases (case_codec.py) decompress only the chunks of the prefix;
+    - validation on a fixed prefix is deterministic.
+
+USAGE:
+    python build_lods.py                               # data_output/
+    python build_lods.py --data-dir ./extracted_data
+
+    index = load_lod_index("./data_output")
+    data = read_lod(file_path, 4096, index)            # (4096, 12) or None without an LOD
+
+    train_pointnetv1.py: "lod_mode": "val" (default) validates on the num_points
+    prefix; "all" also draws training points from the 4 * num_points prefix.
+
+OUTPUT:
+    Case files rewritten in place (tmp file + rename) with permuted rows; nothing
+    else in a case changes. <data_dir>/lod_index.json:
+        levels : LOD_LEVELS
+        cases  : {case_name: {"n_rows", "levels" (clipped to n_rows), "size", "mtime"}}
+
+NOTES:
+    - FPS is exact and starts at row 0, so the ordering is deterministic. Cases whose
+      size + mtime match their index entry are skipped on reruns; readers ignore entries
+      that do not match (a rewritten case's first rows are not an FPS subset).
+    - Row order carries no meaning elsewhere: precompute_graphs.py rebuilds stores
+      of rewritten cases (source mtime), and 'case_catalog.py scan' refreshes hashes.
+    - case_codec.py compress keeps row order and writes lod_index.json for the .cfdz files.
+"""
+
+import argparse
+import glob
+import heapq
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# --- Configuration ---
+DATA_DIR = "./data_output"
+FILE_PATTERN = "*.npy"
+INDEX_FILENAME = "lod_index.json"
+LOD_LEVELS = [1024, 4096, 16384, 65536]
+N_CORES = min(8, os.cpu_count() or 1)
+
+# ==========================================
+# 1. Farthest-Point Ordering
+# ==========================================
+
+def farthest_point_order(pos, k, start=0):
+    """
+    First k indices of an exact FPS of `pos`. Only points within the current
+    selection radius can get closer to the newest pick, so each step updates a
+    KD-tree ball instead of all N points; a lazy max-heap yields the next pick.
+    """
+    n = len(pos)
+    k = min(k, n)
+    tree = cKDTree(pos)
+    dmin = np.linalg.norm(pos - pos[start], axis=1)
+    dmin[start] = -1.0   # Selected
+    heap = list(zip((-dmin).tolist(), range(n)))
+    heapq.heapify(heap)
+
+    order = np.empty(k, dtype=np.int64)
+    order[0] = start
+    for j in range(1, k):
+        # Next pick: largest distance to the selection (skip stale heap entries)
+        while True:
+            neg_d, i = heapq.heappop(heap)
+            if -neg_d == dmin[i]:
+                break
+        order[j] = i
+        radius = dmin[i]
+        dmin[i] = -1.0
+
+        nbrs = np.asarray(tree.query_ball_point(pos[i], r=radius), dtype=np.int64)
+        if len(nbrs):
+            d = np.linalg.norm(pos[nbrs] - pos[i], axis=1)
+            closer = d < dmin[nbrs]
+            dmin[nbrs[closer]] = d[closer]
+            for idx, di in zip(nbrs[closer].tolist(), d[closer].tolist()):
+                heapq.heappush(heap, (-di, idx))
+    return order
+
+def lod_levels(n_rows, levels=LOD_LEVELS):
+    """Levels clipped to the case size; the last one is n_rows if the case is smaller."""
+    out = [lvl for lvl in levels if lvl < n_rows]
+    return out + [n_rows] if len(out) < len(levels) else out
+
+# ==========================================
+# 2. Index (trainer side)
+# ==========================================
+
+def case_name(file_path):
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+def load_lod_index(data_dir):
+    """{case_name: entry} from <data_dir>/lod_index.json, or {} if LODs were not built."""
+    path = os.path.join(data_dir, INDEX_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["cases"]
+
+def lod_entry(index, file_path):
+    """Index entry of a case, or None if it has none or the file changed since build_lods.py ran."""
+    entry = index.get(case_name(file_path))
+    try:
+        return entry if entry and is_unchanged(entry, file_path) else None
+    except OSError:
+        return None
+
+def lod_prefix_rows(index, file_path, n_points):
+    """Rows of the smallest LOD holding n_points, or None if the case has no (current) such LOD."""
+    entry = lod_entry(index, file_path)
+    if entry is None:
+        return None
+    for lvl in entry["levels"]:
+        if lvl >= n_points:
+            return lvl
+    return None
+
+def read_lod(file_path, n_points, index):
+    """First n_points rows (an FPS subset) of a case, read as a prefix; None without an LOD."""
+    if lod_prefix_rows(index, file_path, n_points) is None:
+        return None
+    if file_path.endswith(".cfdz"):
+        from case_codec import CompressedCase
+        return CompressedCase(file_path).head(n_points)
+    try:
+        return np.asarray(np.load(file_path, mmap_mode='r')[:n_points])
+    except ValueError:
+        pass  # Object array (pickled dict): cannot be memory-mapped
+    return np.load(file_path, allow_pickle=True).item()['data'][:n_points]
+
+# ==========================================
+# 3. Builder
+# ==========================================
+
+def is_unchanged(entry, file_path):
+    st = os.stat(file_path)
+    return bool(entry) and entry.get("size") == st.st_size and entry.get("mtime") == st.st_mtime \
+        and entry.get("max_level") == max(LOD_LEVELS)
+
+def reorder_case(job):
+    """Worker: returns (case_name, index entry or None, message or None)."""
+    file_path, entry = job
+    name = case_name(file_path)
+    try:
+        if is_unchanged(entry, file_path):
+            return name, entry, None
+
+        content = None
+        try:
+            data = np.load(file_path, mmap_mode='r')
+        except ValueError:
+            content = np.load(file_path, allow_pickle=True).item()
+            data = content['data']
+        if data.ndim != 2 or data.shape[1] != 12:
+            return name, None, f"Skipping {name}: shape {data.shape}"
+
+        n = data.shape[0]
+        pos = np.asarray(data[:, 0:3], dtype=np.float64)
+        if not np.isfinite(pos).all():
+            return name, None, f"Skipping {name}: non-finite coordinates"
+        order = farthest_point_order(pos, max(LOD_LEVELS))
+
+        if not np.array_equal(order, np.arange(len(order))):
+            rest = np.ones(n, dtype=bool)
+            rest[order] = False
+            perm = np.concatenate([order, np.flatnonzero(rest)])
+            tmp_path = file_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                if content is None:
+                    np.save(f, np.asarray(data)[perm])
+                else:
+                    content['data'] = np.asarray(data)[perm]
+                    np.save(f, content)
+            del data
+            os.replace(tmp_path, file_path)
+
+        st = os.stat(file_path)
+        return name, {"n_rows": n, "levels": lod_levels(n), "max_level": max(LOD_LEVELS),
+                      "size": st.st_size, "mtime": st.st_mtime}, None
+    except Exception as e:
+        return name, None, f"Err: {name} - {e}"
+
+def save_index(index, data_dir):
+    path = os.path.join(data_dir, INDEX_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"levels": LOD_LEVELS, "cases": index}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reorder cases into nested FPS levels of detail.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--pattern", default=FILE_PATTERN)
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.data_dir, args.pattern)))
+    if not files:
+        print(f"No files found in {os.path.join(args.data_dir, args.pattern)}")
+        sys.exit(1)
+
+    old = load_lod_index(args.data_dir)
+    index = {case_name(f): old[case_name(f)] for f in files if case_name(f) in old}
+    jobs = [(f, old.get(case_name(f))) for f in files]
+    print(f"Building LODs {LOD_LEVELS} for {len(files)} cases on {args.cores} cores...")
+    with Pool(args.cores) as pool:
+        for i, (name, entry, msg) in enumerate(pool.imap_unordered(reorder_case, jobs)):
+            if msg: print(f"\n{msg}")
+            if entry: index[name] = entry
+            else: index.pop(name, None)
+            # Persist progress so an interrupted run resumes where it stopped
+            if (i + 1) % 100 == 0: save_index(index, args.data_dir)
+            sys.stdout.write(f"\rProgress: {((i+1)/len(files))*100:.1f}%")
+            sys.stdout.flush()
+    save_index(index, args.data_dir)
+    print(f"\n{len(index)} cases indexed -> {os.path.join(args.data_dir, INDEX_FILENAME)}")
+    print("Rewritten cases changed on disk; run 'python case_catalog.py scan' to refresh the catalog.")
+
+if __name__ == "__main__":
+    main()
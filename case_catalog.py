@@ -0,0 +1,238 @@
+"""
+case_catalog.py - Queryable Case Catalog (SQLite)
+
+PURPOSE:
+    One row per case with its shape, parameters, mesh counts, per-field
+    statistics, path and content hash, so tools can select cases with a SQL
+    query instead of unpickling every .npy. generate_dataset.run_case adds each
+    new case; the scanner backfills existing datasets and refreshes changed
+    or removed files (e.g. after clean_dataset.py).
+
+USAGE:
+    python case_catalog.py scan                               # data_output/
+    python case_catalog.py scan --data-dir ./extracted_data
+    python case_catalog.py query "shape_name = 'venturi' AND refinement = 6
+                                  AND json_extract(params, '$.throat_ratio') < 0.4"
+
+    files = query_cases("shape_name = 'valve'", data_dir="./data_output")
+
+    Trainers: set "catalog_query" in DEFAULT_CONFIG (instead of file_pattern).
+    Exporters: --query "<where clause>" instead of --glob.
+
+OUTPUT:
+    <data_dir>/catalog.sqlite, table 'cases':
+        case_name, path (relative to data_dir), shape_name, refinement, L, D, Ux, params (JSON),
+        num_points, num_cells (fluid), num_boundary, nonfinite,
+        {u,v,w,p}_{min,max,mean,std}, U_mag_max, sha1, size, mtime, updated
+
+NOTES:
+    - WAL mode + busy timeout let the generator's pool workers insert concurrently.
+    - Params live in a JSON column: filter them with json_extract(params, '$.<name>').
+    - The scanner only reads files whose size/mtime differ from their row.
+    - Paths are stored relative to the catalog's data_dir, so the catalog works from
+      any cwd and survives moving the dataset; query_cases joins them back.
+"""
+
+import argparse
+import functools
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+# --- Configuration ---
+DATA_DIR = "./data_output"
+FILE_PATTERN = "*.npy"
+CATALOG_FILENAME = "catalog.sqlite"
+N_CORES = min(8, os.cpu_count() or 1)
+
+STAT_FIELDS = {"u": 3, "v": 4, "w": 5, "p": 6}
+
+COLUMN_TYPES = {
+    "case_name": "TEXT PRIMARY KEY", "path": "TEXT", "shape_name": "TEXT", "refinement": "INTEGER",
+    "L": "REAL", "D": "REAL", "Ux": "REAL", "params": "TEXT",
+    "num_points": "INTEGER", "num_cells": "INTEGER", "num_boundary": "INTEGER", "nonfinite": "INTEGER",
+    **{f"{f}_{s}": "REAL" for f in STAT_FIELDS for s in ("min", "max", "mean", "std")},
+    "U_mag_max": "REAL", "sha1": "TEXT", "size": "INTEGER", "mtime": "REAL", "updated": "REAL",
+}
+COLUMNS = list(COLUMN_TYPES)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS cases ("
+    + ", ".join(f"{name} {sql_type}" for name, sql_type in COLUMN_TYPES.items()) + ");\n"
+    "CREATE INDEX IF NOT EXISTS idx_cases_shape ON cases (shape_name, refinement);\n"
+)
+
+# ==========================================
+# 1. Records
+# ==========================================
+
+def catalog_path(data_dir=DATA_DIR):
+    return os.path.join(data_dir, CATALOG_FILENAME)
+
+def file_sha1(file_path):
+    h = hashlib.sha1()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def load_case(file_path):
+    """Returns (data [N, 12], shape_name, params) for dict and raw .npy cases."""
+    default_shape = os.path.splitext(os.path.basename(file_path))[0].rsplit("_", 1)[0]
+    try:
+        return np.load(file_path, mmap_mode='r'), default_shape, {}
+    except ValueError:
+        pass  # Object array (pickled dict): cannot be memory-mapped
+    content = np.load(file_path, allow_pickle=True).item()
+    return content['data'], content.get("shape_name", default_shape), content.get("params", {})
+
+def case_record(file_path, data, shape_name, params, refinement=None, data_dir=None):
+    """Catalog row for one case; `data` is its (N, 12) array, data_dir holds the catalog."""
+    data = np.asarray(data)
+    finite = np.isfinite(data).all(axis=1)
+    clean = data[finite]
+    num_cells = int(np.count_nonzero(data[:, 8] > 0.5))
+    st = os.stat(file_path)
+
+    record = {
+        "case_name": os.path.splitext(os.path.basename(file_path))[0],
+        "path": os.path.relpath(file_path, data_dir or os.path.dirname(file_path)),
+        "shape_name": shape_name,
+        "refinement": refinement if refinement is not None else params.get("ref"),
+        "L": params.get("L"),
+        "D": params.get("D"),
+        "Ux": params.get("Ux"),
+        "params": json.dumps(params, sort_keys=True, default=float),
+        "num_points": int(data.shape[0]),
+        "num_cells": num_cells,
+        "num_boundary": int(data.shape[0]) - num_cells,
+        "nonfinite": int(data.shape[0] - clean.shape[0]),
+        "sha1": file_sha1(file_path),
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "updated": time.time(),
+    }
+    for name, col in STAT_FIELDS.items():
+        values = clean[:, col] if len(clean) else np.full(1, np.nan)
+        record[f"{name}_min"] = float(values.min())
+        record[f"{name}_max"] = float(values.max())
+        record[f"{name}_mean"] = float(values.mean())
+        record[f"{name}_std"] = float(values.std())
+    record["U_mag_max"] = float(np.linalg.norm(clean[:, 3:6], axis=1).max()) if len(clean) else float("nan")
+    return record
+
+# ==========================================
+# 2. Database
+# ==========================================
+
+def connect(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def upsert_cases(conn, records):
+    rows = [tuple(r[c] for c in COLUMNS) for r in records]
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO cases ({', '.join(COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+
+def add_case(file_path, data, shape_name, params, refinement=None, data_dir=None):
+    """Called by generate_dataset.run_case right after a case is saved."""
+    data_dir = data_dir or os.path.dirname(file_path)
+    conn = connect(catalog_path(data_dir))
+    try:
+        upsert_cases(conn, [case_record(file_path, data, shape_name, params, refinement, data_dir)])
+    finally:
+        conn.close()
+
+def query_cases(where=None, data_dir=DATA_DIR, args=()):
+    """File paths of the cases matching a SQL WHERE clause (all cases if None), sorted by name."""
+    path = catalog_path(data_dir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No catalog at {path}; run 'python case_catalog.py scan --data-dir {data_dir}'")
+    conn = connect(path)
+    try:
+        sql = "SELECT path FROM cases" + (f" WHERE {where}" if where else "") + " ORDER BY case_name"
+        return [os.path.join(data_dir, row[0]) for row in conn.execute(sql, args)]
+    finally:
+        conn.close()
+
+# ==========================================
+# 3. Scanner (backfill / refresh)
+# ==========================================
+
+def scan_file(file_path, data_dir=None):
+    try:
+        data, shape_name, params = load_case(file_path)
+        if data.ndim != 2 or data.shape[1] != 12:
+            return None, f"Skipping {os.path.basename(file_path)}: shape {data.shape}"
+        return case_record(file_path, data, shape_name, params, data_dir=data_dir), None
+    except Exception as e:
+        return None, f"Err: {os.path.basename(file_path)} - {e}"
+
+def scan(data_dir=DATA_DIR, pattern=FILE_PATTERN, cores=N_CORES):
+    conn = connect(catalog_path(data_dir))
+    known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT path, size, mtime FROM cases")}
+    files = sorted(glob.glob(os.path.join(data_dir, pattern)))
+    rel_paths = {f: os.path.relpath(f, data_dir) for f in files}
+
+    # Drop rows of files that were deleted or quarantined (and rows with old cwd-relative paths)
+    file_set = set(rel_paths.values())
+    gone = [p for p in known if p not in file_set]
+    with conn:
+        conn.executemany("DELETE FROM cases WHERE path = ?", [(p,) for p in gone])
+
+    todo = []
+    for f in files:
+        st = os.stat(f)
+        if known.get(rel_paths[f]) != (st.st_size, st.st_mtime):
+            todo.append(f)
+    print(f"Catalog {catalog_path(data_dir)}: {len(files)} files, {len(todo)} new/changed, {len(gone)} removed")
+
+    batch = []
+    with Pool(cores) as pool:
+        for i, (record, err) in enumerate(pool.imap_unordered(functools.partial(scan_file, data_dir=data_dir), todo)):
+            if err: print(f"\n{err}")
+            if record: batch.append(record)
+            # One writer (this process), one transaction per 500 cases
+            if len(batch) >= 500:
+                upsert_cases(conn, batch)
+                batch = []
+            pct = ((i+1)/max(len(todo), 1))*100
+            sys.stdout.write(f"\rProgress: {pct:.1f}%")
+            sys.stdout.flush()
+    upsert_cases(conn, batch)
+    conn.close()
+    print("\nComplete.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the case catalog.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_scan = sub.add_parser("scan", help="Backfill/refresh the catalog from the case files")
+    p_scan.add_argument("--data-dir", default=DATA_DIR)
+    p_scan.add_argument("--pattern", default=FILE_PATTERN)
+    p_scan.add_argument("--cores", type=int, default=N_CORES)
+    p_query = sub.add_parser("query", help="List cases matching a SQL WHERE clause")
+    p_query.add_argument("where", nargs="?", default=None)
+    p_query.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args()
+
+    if args.command == "scan":
+        scan(args.data_dir, args.pattern, args.cores)
+    else:
+        files = query_cases(args.where, args.data_dir)
+        for f in files:
+            print(f)
+        print(f"{len(files)} cases")
+
+if __name__ == "__main__":
+    main()
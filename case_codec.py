@@ -0,0 +1,394 @@
+"""
+case_codec.py - Compressed Case Storage (.cfdz)
+
+PURPOSE:
+    Stores (N, 12) cases in a fraction of the float64 .npy size with a guaranteed
+    per-column absolute error bound, while keeping random access to row chunks:
+    - x, y, z, u, v, w, p, y_wall: fixed-point (uint8/16/32 steps of 2 * bound from the
+      column minimum), or float16 with --quant float16 where that meets the bound.
+      Columns whose whole range fits in the bound (z of the extruded 2D cases) are
+      stored as a single constant.
+    - is_fluid / is_wall / is_inlet / is_outlet: bit-packed, 4 bits per row.
+    - Rows are cut into CHUNK_ROWS chunks; each chunk is byte-shuffled and compressed
+      (zstd if `zstandard` is installed, zlib otherwise) and can be read on its own.
+
+USAGE:
+    python case_codec.py compress                                   # data_output -> data_compressed
+    python case_codec.py compress --quant float16 --bound p=1e-3
+    python case_codec.py benchmark --n 20                          # footprint, error, read bandwidth
+
+    case = CompressedCase("data_compressed/valve_12.cfdz")
+    data = case.read()                        # (N, 12) float64
+    rows = case.take(rng.choice(len(case), 4096, replace=False))   # only touched chunks
+    block = case.read_chunk(3)
+
+    Trainer: point train_pointnetv1.py at the compressed directory with
+    "file_pattern": "*.cfdz"; FluidDataset decodes only the sampled rows.
+
+FILE LAYOUT:
+    b"CFDZ\\x01" | uint32 header length | JSON header | compressed chunks
+    header: n_rows, chunk_rows, codec, columns (kind/dtype/offset/step per column),
+            packed flags, chunk byte ranges, shape_name, params, nonfinite, max_abs_target
+
+NOTES:
+    - Error bounds are absolute, in the column's units (ERROR_BOUNDS). Columns with
+      NaN/Inf are stored losslessly as float64 (run clean_dataset.py first).
+    - The benchmark reads warm (page-cached) files; drop caches for cold numbers.
+"""
+
+import argparse
+import glob
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+
+from case_catalog import load_case
+
+# --- Configuration ---
+DATA_DIR = "./data_output"
+OUT_DIR = "./data_compressed"
+CASE_EXT = ".cfdz"
+N_CORES = min(8, os.cpu_count() or 1)
+CHUNK_ROWS = 1 << 15
+QUANT = "fixed"             # "fixed" | "float16" (float16 where it meets the bound, else fixed)
+CODEC_LEVEL = 9
+
+COLUMNS = ["x", "y", "z", "u", "v", "w", "p", "y_wall", "is_fluid", "is_wall", "is_inlet", "is_outlet"]
+FLAG_COLUMNS = slice(8, 12)
+
+# Max absolute reconstruction error per column (m, m/s, m^2/s^2 kinematic pressure)
+ERROR_BOUNDS = {
+    "x": 5e-5, "y": 5e-5, "z": 5e-5,
+    "u": 1e-4, "v": 1e-4, "w": 1e-4,
+    "p": 1e-4,
+    "y_wall": 1e-5,
+}
+
+MAGIC = b"CFDZ\x01"
+
+# ==========================================
+# 1. Column Codecs
+# ==========================================
+
+def shuffle_bytes(arr):
+    """Groups byte k of every element together (blosc-style shuffle) so zstd sees runs."""
+    return np.ascontiguousarray(arr).view(np.uint8).reshape(-1, arr.dtype.itemsize).T.tobytes()
+
+def unshuffle_bytes(buf, dtype, n):
+    dtype = np.dtype(dtype)
+    return np.frombuffer(buf, np.uint8).reshape(dtype.itemsize, n).T.copy().view(dtype).ravel()
+
+def plan_column(values, bound, quant=QUANT):
+    """Chooses the encoding of one column over the whole case."""
+    if not np.isfinite(values).all():
+        return {"kind": "raw", "dtype": "<f8"}
+    lo, hi = float(values.min()), float(values.max())
+    if hi - lo <= 2 * bound:
+        return {"kind": "const", "value": (lo + hi) / 2}
+    if quant == "float16":
+        f16 = values.astype(np.float16)
+        if np.isfinite(f16).all() and np.abs(f16.astype(np.float64) - values).max() <= bound:
+            return {"kind": "f16", "dtype": "<f2"}
+    step = 2 * bound
+    levels = int(np.ceil((hi - lo) / step)) + 1
+    for dtype in ("<u1", "<u2", "<u4"):
+        if levels <= np.iinfo(np.dtype(dtype)).max + 1:
+            return {"kind": "fixed", "dtype": dtype, "offset": lo, "step": step}
+    return {"kind": "raw", "dtype": "<f8"}
+
+def encode_column(values, col):
+    if col["kind"] == "fixed":
+        q = np.rint((values - col["offset"]) / col["step"])
+        return q.astype(col["dtype"])
+    return values.astype(col["dtype"])
+
+def decode_column(arr, col):
+    if col["kind"] == "fixed":
+        return col["offset"] + arr.astype(np.float64) * col["step"]
+    return arr.astype(np.float64)
+
+# ==========================================
+# 2. Compression
+# ==========================================
+
+def get_codec(name=None):
+    """(name, compress, decompress); zstd when the zstandard package is available."""
+    if name in (None, "zstd"):
+        try:
+            import zstandard
+            return ("zstd", zstandard.ZstdCompressor(level=CODEC_LEVEL).compress,
+                    zstandard.ZstdDecompressor().decompress)
+        except ImportError:
+            if name == "zstd":
+                raise ImportError("This case was written with zstd: pip install zstandard")
+    return "zlib", lambda b: zlib.compress(b, CODEC_LEVEL), zlib.decompress
+
+def encode_case(data, shape_name=None, params=None, bounds=None, quant=QUANT, chunk_rows=CHUNK_ROWS):
+    """Returns the .cfdz bytes for an (N, 12) array."""
+    data = np.asarray(data, dtype=np.float64)
+    bounds = {**ERROR_BOUNDS, **(bounds or {})}
+    codec, compress, _ = get_codec()
+
+    flags = data[:, FLAG_COLUMNS]
+    pack_flags = bool(np.isin(flags, (0.0, 1.0)).all())
+    n_value_cols = FLAG_COLUMNS.start if pack_flags else len(COLUMNS)
+    columns = []
+    for c in range(n_value_cols):
+        bound = bounds.get(COLUMNS[c], 0.0)
+        columns.append(plan_column(data[:, c], bound, quant) if bound > 0 else {"kind": "raw", "dtype": "<f8"})
+
+    chunks, offset = [], 0
+    for start in range(0, data.shape[0], chunk_rows):
+        block = data[start:start + chunk_rows]
+        parts = [shuffle_bytes(encode_column(block[:, c], col))
+                 for c, col in enumerate(columns) if col["kind"] != "const"]
+        if pack_flags:
+            parts.append(np.packbits(block[:, FLAG_COLUMNS].astype(np.uint8).ravel()).tobytes())
+        payload = compress(b"".join(parts))
+        chunks.append(payload)
+
+    chunk_ranges = []
+    for payload in chunks:
+        chunk_ranges.append([offset, len(payload)])
+        offset += len(payload)
+
+    finite = np.isfinite(data).all(axis=1)
+    targets = data[finite, 3:7]
+    header = {
+        "version": 1,
+        "n_rows": int(data.shape[0]),
+        "chunk_rows": chunk_rows,
+        "codec": codec,
+        "columns": columns,
+        "packed_flags": pack_flags,
+        "chunks": chunk_ranges,
+        "shape_name": shape_name,
+        "params": params or {},
+        "error_bounds": {k: bounds[k] for k in COLUMNS if k in bounds},
+        "nonfinite": int(data.shape[0] - np.count_nonzero(finite)),
+        "max_abs_target": float(np.abs(targets).max()) if targets.size else 0.0,
+    }
+    header_bytes = json.dumps(header, default=float).encode()
+    return MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes + b"".join(chunks)
+
+def write_case(path, data, **kw):
+    """Atomic write (tmp file + rename)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_case(data, **kw))
+    os.replace(tmp_path, path)
+
+# ==========================================
+# 3. Reading (random chunk access)
+# ==========================================
+
+class CompressedCase:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a {CASE_EXT} file")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(header_len))
+        self._body_start = len(MAGIC) + 4 + header_len
+        self._decompress = get_codec(self.header["codec"])[2]
+        self.chunk_rows = self.header["chunk_rows"]
+        self.shape_name = self.header["shape_name"]
+        self.params = self.header["params"]
+        self.nonfinite = self.header["nonfinite"]
+        self.max_abs_target = self.header["max_abs_target"]
+
+    def __len__(self):
+        return self.header["n_rows"]
+
+    @property
+    def n_chunks(self):
+        return len(self.header["chunks"])
+
+    def chunk_size(self, i):
+        return min(self.chunk_rows, len(self) - i * self.chunk_rows)
+
+    def read_chunk(self, i):
+        """Rows [i * chunk_rows, (i + 1) * chunk_rows) as an (n, 12) float64 array."""
+        offset, nbytes = self.header["chunks"][i]
+        with open(self.path, "rb") as f:
+            f.seek(self._body_start + offset)
+            buf = self._decompress(f.read(nbytes))
+
+        n = self.chunk_size(i)
+        out = np.empty((n, len(COLUMNS)), dtype=np.float64)
+        pos = 0
+        for c, col in enumerate(self.header["columns"]):
+            if col["kind"] == "const":
+                out[:, c] = col["value"]
+                continue
+            size = n * np.dtype(col["dtype"]).itemsize
+            out[:, c] = decode_column(unshuffle_bytes(buf[pos:pos + size], col["dtype"], n), col)
+            pos += size
+        if self.header["packed_flags"]:
+            bits = np.unpackbits(np.frombuffer(buf, np.uint8, offset=pos), count=n * 4)
+            out[:, FLAG_COLUMNS] = bits.reshape(n, 4)
+        return out
+
+    def read(self):
+        if len(self) == 0:
+            return np.empty((0, len(COLUMNS)))
+        return np.concatenate([self.read_chunk(i) for i in range(self.n_chunks)])
+
+    def head(self, n):
+        """First n rows (an LOD prefix after build_lods.py), reading only the chunks they span."""
+        n = min(n, len(self))
+        n_chunks = -(-n // self.chunk_rows)
+        if n_chunks == 0:
+            return np.empty((0, len(COLUMNS)))
+        return np.concatenate([self.read_chunk(i) for i in range(n_chunks)])[:n]
+
+    def take(self, indices):
+        """Rows at `indices` (any order, repeats allowed), decompressing only the chunks they touch."""
+        indices = np.asarray(indices)
+        out = np.empty((len(indices), len(COLUMNS)), dtype=np.float64)
+        chunk_ids = indices // self.chunk_rows
+        for i in np.unique(chunk_ids):
+            sel = chunk_ids == i
+            out[sel] = self.read_chunk(int(i))[indices[sel] - i * self.chunk_rows]
+        return out
+
+def read_case(path):
+    return CompressedCase(path).read()
+
+# ==========================================
+# 4. Commands
+# ==========================================
+
+def compress_file(job):
+    file_path, out_dir, bounds, quant = job
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        data, shape_name, params = load_case(file_path)
+        if data.ndim != 2 or data.shape[1] != len(COLUMNS):
+            return f"Skipping {name}: shape {data.shape}"
+        write_case(os.path.join(out_dir, name + CASE_EXT), np.asarray(data),
+                   shape_name=shape_name, params=params, bounds=bounds, quant=quant)
+        return None
+    except Exception as e:
+        return f"Err: {name} - {e}"
+
+def compress_dir(data_dir, out_dir, bounds, quant, cores):
+    files = sorted(glob.glob(os.path.join(data_dir, "*.npy")))
+    os.makedirs(out_dir, exist_ok=True)
+    print(f"Compressing {len(files)} cases -> {out_dir} ({get_codec()[0]}, {quant}) on {cores} cores...")
+    jobs = [(f, out_dir, bounds, quant) for f in files]
+    with Pool(cores) as pool:
+        for i, msg in enumerate(pool.imap_unordered(compress_file, jobs)):
+            if msg: print(f"\n{msg}")
+            sys.stdout.write(f"\rProgress: {((i+1)/max(len(files), 1))*100:.1f}%")
+            sys.stdout.flush()
+    # Row order is preserved, so LOD prefixes (build_lods.py) stay valid: re-index them
+    # against the .cfdz files (readers check size + mtime of the file they open)
+    from build_lods import lod_entry, load_lod_index, save_index
+    index = {}
+    for name, entry in load_lod_index(data_dir).items():
+        src, dst = os.path.join(data_dir, name + ".npy"), os.path.join(out_dir, name + CASE_EXT)
+        if os.path.exists(dst) and lod_entry({name: entry}, src) is not None \
+                and os.path.getmtime(dst) >= os.path.getmtime(src):
+            st = os.stat(dst)
+            index[name] = {**entry, "size": st.st_size, "mtime": st.st_mtime}
+    if index:
+        save_index(index, out_dir)
+    before = sum(os.path.getsize(f) for f in files)
+    after = sum(os.path.getsize(f) for f in glob.glob(os.path.join(out_dir, "*" + CASE_EXT)))
+    print(f"\n{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({before / max(after, 1):.1f}x)")
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def benchmark(data_dir, n, bounds, quant, num_points=4096):
+    files = sorted(glob.glob(os.path.join(data_dir, "*.npy")))[:n]
+    if not files:
+        print(f"No .npy files in {data_dir}")
+        return
+    bounds = {**ERROR_BOUNDS, **(bounds or {})}
+    rng = np.random.default_rng(0)
+    tot = {"npy_bytes": 0, "cfdz_bytes": 0, "raw_bytes": 0, "npy_s": 0.0, "cfdz_s": 0.0,
+           "npy_take_s": 0.0, "cfdz_take_s": 0.0}
+    worst = np.zeros(len(COLUMNS))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for file_path in files:
+            data, shape_name, params = load_case(file_path)
+            data = np.asarray(data, dtype=np.float64)
+            out_path = os.path.join(tmp, os.path.basename(file_path) + CASE_EXT)
+            write_case(out_path, data, shape_name=shape_name, params=params, bounds=bounds, quant=quant)
+
+            decoded = read_case(out_path)
+            finite = np.isfinite(data).all(axis=1)
+            if finite.any():
+                err = np.abs(decoded[finite] - data[finite]).max(axis=0)
+                worst = np.maximum(worst, err)
+
+            idx = rng.choice(len(data), min(num_points, len(data)), replace=False)
+            tot["npy_bytes"] += os.path.getsize(file_path)
+            tot["cfdz_bytes"] += os.path.getsize(out_path)
+            tot["raw_bytes"] += data.nbytes
+            tot["npy_s"] += timed(lambda: load_case(file_path))
+            tot["cfdz_s"] += timed(lambda: read_case(out_path))
+            tot["npy_take_s"] += timed(lambda: np.asarray(load_case(file_path)[0])[idx])
+            tot["cfdz_take_s"] += timed(lambda: CompressedCase(out_path).take(idx))
+
+    print(f"\n{len(files)} cases, codec {get_codec()[0]}, quant {quant}, {CHUNK_ROWS} rows/chunk")
+    print(f"Disk: .npy {tot['npy_bytes'] / 1e6:.1f} MB | .cfdz {tot['cfdz_bytes'] / 1e6:.1f} MB "
+          f"({tot['npy_bytes'] / max(tot['cfdz_bytes'], 1):.1f}x smaller)")
+    print(f"{'':<24}{'.npy':>12}{'.cfdz':>12}")
+    print(f"{'full read (MB/s)':<24}{tot['raw_bytes'] / 1e6 / tot['npy_s']:>12.1f}"
+          f"{tot['raw_bytes'] / 1e6 / tot['cfdz_s']:>12.1f}")
+    print(f"{'full read (ms/case)':<24}{1000 * tot['npy_s'] / len(files):>12.2f}"
+          f"{1000 * tot['cfdz_s'] / len(files):>12.2f}")
+    print(f"{f'{num_points} rows (ms/case)':<24}{1000 * tot['npy_take_s'] / len(files):>12.2f}"
+          f"{1000 * tot['cfdz_take_s'] / len(files):>12.2f}")
+    print(f"\n{'column':<10}{'bound':>10}{'max err':>12}")
+    for c, name in enumerate(COLUMNS):
+        print(f"{name:<10}{bounds.get(name, 0.0):>10.1e}{worst[c]:>12.3e}")
+    print("MB/s counts decoded float64 bytes.")
+
+def parse_bounds(items):
+    bounds = {}
+    for item in items or []:
+        name, value = item.split("=")
+        if name not in ERROR_BOUNDS:
+            raise ValueError(f"Unknown column '{name}' (choose from {', '.join(ERROR_BOUNDS)})")
+        bounds[name] = float(value)
+    return bounds
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed case storage with bounded quantization error.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name in ("compress", "benchmark"):
+        p = sub.add_parser(name)
+        p.add_argument("--data-dir", default=DATA_DIR)
+        p.add_argument("--quant", default=QUANT, choices=["fixed", "float16"])
+        p.add_argument("--bound", nargs="*", metavar="COL=VALUE", help="Override ERROR_BOUNDS")
+    sub.choices["compress"].add_argument("--out-dir", default=OUT_DIR)
+    sub.choices["compress"].add_argument("--cores", type=int, default=N_CORES)
+    sub.choices["benchmark"].add_argument("--n", type=int, default=20, help="Cases to measure")
+    args = parser.parse_args()
+
+    bounds = parse_bounds(args.bound)
+    if args.command == "compress":
+        compress_dir(args.data_dir, args.out_dir, bounds, args.quant, args.cores)
+    else:
+        benchmark(args.data_dir, args.n, bounds, args.quant)
+
+if __name__ == "__main__":
+    main()
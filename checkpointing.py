@@ -0,0 +1,135 @@
+"""
+checkpointing.py - Full Training-State Checkpoints
+
+PURPOSE:
+    Saves and restores everything needed to continue a preempted training run
+    exactly where it stopped: model, optimizer, scheduler, epoch, best loss and
+    all RNG states (python, numpy, torch, CUDA and the DataLoader generator that
+    seeds every worker).
+
+USAGE:
+    writer = CheckpointWriter()
+    writer.save(build_checkpoint(...), "weights/last.pth")   # returns immediately
+    ...
+    writer.close()                                           # flush before exit
+
+    state = load_checkpoint("weights/last.pth", device)
+
+NOTES:
+    - save() takes a CPU snapshot of all tensors on the calling thread, then a
+      background thread serializes it. The training loop never waits on disk.
+    - Files are written to '<path>.tmp' and renamed, so a crash mid-write never
+      leaves a truncated checkpoint behind.
+"""
+
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+# ==========================================
+# RNG State
+# ==========================================
+
+def capture_rng_state(loader_generator=None):
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+    if loader_generator is not None:
+        state["loader"] = loader_generator.get_state()
+    return state
+
+def restore_rng_state(state, loader_generator=None):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+    if loader_generator is not None and "loader" in state:
+        loader_generator.set_state(state["loader"])
+
+# ==========================================
+# Snapshot & Build
+# ==========================================
+
+def snapshot_to_cpu(obj):
+    """Recursively copies every tensor in a (nested) state dict to CPU."""
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: snapshot_to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot_to_cpu(v) for v in obj)
+    return obj
+
+def build_checkpoint(model, optimizer, scheduler, epoch, best_val_loss, config,
+                     loader_generator=None):
+    return {
+        "model": model.state_dict(),
+        "optimizer": optimizer.state_dict(),
+        "scheduler": scheduler.state_dict() if scheduler is not None else None,
+        "epoch": epoch,
+        "best_val_loss": best_val_loss,
+        "config": dict(config),
+        "rng": capture_rng_state(loader_generator),
+    }
+
+def load_checkpoint(path, model, optimizer=None, scheduler=None, loader_generator=None,
+                    device="cpu"):
+    """Restores a checkpoint written by build_checkpoint(). Returns the raw dict."""
+    ckpt = torch.load(path, map_location=device, weights_only=False)
+    model.load_state_dict(ckpt["model"])
+    if optimizer is not None:
+        optimizer.load_state_dict(ckpt["optimizer"])
+    if scheduler is not None and ckpt.get("scheduler") is not None:
+        scheduler.load_state_dict(ckpt["scheduler"])
+    restore_rng_state(ckpt["rng"], loader_generator)
+    return ckpt
+
+# ==========================================
+# Asynchronous Writer
+# ==========================================
+
+class CheckpointWriter:
+    """Writes checkpoints from a background thread.
+
+    The queue holds at most `max_pending` snapshots; if disk falls that far
+    behind, save() blocks rather than letting CPU copies pile up in RAM.
+    """
+    def __init__(self, max_pending=2):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+        self._thread.start()
+
+    def save(self, state, path):
+        self._queue.put((snapshot_to_cpu(state), path))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            state, path = item
+            tmp_path = path + ".tmp"
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                torch.save(state, tmp_path)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Checkpoint write failed for {path}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
@@ -5,19 +5,37 @@ PURPOSE:
     Scans the .npy dataset for "exploded" CFD simulations (NaNs, Infs, or massive values).
     - If a file has a few bad points: It clips them to reasonable physical limits.
     - If a file is completely broken (>50% bad): It moves it to a 'quarantine' folder.
+
+HOW IT RUNS:
+    - Files are processed in parallel (one per worker, N_CORES workers).
+    - Arrays are scanned in CHUNK_ROWS blocks. Plain (N, 12) arrays are memory-mapped,
+      so only one chunk is resident at a time. Dict files (generate_dataset.py
+      format) are pickled and must be loaded, but are still scanned chunk-wise.
+    - A fixed file is written to '<name>.tmp' and renamed over the original, so an
+      interrupted run never leaves a half-written case.
+    - Every verdict is recorded in MANIFEST_PATH. Reruns skip files whose
+      mtime + size (or SHA-1 with SKIP_MODE = "hash") match the manifest.
 """
 
 import numpy as np
 import glob
+import hashlib
+import json
 import os
 import shutil
 import sys
+from multiprocessing import Pool
 
 # ==========================================
 # CONFIGURATION
 # ==========================================
 DATA_DIR = "./data_output"
 QUARANTINE_DIR = "./data_quarantine"
+MANIFEST_PATH = os.path.join(DATA_DIR, "clean_manifest.json")
+
+N_CORES = min(8, os.cpu_count() or 1)
+CHUNK_ROWS = 1 << 20     # Rows scanned per block (~100 MB for float64 x 12)
+SKIP_MODE = "mtime"      # "mtime": skip on matching mtime + size | "hash": skip on matching SHA-1
 
 # Physical Limits (Adjust based on your fluid/scale)
 # For standard water/air pipe flow, 200m/s is already very high.
@@ -31,85 +49,144 @@ DESTRUCTION_THRESHOLD = 0.50 # 50%
 # UTILS
 # ==========================================
 
-def load_file_content(file_path):
-    """Robust loader that handles the 0-D dictionary issue."""
+def file_fingerprint(file_path):
+    st = os.stat(file_path)
+    fp = {"mtime": st.st_mtime, "size": st.st_size}
+    if SKIP_MODE == "hash":
+        h = hashlib.sha1()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        fp["sha1"] = h.hexdigest()
+    return fp
+
+def is_unchanged(entry, fingerprint):
+    if not entry or entry.get("verdict") not in ("OK", "FIXED"):
+        return False
+    keys = ("sha1",) if SKIP_MODE == "hash" else ("mtime", "size")
+    return all(k in entry and entry[k] == fingerprint.get(k) for k in keys)
+
+def open_case(file_path):
+    """
+    Returns (content, data). Plain arrays are memory-mapped read-only and content
+    is None; dict files are loaded and content is the wrapping dict.
+    """
     try:
-        raw = np.load(file_path, allow_pickle=True)
-        
-        # Unpack 0-D array wrapping a dict
-        if raw.ndim == 0:
-            content = raw.item()
-            if isinstance(content, dict) and 'data' in content:
-                return content, content['data']
-        
-        # Handle direct array (legacy)
-        if isinstance(raw, np.ndarray) and raw.ndim == 2:
-            return {"data": raw}, raw
-            
-        return None, None
-    except Exception as e:
-        print(f"❌ Read Error {file_path}: {e}")
-        return None, None
-
-def check_and_fix(file_path):
-    full_content, data = load_file_content(file_path)
-    
-    if data is None:
-        return "READ_ERR"
-
+        data = np.load(file_path, mmap_mode='r')
+        return (None, data) if data.ndim == 2 else (None, None)
+    except ValueError:
+        pass  # Object array (pickled dict): cannot be memory-mapped
+
+    # Unpack 0-D array wrapping a dict
+    raw = np.load(file_path, allow_pickle=True)
+    if raw.ndim == 0:
+        content = raw.item()
+        if isinstance(content, dict) and 'data' in content:
+            return content, content['data']
+    return None, None
+
+def chunks(n_rows):
+    for start in range(0, n_rows, CHUNK_ROWS):
+        yield start, min(start + CHUNK_ROWS, n_rows)
+
+def scan(data):
+    """Counts bad rows and non-finite values without modifying the data."""
     # Data shape: [N, 12]
     # Cols: 3,4,5 (u,v,w), 6 (p)
-    
-    # 1. Check NaNs / Infs
-    mask_nan = ~np.isfinite(data)
-    nan_count = np.sum(mask_nan)
-    
-    if nan_count > 0:
-        data[mask_nan] = 0.0 # Replace NaNs with 0
-        
-    # 2. Check Physical Limits
-    # Velocity (Cols 3,4,5)
-    vels = data[:, 3:6]
-    mask_v = np.abs(vels) > MAX_VELOCITY
-    
-    # Pressure (Col 6)
-    press = data[:, 6]
-    mask_p = np.abs(press) > MAX_PRESSURE
-    
-    # Total bad points (logical OR of all conditions)
-    # We count rows where ANY column is bad
-    row_is_bad = np.any(mask_v, axis=1) | mask_p | np.any(mask_nan, axis=1)
-    bad_row_count = np.sum(row_is_bad)
-    total_rows = data.shape[0]
-    
-    damage_ratio = bad_row_count / total_rows
-
-    # DECISION TIME
-    if bad_row_count == 0:
-        return "OK"
-
-    print(f"⚠️  {os.path.basename(file_path)}: {bad_row_count}/{total_rows} points ({damage_ratio:.1%}) out of bounds.")
-
-    if damage_ratio > DESTRUCTION_THRESHOLD:
-        return "QUARANTINE"
-    
-    # FIX: Clip values
-    # Clip Velocity
-    data[:, 3:6] = np.clip(data[:, 3:6], -MAX_VELOCITY, MAX_VELOCITY)
-    
-    # Clip Pressure
-    data[:, 6] = np.clip(data[:, 6], -MAX_PRESSURE, MAX_PRESSURE)
-    
-    # Save back
-    # We must update the array inside the dictionary to preserve metadata
-    full_content['data'] = data
-    
+    bad_rows = 0
+    nonfinite = 0
+    for s, e in chunks(data.shape[0]):
+        block = np.asarray(data[s:e])
+        mask_nan = ~np.isfinite(block)
+        mask_v = np.abs(block[:, 3:6]) > MAX_VELOCITY
+        mask_p = np.abs(block[:, 6]) > MAX_PRESSURE
+        # We count rows where ANY column is bad
+        row_is_bad = np.any(mask_v, axis=1) | mask_p | np.any(mask_nan, axis=1)
+        bad_rows += int(np.count_nonzero(row_is_bad))
+        nonfinite += int(np.count_nonzero(mask_nan))
+    return bad_rows, nonfinite
+
+def fix_block(block):
+    # Replace NaNs/Infs with 0, then clip velocity and pressure (in place on a copied chunk)
+    np.nan_to_num(block, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+    block[:, 3:6] = np.clip(block[:, 3:6], -MAX_VELOCITY, MAX_VELOCITY)
+    block[:, 6] = np.clip(block[:, 6], -MAX_PRESSURE, MAX_PRESSURE)
+    return block
+
+def write_fixed(file_path, content, data):
+    """Writes the clipped case to a temp file and atomically renames it over the original."""
+    tmp_path = file_path + ".tmp"
     try:
-        np.save(file_path, full_content)
-        return "FIXED"
+        if content is None:
+            # Plain array: stream chunks from the read-only map into a writable one
+            out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=data.dtype, shape=data.shape)
+            for s, e in chunks(data.shape[0]):
+                out[s:e] = fix_block(np.array(data[s:e]))
+            out.flush()
+            del out
+        else:
+            # We must update the array inside the dictionary to preserve metadata
+            fixed = np.empty_like(data)
+            for s, e in chunks(data.shape[0]):
+                fixed[s:e] = fix_block(np.array(data[s:e]))
+            content['data'] = fixed
+            with open(tmp_path, "wb") as f:
+                np.save(f, content)
+
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+def check_and_fix(job):
+    """Worker: returns (basename, manifest entry, message or None)."""
+    file_path, entry = job
+    name = os.path.basename(file_path)
+    try:
+        fingerprint = file_fingerprint(file_path)
+        if is_unchanged(entry, fingerprint):
+            return name, dict(entry, skipped=True), None
+
+        content, data = open_case(file_path)
+        if data is None:
+            return name, {"verdict": "READ_ERR"}, f"❌ Read Error {name}: not an (N, 12) array or data dict"
+
+        total_rows = data.shape[0]
+        bad_rows, nonfinite = scan(data)
+        damage_ratio = bad_rows / max(total_rows, 1)
+        result = {"total_rows": total_rows, "bad_rows": bad_rows, "nonfinite": nonfinite}
+
+        # DECISION TIME
+        if bad_rows == 0:
+            return name, dict(result, verdict="OK", **fingerprint), None
+
+        msg = f"⚠️  {name}: {bad_rows}/{total_rows} points ({damage_ratio:.1%}) out of bounds."
+
+        if damage_ratio > DESTRUCTION_THRESHOLD:
+            del data, content
+            shutil.move(file_path, os.path.join(QUARANTINE_DIR, name))
+            return name, dict(result, verdict="QUARANTINE"), msg + "\n   ⛔ Moved to Quarantine (Too damaged)."
+
+        write_fixed(file_path, content, data)
+        # Fingerprint of the rewritten file, so the next run skips it
+        return name, dict(result, verdict="FIXED", **file_fingerprint(file_path)), \
+            msg + "\n   ✅ Clipped and Saved."
+
     except Exception as e:
-        print(f"Failed to save {file_path}: {e}")
-        return "SAVE_ERR"
+        return name, {"verdict": "ERR", "error": str(e)}, f"❌ {name}: {e}"
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
 
 # ==========================================
 # MAIN
@@ -121,28 +198,30 @@ def main():
         return
 
     os.makedirs(QUARANTINE_DIR, exist_ok=True)
-    
-    files = glob.glob(os.path.join(DATA_DIR, "*.npy"))
-    print(f"🔍 Scanning {len(files)} files in {DATA_DIR}...")
+
+    files = sorted(glob.glob(os.path.join(DATA_DIR, "*.npy")))
+    manifest = load_manifest()
+    print(f"🔍 Scanning {len(files)} files in {DATA_DIR} on {N_CORES} cores...")
     print(f"   Limits: Vel > {MAX_VELOCITY} m/s, Press > {MAX_PRESSURE} Pa")
 
-    stats = {"OK": 0, "FIXED": 0, "QUARANTINE": 0, "ERR": 0}
-
-    for f in files:
-        result = check_and_fix(f)
-        
-        if result == "OK":
-            stats["OK"] += 1
-        elif result == "FIXED":
-            stats["FIXED"] += 1
-            print(f"   ✅ Clipped and Saved.")
-        elif result == "QUARANTINE":
-            stats["QUARANTINE"] += 1
-            dst = os.path.join(QUARANTINE_DIR, os.path.basename(f))
-            shutil.move(f, dst)
-            print(f"   ⛔ Moved to Quarantine (Too damaged).")
-        else:
-            stats["ERR"] += 1
+    stats = {"OK": 0, "FIXED": 0, "QUARANTINE": 0, "ERR": 0, "SKIPPED": 0}
+    jobs = [(f, manifest.get(os.path.basename(f))) for f in files]
+
+    with Pool(N_CORES) as pool:
+        for i, (name, entry, msg) in enumerate(pool.imap_unordered(check_and_fix, jobs)):
+            if entry.pop("skipped", False):
+                stats["SKIPPED"] += 1
+            elif entry["verdict"] in stats:
+                stats[entry["verdict"]] += 1
+            else:
+                stats["ERR"] += 1
+            manifest[name] = entry
+
+            if msg: print(msg)
+            # Persist progress so an interrupted run resumes where it stopped
+            if (i + 1) % 100 == 0: save_manifest(manifest)
+
+    save_manifest(manifest)
 
     print("\n" + "="*30)
     print("SUMMARY")
@@ -151,7 +230,9 @@ def main():
     print(f"🟡 Fixed (Clipped): {stats['FIXED']}")
     print(f"🔴 Quarantined:     {stats['QUARANTINE']}")
     print(f"❌ Errors:          {stats['ERR']}")
+    print(f"⏭️  Unchanged:       {stats['SKIPPED']}")
     print("="*30)
+    print(f"Manifest: {MANIFEST_PATH}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -3,7 +3,7 @@ import shutil
 import sys
 
 # TARGET FOLDERS
-TARGETS = ["extracted_data"]
+TARGETS = ["extracted_data", "extracted_data_parquet"]
 
 def clean_vis():
     print(f"WARNING: You are about to DELETE the directories: {TARGETS}")
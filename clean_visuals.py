@@ -3,7 +3,7 @@ import shutil
 import sys
 
 # TARGET FOLDERS
-TARGETS = ["sample_visualization"]
+TARGETS = ["sample_visualization", "training_visuals"]
 
 def clean_vis():
     print(f"WARNING: You are about to DELETE the directories: {TARGETS}")
@@ -0,0 +1,277 @@
+"""
+dataset_stats.py - Global Dataset Normalization Statistics
+
+PURPOSE:
+    Computes exact global and per-shape statistics for all 12 columns of a
+    dataset in one parallel pass, and stores them next to the data so both
+    trainers (and any inference code) normalize targets with the same fixed
+    constants instead of per-sample max/mean/std.
+
+USAGE:
+    python dataset_stats.py                                  # ./data_output
+    python dataset_stats.py --data-dir ./extracted_data      # train_amg.py data
+
+    stats = load_dataset_stats("./data_output")
+    norms = build_target_norms(stats, per_shape=True)    # {shape or None: (mean, std)}
+    norms = resolve_target_norms(data_dir, "global", files)   # trainer entry point
+    y_norm = (y - mean) / std        ...        y = denormalize_targets(pred, mean, std)
+
+OUTPUT:
+    <data_dir>/dataset_stats.json
+        columns              : the 12 column names
+        global / shapes.<s>  : count, mean, var, std, min, max, hist (per column)
+        hist_edges           : bin edges in symlog space (see symlog_inverse)
+        files                : case files included, skipped_rows : non-finite rows dropped
+
+NOTES:
+    - Each worker reduces its files chunk-wise with Welford-style accumulators
+      (count, mean, M2); results are merged with Chan's pairwise formula in
+      file order, so the output does not depend on scheduling.
+    - Histograms use fixed symmetric-log bins, which merge exactly without a
+      first pass for min/max and cover every column from flags to pressure.
+    - Rows containing NaN/Inf are excluded and counted.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+
+# --- Configuration ---
+DATA_DIR = "./data_output"
+FILE_PATTERN = "*.npy"
+STATS_FILENAME = "dataset_stats.json"
+N_CORES = min(8, os.cpu_count() or 1)
+CHUNK_ROWS = 1 << 20
+
+COLUMNS = ["x", "y", "z", "u", "v", "w", "p", "y_wall", "is_fluid", "is_wall", "is_inlet", "is_outlet"]
+TARGET_COLUMNS = slice(3, 7)   # u, v, w, p
+
+# Symmetric-log histogram: t = sign(x) * log10(1 + |x| / HIST_LINTHRESH), 16 decades each side
+HIST_BINS = 256
+HIST_LINTHRESH = 1e-6
+HIST_RANGE = 16.0
+HIST_EDGES = np.linspace(-HIST_RANGE, HIST_RANGE, HIST_BINS + 1)
+
+def symlog(x):
+    return np.sign(x) * np.log10(1.0 + np.abs(x) / HIST_LINTHRESH)
+
+def symlog_inverse(t):
+    return np.sign(t) * HIST_LINTHRESH * (10.0 ** np.abs(t) - 1.0)
+
+# ==========================================
+# 1. Mergeable Accumulator
+# ==========================================
+
+class ColumnStats:
+    """Per-column count, mean, M2, min, max and histogram; merge() combines two exactly."""
+    def __init__(self, n_cols=len(COLUMNS)):
+        self.count = 0
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+        self.min = np.full(n_cols, np.inf)
+        self.max = np.full(n_cols, -np.inf)
+        self.hist = np.zeros((n_cols, HIST_BINS), dtype=np.int64)
+        self.skipped_rows = 0
+        self.num_files = 0
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        finite = np.isfinite(block).all(axis=1)
+        self.skipped_rows += int(block.shape[0] - np.count_nonzero(finite))
+        block = block[finite]
+        if block.shape[0] == 0:
+            return
+
+        chunk = ColumnStats(block.shape[1])
+        chunk.count = block.shape[0]
+        chunk.mean = block.mean(axis=0)
+        chunk.m2 = ((block - chunk.mean) ** 2).sum(axis=0)
+        chunk.min = block.min(axis=0)
+        chunk.max = block.max(axis=0)
+
+        # Bin index per value, offset per column so one bincount fills all histograms
+        t = (symlog(block) + HIST_RANGE) * (HIST_BINS / (2 * HIST_RANGE))
+        bins = np.clip(t.astype(np.int64), 0, HIST_BINS - 1) + np.arange(block.shape[1]) * HIST_BINS
+        chunk.hist = np.bincount(bins.ravel(), minlength=block.shape[1] * HIST_BINS) \
+                       .reshape(block.shape[1], HIST_BINS)
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count > 0:
+            n = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean = self.mean + delta * (other.count / n)
+            self.m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / n)
+            self.count = n
+            self.min = np.minimum(self.min, other.min)
+            self.max = np.maximum(self.max, other.max)
+            self.hist = self.hist + other.hist
+        self.skipped_rows += other.skipped_rows
+        self.num_files += other.num_files
+
+    def to_dict(self):
+        var = self.m2 / self.count if self.count > 0 else np.full_like(self.m2, np.nan)
+        return {
+            "count": self.count,
+            "num_files": self.num_files,
+            "skipped_rows": self.skipped_rows,
+            "mean": self.mean.tolist(),
+            "var": var.tolist(),
+            "std": np.sqrt(var).tolist(),
+            "min": self.min.tolist(),
+            "max": self.max.tolist(),
+            "hist": self.hist.tolist(),
+        }
+
+# ==========================================
+# 2. Loading
+# ==========================================
+
+def shape_from_path(file_path):
+    """generate_dataset.py names cases '<shape>_<id>.npy'."""
+    return os.path.splitext(os.path.basename(file_path))[0].rsplit("_", 1)[0]
+
+def load_case(file_path):
+    """Returns (shape_name, (N, 12) array). Plain .npy arrays are memory-mapped."""
+    if file_path.endswith(".npz"):
+        return shape_from_path(file_path), np.load(file_path)['data']
+    try:
+        return shape_from_path(file_path), np.load(file_path, mmap_mode='r')
+    except ValueError:
+        pass  # Object array (pickled dict): cannot be memory-mapped
+
+    content = np.load(file_path, allow_pickle=True).item()
+    return content.get("shape_name", shape_from_path(file_path)), content['data']
+
+def process_file(file_path):
+    try:
+        shape_name, data = load_case(file_path)
+        if data.ndim != 2 or data.shape[1] != len(COLUMNS):
+            return file_path, None, None, f"Err: {os.path.basename(file_path)} - shape {data.shape}"
+        stats = ColumnStats()
+        for start in range(0, data.shape[0], CHUNK_ROWS):
+            stats.update(data[start:start + CHUNK_ROWS])
+        stats.num_files = 1
+        return file_path, shape_name, stats, None
+    except Exception as e:
+        return file_path, None, None, f"Err: {os.path.basename(file_path)} - {e}"
+
+# ==========================================
+# 3. Consumers (trainers / inference)
+# ==========================================
+
+def load_dataset_stats(data_dir, filename=STATS_FILENAME):
+    path = os.path.join(data_dir, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def target_normalizer(entry, eps=1e-8):
+    """(mean, std) float32 arrays for (u, v, w, p). Constant columns (e.g. w in 2D) get std 1."""
+    mean = np.asarray(entry["mean"][TARGET_COLUMNS], dtype=np.float32)
+    std = np.asarray(entry["std"][TARGET_COLUMNS], dtype=np.float32)
+    return mean, np.where(std > eps, std, 1.0).astype(np.float32)
+
+def build_target_norms(stats, per_shape=False):
+    """{shape_name: (mean, std)} plus the global normalizer under key None."""
+    norms = {None: target_normalizer(stats["global"])}
+    if per_shape:
+        for shape_name, entry in stats["shapes"].items():
+            norms[shape_name] = target_normalizer(entry)
+    return norms
+
+def lookup_target_norm(norms, file_path):
+    return norms.get(shape_from_path(file_path), norms[None])
+
+def denormalize_targets(y, mean, std):
+    """Maps normalized (..., 4) predictions back to physical units."""
+    return y * std + mean
+
+def check_stats_coverage(stats, file_list):
+    """Warns if cases were added after the statistics were computed."""
+    known = set(stats.get("files", []))
+    missing = [f for f in file_list if os.path.basename(f) not in known]
+    if missing:
+        print(f"Warning: {len(missing)} cases are not in {STATS_FILENAME}; rerun dataset_stats.py")
+
+def resolve_target_norms(data_dir, mode, file_list):
+    """
+    Trainer helper for the "target_norm" config key: "global" / "shape" return fixed
+    normalizers from <data_dir>/dataset_stats.json, "sample" (or missing stats) returns None.
+    """
+    if mode == "sample":
+        return None
+    stats = load_dataset_stats(data_dir)
+    if stats is None:
+        print(f"Warning: no {STATS_FILENAME} in {data_dir} (run dataset_stats.py); "
+              f"falling back to per-sample target normalization")
+        return None
+    check_stats_coverage(stats, file_list)
+    norms = build_target_norms(stats, per_shape=(mode == "shape"))
+    mean, std = norms[None]
+    print(f"Target normalization '{mode}': mean {np.round(mean, 4).tolist()}, std {np.round(std, 4).tolist()}")
+    return norms
+
+# ==========================================
+# 4. Main
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute global/per-shape dataset statistics.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--pattern", default=FILE_PATTERN)
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.data_dir, args.pattern)))
+    if not files:
+        print(f"No files found in {os.path.join(args.data_dir, args.pattern)}")
+        sys.exit(1)
+
+    print(f"Computing statistics for {len(files)} cases on {args.cores} cores...")
+    results = {}
+    with Pool(args.cores) as pool:
+        for i, (file_path, shape_name, stats, err) in enumerate(pool.imap_unordered(process_file, files)):
+            if err: print(err)
+            else: results[file_path] = (shape_name, stats)
+            pct = ((i+1)/len(files))*100
+            sys.stdout.write(f"\rProgress: {pct:.1f}%")
+            sys.stdout.flush()
+
+    # Merge in file order so the output is independent of worker scheduling
+    global_stats = ColumnStats()
+    shape_stats = {}
+    for file_path in sorted(results):
+        shape_name, stats = results[file_path]
+        shape_stats.setdefault(shape_name, ColumnStats()).merge(stats)
+        global_stats.merge(stats)
+
+    out = {
+        "columns": COLUMNS,
+        "global": global_stats.to_dict(),
+        "shapes": {name: s.to_dict() for name, s in sorted(shape_stats.items())},
+        "hist_edges": HIST_EDGES.tolist(),
+        "hist_linthresh": HIST_LINTHRESH,
+        "files": [os.path.basename(f) for f in sorted(results)],
+    }
+    out_path = os.path.join(args.data_dir, STATS_FILENAME)
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(out, f)
+    os.replace(tmp_path, out_path)
+
+    g = out["global"]
+    print(f"\n{'column':<10}{'mean':>13}{'std':>13}{'min':>13}{'max':>13}")
+    for c, name in enumerate(COLUMNS):
+        print(f"{name:<10}{g['mean'][c]:>13.4g}{g['std'][c]:>13.4g}{g['min'][c]:>13.4g}{g['max'][c]:>13.4g}")
+    print(f"{g['count']} rows, {g['skipped_rows']} non-finite rows skipped, "
+          f"{len(shape_stats)} shapes -> {out_path}")
+
+if __name__ == "__main__":
+    main()
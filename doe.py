@@ -0,0 +1,229 @@
+"""
+doe.py - Design of Experiments for Dataset Generation
+
+PURPOSE:
+    Replaces independent random.uniform / random.choice draws with space-filling
+    designs over each shape's parameter space, so fewer simulations cover it evenly.
+    - sobol   : scrambled Sobol sequence (extensions continue the same sequence)
+    - lhs     : Latin hypercube
+    - maximin : greedy maximin selection from a large Latin hypercube candidate pool
+    All parameter bounds are declared once below (SHAPE_PARAMS / COMMON_PARAMS).
+    Designs can be extended: new points never repeat an existing one, and LHS /
+    maximin extensions are pushed away from the existing points.
+
+USAGE:
+    points = extend_design("valve", n_new=16, method="sobol", seed=0,
+                           existing=[...], base=base_space(LENGTHS, DIAMETERS, VELOCITIES, REFINEMENTS))
+    # -> [{"L": 5.0, "D": 0.25, "Ux": 0.5, "ref": 4,
+    #      "params": {"valve_opening": 0.41, ..., "nu_val": 1.1e-06, "turb_intensity": 0.07}}, ...]
+
+    python doe.py --shape venturi --n 64 --method sobol     # prints the design + discrepancy
+
+NOTES:
+    - generate_dataset.py keeps its design in data_output/doe_design.json; raising
+      SAMPLES_PER_SHAPE extends it instead of redrawing.
+    - Values are rounded to each parameter's decimals (as the old random draws were),
+      so duplicates are checked after rounding.
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+from scipy.stats import qmc
+
+# ==========================================
+# 1. Parameter Space
+# ==========================================
+
+class Continuous:
+    def __init__(self, low, high, decimals=None):
+        self.low, self.high, self.decimals = low, high, decimals
+
+    def decode(self, u):
+        v = self.low + float(u) * (self.high - self.low)
+        return round(v, self.decimals) if self.decimals is not None else v
+
+    def encode(self, v):
+        return (float(v) - self.low) / (self.high - self.low)
+
+class Choice:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def decode(self, u):
+        return self.values[min(int(float(u) * len(self.values)), len(self.values) - 1)]
+
+    def encode(self, v):
+        return (self.values.index(v) + 0.5) / len(self.values)
+
+# Shape-specific geometry parameters (passed to shapes.<shape>.generate)
+SHAPE_PARAMS = {
+    "straight": {},
+    "valve": {
+        "valve_opening": Continuous(0.15, 0.85, 2),
+        "valve_thickness": Continuous(0.1, 0.5, 2),
+    },
+    "obstacle": {
+        "obs_size": Continuous(0.2, 0.5, 2),
+        "obs_offset": Continuous(-0.25, 0.25, 2),
+    },
+    "venturi": {
+        "throat_ratio": Continuous(0.3, 0.7, 2),
+        "conv_len_ratio": Continuous(0.15, 0.35, 2),
+        "div_len_ratio": Continuous(0.3, 0.6, 2),
+    },
+    "bend": {
+        "bend_angle": Choice([45, 90]),
+        "bend_radius": Continuous(1.0, 2.5, 2),
+    },
+    "manifold": {
+        "branch_width_ratio": Continuous(0.5, 0.9, 2),
+        "branch_height_ratio": Continuous(1.5, 3.0, 2),
+    },
+}
+
+# Physics parameters shared by every shape
+COMMON_PARAMS = {
+    "nu_val": Continuous(0.8e-6, 1.3e-6, 9),
+    "turb_intensity": Continuous(0.01, 0.15, 3),
+}
+
+BASE_KEYS = ("L", "D", "Ux", "ref")
+
+def base_space(lengths, diameters, velocities, refinements):
+    """Case-level settings from generate_dataset.py's lists, as discrete dimensions."""
+    return {"L": Choice(lengths), "D": Choice(diameters), "Ux": Choice(velocities), "ref": Choice(refinements)}
+
+def parameter_space(shape, base):
+    """Ordered {name: dimension}; single-valued choices are constants, not dimensions."""
+    space = {**base, **SHAPE_PARAMS[shape], **COMMON_PARAMS}
+    return {k: v for k, v in space.items() if not (isinstance(v, Choice) and len(v.values) == 1)}
+
+def decode_point(u, space, base):
+    values = {k: dim.decode(x) for (k, dim), x in zip(space.items(), u)}
+    point = {k: values[k] if k in values else base[k].values[0] for k in BASE_KEYS}
+    point["params"] = {k: v for k, v in values.items() if k not in BASE_KEYS}
+    return point
+
+def encode_point(point, space):
+    flat = {**{k: point[k] for k in BASE_KEYS}, **point["params"]}
+    return np.array([dim.encode(flat[k]) for k, dim in space.items()])
+
+def point_key(point):
+    return json.dumps({**{k: point[k] for k in BASE_KEYS}, **point["params"]}, sort_keys=True)
+
+# ==========================================
+# 2. Samplers (unit hypercube)
+# ==========================================
+
+def sobol_points(n, d, seed, skip=0):
+    sampler = qmc.Sobol(d, scramble=True, seed=seed)
+    if skip:
+        sampler.fast_forward(skip)
+    return sampler.random(n)
+
+def lhs_points(n, d, seed):
+    return qmc.LatinHypercube(d, seed=seed).random(n)
+
+def maximin_points(n, d, seed, existing=None, pool_factor=50):
+    """Greedy maximin: repeatedly take the candidate farthest from everything chosen so far."""
+    candidates = lhs_points(max(pool_factor * n, 1000), d, seed)
+    if existing is not None and len(existing):
+        dmin = cKDTree(existing).query(candidates)[0]
+    else:
+        dmin = np.full(len(candidates), np.inf)
+    chosen = []
+    for _ in range(min(n, len(candidates))):
+        i = int(np.argmax(dmin))
+        chosen.append(i)
+        dmin = np.minimum(dmin, np.linalg.norm(candidates - candidates[i], axis=1))
+        dmin[i] = -np.inf
+    return candidates[chosen]
+
+# ==========================================
+# 3. Designs
+# ==========================================
+
+def extend_design(shape, n_new, method="sobol", seed=0, existing=(), base=None):
+    """
+    n_new design points for `shape` that do not repeat any of `existing` (same
+    point format as returned). Sobol continues its sequence after the existing
+    points; LHS / maximin candidates are chosen by distance to existing points.
+    """
+    space = parameter_space(shape, base)
+    d = max(len(space), 1)
+    seen = {point_key(p) for p in existing}
+
+    new_points = []
+    skip, attempt = len(existing), 0
+    while len(new_points) < n_new and attempt < 20:
+        want = n_new - len(new_points)
+        if method == "sobol":
+            u = sobol_points(want, d, seed, skip=skip)
+            skip += want
+        elif method == "lhs" and not existing and not new_points:
+            u = lhs_points(want, d, seed)
+        elif method in ("lhs", "maximin"):
+            # Extending an LHS breaks its stratification anyway; keep extensions space-filling
+            ref = [encode_point(p, space) for p in [*existing, *new_points]]
+            u = maximin_points(want, d, seed + attempt, existing=np.array(ref) if ref else None)
+        else:
+            raise ValueError(f"Unknown DOE method '{method}'")
+
+        for row in u:
+            point = decode_point(row, space, base)
+            key = point_key(point)
+            if key not in seen:
+                seen.add(key)
+                new_points.append(point)
+        attempt += 1
+
+    if len(new_points) < n_new:
+        print(f"Warning: {shape}: only {len(new_points)}/{n_new} distinct points "
+              f"(parameter space is too small after rounding)")
+    return new_points
+
+def design_discrepancy(points, shape, base):
+    """Centered L2 discrepancy of a design in unit space (lower = more uniform)."""
+    space = parameter_space(shape, base)
+    if len(points) < 2 or not space:
+        return float("nan")
+    return float(qmc.discrepancy(np.array([encode_point(p, space) for p in points])))
+
+def load_design(path):
+    if not os.path.exists(path):
+        return {"next_id": None, "shapes": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_design(design, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(design, f, indent=1)
+    os.replace(tmp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a space-filling design for one shape.")
+    parser.add_argument("--shape", default="venturi", choices=list(SHAPE_PARAMS))
+    parser.add_argument("--n", type=int, default=32)
+    parser.add_argument("--method", default="sobol", choices=["sobol", "lhs", "maximin"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    base = base_space([5.0], [0.25], [0.5], [2, 4, 6, 8])
+    points = extend_design(args.shape, args.n, args.method, args.seed, base=base)
+    for p in points:
+        print(p)
+
+    # Same number of independent uniform draws, for comparison
+    rng = np.random.default_rng(args.seed)
+    space = parameter_space(args.shape, base)
+    random_points = [decode_point(rng.random(len(space)), space, base) for _ in range(args.n)]
+    print(f"\nCentered L2 discrepancy: {args.method} {design_discrepancy(points, args.shape, base):.5f} "
+          f"| random {design_discrepancy(random_points, args.shape, base):.5f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+export_parquet.py - Columnar Dataset Export (Parquet / Arrow)
+
+PURPOSE:
+    Converts the generated cases (data_output/*.npy, legacy *.npz) into one typed,
+    compressed Parquet dataset partitioned by shape, with every case parameter
+    as a column. Downstream tools read only the columns they need and skip files
+    and row groups that cannot match a filter, instead of parsing text CSV.
+
+USAGE:
+    python export_parquet.py
+    python export_parquet.py --input-dir data_output --output-dir extracted_data_parquet --cores 8
+    python export_parquet.py --query "shape_name = 'valve'"     # case catalog selection
+
+    import pyarrow.dataset as ds
+    from export_parquet import open_dataset
+    table = open_dataset().to_table(
+        columns=["case", "x", "y", "u", "v", "p"],
+        filter=(ds.field("shape_name") == "valve") & (ds.field("valve_opening") > 0.5))
+
+OUTPUT:
+    <OUTPUT_DIR>/shape_name=<shape>/<case>.parquet   (hive partitioning)
+    Columns:
+        case                                : string (dictionary encoded)
+        x, y, z, u, v, w, p, y_wall         : float64
+        is_fluid, is_wall, is_inlet, is_outlet : bool
+        L, D, Ux, ref, nu_val, ...          : case parameters, one column each (constant per case)
+
+NOTES:
+    - One output file per case, so workers never share a writer. Files are written
+      to a temp name and renamed; reruns skip cases whose output is newer than the input.
+    - Param columns differ between shapes; open_dataset() unifies the schemas
+      (missing params read as null).
+    - Requires pyarrow (pip install pyarrow).
+"""
+
+import argparse
+import glob
+import os
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# --- Configuration ---
+INPUT_DIR = "data_output"
+OUTPUT_DIR = "extracted_data_parquet"
+N_CORES = min(8, os.cpu_count() or 1)
+COMPRESSION = "zstd"
+ROW_GROUP_SIZE = 256 * 1024   # Rows per row group (unit of min/max filter skipping)
+
+FIELD_COLUMNS = ["x", "y", "z", "u", "v", "w", "p", "y_wall"]
+FLAG_COLUMNS = ["is_fluid", "is_wall", "is_inlet", "is_outlet"]
+
+def load_case(file_path):
+    """Returns (data [N, 12], shape_name, params) for dict .npy, raw .npy and legacy .npz cases."""
+    case = os.path.splitext(os.path.basename(file_path))[0]
+    default_shape = case.rsplit("_", 1)[0]
+    raw = np.load(file_path, allow_pickle=True)
+
+    # .npz: new single 'data' array, or the old separate-array layout
+    if isinstance(raw, np.lib.npyio.NpzFile):
+        if 'data' in raw:
+            return raw['data'], default_shape, {}
+        if 'pos' in raw:
+            # Old files might have 'k' and 'epsilon'; they are omitted to keep the 12-column layout
+            data = np.hstack((raw['pos'], raw['U'], raw['p'].reshape(-1, 1),
+                              raw['y'].reshape(-1, 1), raw['type']))
+            return data, default_shape, {}
+        raise ValueError("Unknown file structure")
+
+    # 0-D array wrapping {"data", "shape_name", "params"}
+    if raw.ndim == 0:
+        content = raw.item()
+        return content['data'], content.get("shape_name", default_shape), content.get("params", {})
+
+    return raw, default_shape, {}
+
+def case_table(case, data, params):
+    n = data.shape[0]
+    columns = {"case": pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), [case])}
+    for c, name in enumerate(FIELD_COLUMNS):
+        columns[name] = pa.array(data[:, c].astype(np.float64))
+    for c, name in enumerate(FLAG_COLUMNS):
+        columns[name] = pa.array(data[:, len(FIELD_COLUMNS) + c] > 0.5)
+    for key, value in sorted(params.items()):
+        # Scalars become typed constant columns; anything else is stored as its string form
+        if isinstance(value, (bool, int, float, np.number)):
+            columns[key] = pa.array(np.full(n, value))
+        else:
+            columns[key] = pa.array([str(value)] * n)
+    return pa.table(columns)
+
+def export_case(job):
+    file_path, output_dir = job
+    case = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        data, shape_name, params = load_case(file_path)
+        if data.ndim != 2 or data.shape[1] != 12:
+            return f"Skipping {case}: Expected 12 columns, found shape {data.shape}"
+
+        part_dir = os.path.join(output_dir, f"shape_name={shape_name}")
+        out_path = os.path.join(part_dir, f"{case}.parquet")
+        if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(file_path):
+            return None
+
+        os.makedirs(part_dir, exist_ok=True)
+        # Dot-prefixed: dataset discovery skips it while it is being written
+        tmp_path = os.path.join(part_dir, f".{case}.parquet.tmp")
+        pq.write_table(case_table(case, data, params), tmp_path,
+                       compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, out_path)
+        return None
+    except Exception as e:
+        return f"Error converting {case}: {e}"
+
+def open_dataset(path=OUTPUT_DIR):
+    """pyarrow Dataset over the export with per-shape param columns unified into one schema."""
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    schema = pa.unify_schemas([frag.physical_schema for frag in dataset.get_fragments()] +
+                              [dataset.partitioning.schema])
+    return ds.dataset(path, schema=schema, format="parquet", partitioning="hive")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export cases to a shape-partitioned Parquet dataset.")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    parser.add_argument("--query", default=None, help="SQL WHERE clause on <input-dir>/catalog.sqlite")
+    args = parser.parse_args()
+
+    if args.query:
+        from case_catalog import query_cases
+        files = query_cases(args.query, args.input_dir)
+    else:
+        files = sorted(glob.glob(os.path.join(args.input_dir, "*.npy")) +
+                       glob.glob(os.path.join(args.input_dir, "*.npz")))
+    if not files:
+        print(f"No .npy/.npz files found in {args.input_dir}")
+        return
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    print(f"Exporting {len(files)} cases to Parquet ({COMPRESSION}) on {args.cores} cores...")
+
+    errors = 0
+    with Pool(args.cores) as pool:
+        jobs = [(f, args.output_dir) for f in files]
+        for i, res in enumerate(pool.imap_unordered(export_case, jobs)):
+            if res:
+                errors += 1
+                print(f"\n{res}")
+            pct = ((i+1)/len(files))*100
+            sys.stdout.write(f"\rProgress: {pct:.1f}%")
+            sys.stdout.flush()
+
+    print("\nConversion Complete.")
+    print(f"Converted {len(files) - errors} cases ({errors} failed).")
+    print(f"Data saved to: {os.path.abspath(args.output_dir)}")
+
+if __name__ == "__main__":
+    main()
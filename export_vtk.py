@@ -0,0 +1,468 @@
+"""
+export_vtk.py - Batch VTK Export for ParaView
+
+PURPOSE:
+    Converts any selection of cases to ParaView files in parallel. Replaces
+    output_10.py (10 random dict .npy cases) and check_raw_results.py (legacy
+    .npz layout). Arrays are written straight from numpy, with no intermediate
+    PyVista objects:
+    - vtp               : one XML PolyData file per case, binary appended + zlib
+    - vtkhdf            : one VTKHDF PolyData file per case, gzip-chunked HDF5
+    - vtkhdf-multiblock : all cases in a single VTKHDF PartitionedDataSetCollection,
+                          grouped by shape in the assembly
+    With --checkpoint, model predictions (U_pred, p_pred) and error fields
+    (U_error, U_error_mag, p_error) are added next to the CFD fields.
+
+USAGE:
+    python export_vtk.py                                        # 10 random data_output/ cases as .vtp
+    python export_vtk.py --sample 0 --where shape_name=valve --where "valve_opening>0.5"
+    python export_vtk.py --glob "data_output/*.npz"             # legacy layout (k is kept)
+    python export_vtk.py --sample 0 --query "shape_name = 'venturi' AND refinement = 6"
+    python export_vtk.py --format vtkhdf-multiblock --sample 0
+    python export_vtk.py --checkpoint weights/best_model.pth --model pointnet
+    python export_vtk.py --glob "extracted_data/*.npy" --checkpoint best_amg_model.pth --model amg
+
+OUTPUT:
+    <OUTPUT_DIR>/<case>.vtp | <case>.vtkhdf | cases.vtkhdf
+    Point data : U, p, y_wall, is_fluid, is_wall, is_inlet, is_outlet, Zone_ID (+ k, predictions)
+    Field data : case params, Shape_Name (vtp only)
+
+NOTES:
+    - --query selects cases from <data dir>/catalog.sqlite (case_catalog.py) without
+      opening any array; the data dir is taken from --glob.
+    - --where filters on shape_name, case, num_points and any case param
+      (ops: = != < <= > >=); it runs before --sample, so "--sample 10 --where ..."
+      picks 10 random matching cases.
+    - Predictions run in every worker on --device. CUDA forces a single worker;
+      PointNet sees the full point cloud at once, so very large meshes need memory.
+    - Predictions are mapped to physical units with dataset_stats.json (from the
+      case directory) when the model was trained with target_norm "global"/"shape".
+    - Requires h5py for the vtkhdf formats; torch + the trainer module for --checkpoint.
+"""
+
+import argparse
+import glob
+import os
+import random
+import re
+import shutil
+import sys
+import zlib
+from multiprocessing import Pool
+
+import numpy as np
+
+# --- Configuration ---
+INPUT_GLOB = "data_output/*.npy"
+OUTPUT_DIR = "sample_visualization"
+N_CORES = min(8, os.cpu_count() or 1)
+COMPRESSION_LEVEL = 6
+ZLIB_BLOCK_SIZE = 1 << 16     # Uncompressed bytes per VTK zlib block
+
+FORMAT_EXTENSIONS = {"vtp": ".vtp", "vtkhdf": ".vtkhdf", "vtkhdf-multiblock": ".vtkhdf"}
+
+# ==========================================
+# 1. Case Loading & Selection
+# ==========================================
+
+def load_case(file_path):
+    """Returns (data [N, 12], shape_name, params, extra point fields) for all case layouts."""
+    case = os.path.splitext(os.path.basename(file_path))[0]
+    default_shape = case.rsplit("_", 1)[0]
+    raw = np.load(file_path, allow_pickle=True)
+
+    if isinstance(raw, np.lib.npyio.NpzFile):
+        if 'data' in raw:
+            return raw['data'], default_shape, {}, {}
+        # Old layout: separate arrays, with k
+        data = np.hstack((raw['pos'], raw['U'], raw['p'].reshape(-1, 1),
+                          raw['y'].reshape(-1, 1), raw['type']))
+        extra = {"k": raw['k'].reshape(-1)} if 'k' in raw else {}
+        return data, default_shape, {}, extra
+
+    # 0-D array wrapping the dictionary
+    if raw.ndim == 0:
+        content = raw.item()
+        return content['data'], content.get("shape_name", default_shape), content.get("params", {}), {}
+
+    # Direct (N, 12) array (extracted_data)
+    return raw, default_shape, {}, {}
+
+def parse_where(expr):
+    m = re.match(r"^\s*(\w+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*$", expr)
+    if not m:
+        raise ValueError(f"Bad --where expression '{expr}' (expected key<op>value)")
+    key, op, value = m.groups()
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    return key, op, value
+
+def matches(meta, predicates):
+    ops = {"=": lambda a, b: a == b, "!=": lambda a, b: a != b,
+           "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+           ">": lambda a, b: a > b, ">=": lambda a, b: a >= b}
+    for key, op, value in predicates:
+        if key not in meta:
+            return False
+        try:
+            if not ops[op](meta[key], value):
+                return False
+        except TypeError:   # e.g. string param compared to a number
+            return False
+    return True
+
+def case_metadata(file_path):
+    data, shape_name, params, _ = load_case(file_path)
+    return {"case": os.path.splitext(os.path.basename(file_path))[0], "shape_name": shape_name,
+            "num_points": int(data.shape[0]), **params}
+
+def _filter_job(job):
+    file_path, predicates = job
+    try:
+        return file_path if matches(case_metadata(file_path), predicates) else None
+    except Exception:
+        return None
+
+# ==========================================
+# 2. Writers
+# ==========================================
+
+def _vtk_type(arr):
+    kinds = {"f": "Float", "i": "Int", "u": "UInt", "b": "UInt"}
+    return f"{kinds[arr.dtype.kind]}{8 * arr.dtype.itemsize}"
+
+def _zlib_payload(raw, level):
+    """VTK compressed-block layout: UInt64 header [nblocks, blocksize, lastsize, csize_i...] + blocks."""
+    blocks = [raw[i:i + ZLIB_BLOCK_SIZE] for i in range(0, len(raw), ZLIB_BLOCK_SIZE)]
+    compressed = [zlib.compress(b, level) for b in blocks]
+    header = np.array([len(blocks), ZLIB_BLOCK_SIZE, len(raw) % ZLIB_BLOCK_SIZE] +
+                      [len(c) for c in compressed], dtype="<u8")
+    return header.tobytes() + b"".join(compressed)
+
+def write_vtp(path, points, point_data, field_data, level=COMPRESSION_LEVEL):
+    appended = []
+    offset = 0
+
+    def data_array(arr, name=None, n_tuples=None):
+        nonlocal offset
+        attrs = f' Name="{name}"' if name else ""
+        if isinstance(arr, str):
+            raw, vtk_type, n_comp = arr.encode() + b"\0", "String", 1
+        else:
+            arr = np.ascontiguousarray(arr, dtype=arr.dtype.newbyteorder("<"))
+            raw, vtk_type = arr.tobytes(), _vtk_type(arr)
+            n_comp = arr.shape[1] if arr.ndim == 2 else 1
+        if n_tuples is not None:
+            attrs += f' NumberOfTuples="{n_tuples}"'
+        payload = _zlib_payload(raw, level)
+        xml = f'<DataArray type="{vtk_type}"{attrs} NumberOfComponents="{n_comp}" ' \
+              f'format="appended" offset="{offset}"/>'
+        appended.append(payload)
+        offset += len(payload)
+        return xml
+
+    n = len(points)
+    lines = ['<?xml version="1.0"?>',
+             '<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" '
+             'header_type="UInt64" compressor="vtkZLibDataCompressor">',
+             '  <PolyData>',
+             '    <FieldData>']
+    for name, value in field_data.items():
+        lines.append('      ' + data_array(value, name, n_tuples=1))
+    lines += ['    </FieldData>',
+              f'    <Piece NumberOfPoints="{n}" NumberOfVerts="{n}" NumberOfLines="0" '
+              'NumberOfStrips="0" NumberOfPolys="0">',
+              '      <PointData>']
+    for name, arr in point_data.items():
+        lines.append('        ' + data_array(arr, name))
+    lines += ['      </PointData>',
+              '      <Points>',
+              '        ' + data_array(points),
+              '      </Points>',
+              '      <Verts>',
+              '        ' + data_array(np.arange(n, dtype=np.int64), "connectivity"),
+              '        ' + data_array(np.arange(1, n + 1, dtype=np.int64), "offsets"),
+              '      </Verts>',
+              '    </Piece>',
+              '  </PolyData>',
+              '  <AppendedData encoding="raw">']
+
+    with open(path, "wb") as f:
+        f.write("\n".join(lines).encode() + b"\n   _")
+        for payload in appended:
+            f.write(payload)
+        f.write(b"\n  </AppendedData>\n</VTKFile>\n")
+
+def _write_polydata_group(root, points, point_data, field_data, level):
+    def dataset(group, name, arr):
+        # Zero-size datasets cannot be chunked
+        kw = {"compression": "gzip", "compression_opts": level, "chunks": True} if arr.size else {}
+        group.create_dataset(name, data=arr, **kw)
+
+    n = len(points)
+    root.attrs["Version"] = np.array([2, 1], dtype=np.int64)
+    root.attrs["Type"] = np.bytes_("PolyData")
+    root.create_dataset("NumberOfPoints", data=np.array([n], dtype=np.int64))
+    dataset(root, "Points", points)
+
+    # Every point is a vertex cell so ParaView renders the cloud directly
+    for topology in ("Vertices", "Lines", "Polygons", "Strips"):
+        group = root.create_group(topology)
+        if topology == "Vertices":
+            conn, offsets = np.arange(n, dtype=np.int64), np.arange(n + 1, dtype=np.int64)
+        else:
+            conn, offsets = np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        group.create_dataset("NumberOfCells", data=np.array([len(offsets) - 1], dtype=np.int64))
+        group.create_dataset("NumberOfConnectivityIds", data=np.array([len(conn)], dtype=np.int64))
+        dataset(group, "Offsets", offsets)
+        dataset(group, "Connectivity", conn)
+
+    pd = root.create_group("PointData")
+    for name, arr in point_data.items():
+        dataset(pd, name, arr)
+    fd = root.create_group("FieldData")
+    for name, value in field_data.items():
+        if not isinstance(value, str):
+            fd.create_dataset(name, data=value)
+
+def write_vtkhdf(path, points, point_data, field_data, level=COMPRESSION_LEVEL):
+    import h5py
+    with h5py.File(path, "w") as f:
+        _write_polydata_group(f.create_group("VTKHDF"), points, point_data, field_data, level)
+
+def combine_vtkhdf(parts, out_path):
+    """Copies per-case VTKHDF files (compressed chunks as-is) into one PartitionedDataSetCollection."""
+    import h5py
+    tmp_path = out_path + ".tmp"
+    with h5py.File(tmp_path, "w") as out:
+        root = out.create_group("VTKHDF")
+        root.attrs["Version"] = np.array([2, 1], dtype=np.int64)
+        root.attrs["Type"] = np.bytes_("PartitionedDataSetCollection")
+        assembly = root.create_group("Assembly")
+        for index, (case, shape_name, path) in enumerate(sorted(parts)):
+            with h5py.File(path, "r") as src:
+                src.copy(src["VTKHDF"], root, name=case)
+            root[case].attrs["Index"] = index
+            assembly.require_group(shape_name)[case] = h5py.SoftLink(f"/VTKHDF/{case}")
+    os.replace(tmp_path, out_path)
+
+# ==========================================
+# 3. Model Predictions
+# ==========================================
+
+_PREDICTOR = None
+
+class Predictor:
+    """Loads a trainer checkpoint once per worker and predicts physical-unit (U, p) per case."""
+    def __init__(self, checkpoint, model_kind, device, stats_dir, target_norm=None, threads=None):
+        import torch
+        from dataset_stats import resolve_target_norms
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.device = torch.device(device)
+        self.model_kind = model_kind
+
+        ckpt = torch.load(checkpoint, map_location=self.device, weights_only=False)
+        # Full training state (checkpointing.build_checkpoint) or a bare state dict
+        state, saved_config = (ckpt["model"], ckpt.get("config", {})) if "model" in ckpt else (ckpt, {})
+
+        if model_kind == "pointnet":
+            from train_pointnetv1 import DEFAULT_CONFIG, PointNetFluid
+            cfg = {**DEFAULT_CONFIG, **saved_config}
+            self.model = PointNetFluid(input_channels=cfg["input_channels"],
+                                       output_channels=cfg["output_channels"], scaling=cfg["scaling"])
+        else:
+            from train_amg import DEFAULT_CONFIG, FluidAMG
+            cfg = {**DEFAULT_CONFIG, **saved_config}
+            self.model = FluidAMG(in_channels=8+3, out_channels=4, model_dim=cfg["model_dim"],
+                                  num_layers=cfg["num_layers"], ratio_global=cfg["ratio_global"],
+                                  r_local=cfg["r_local"], hf_fraction=cfg["hf_fraction"],
+                                  varlen_attention=cfg["varlen_attention"])
+        self.model.load_state_dict(state)
+        self.model.to(self.device).eval()
+        self.cfg = cfg
+        self.target_norms = resolve_target_norms(stats_dir, target_norm or cfg["target_norm"], [])
+
+    def predict(self, file_path, data):
+        """Returns (N, 4) float32 [u, v, w, p] in physical units."""
+        torch = self.torch
+        pos = data[:, 0:3].astype(np.float32)
+        pos = pos - pos.mean(axis=0)
+        pos /= np.max(np.linalg.norm(pos, axis=1)) + 1e-6
+        x = np.concatenate([pos, data[:, 7:12].astype(np.float32)], axis=1)
+
+        with torch.no_grad():
+            if self.model_kind == "pointnet":
+                inp = torch.from_numpy(x.T[None].copy()).to(self.device)
+                out = self.model(inp)[0].T
+            else:
+                from torch_geometric.data import Data
+                from train_amg import predict_tiled
+                graph = Data(x=torch.from_numpy(x), pos=torch.from_numpy(pos)).to(self.device)
+                tile_nodes = self.cfg["patch_nodes"] if self.cfg["train_mode"] == "patch" else len(pos)
+                out = predict_tiled(self.model, graph, tile_nodes=tile_nodes, halo=self.cfg["patch_halo"])
+        pred = out.float().cpu().numpy()
+
+        if self.target_norms is not None:
+            from dataset_stats import denormalize_targets, lookup_target_norm
+            mean, std = lookup_target_norm(self.target_norms, file_path)
+            return denormalize_targets(pred, mean, std)
+        if self.model_kind == "pointnet":
+            # Per-sample normalization: invert with the case's own velocity max / pressure stats
+            truth = data[:, 3:7].astype(np.float64)
+            max_vel = np.max(np.linalg.norm(truth[:, 0:3], axis=1))
+            p_std = np.std(truth[:, 3])
+            if max_vel > 1e-6: pred[:, 0:3] *= max_vel
+            if p_std > 1e-6: pred[:, 3] = pred[:, 3] * p_std + np.mean(truth[:, 3])
+        return pred
+
+def _init_worker(predictor_kwargs):
+    global _PREDICTOR
+    if predictor_kwargs is not None:
+        _PREDICTOR = Predictor(**predictor_kwargs)
+
+# ==========================================
+# 4. Conversion
+# ==========================================
+
+def case_fields(data, extra):
+    # [x, y, z, u, v, w, p, y_wall, is_fluid, is_wall, is_inlet, is_outlet]
+    flags = data[:, 8:12] > 0.5
+    # Create "Zone_ID" for easier coloring in Paraview
+    # 0=Fluid, 1=Wall, 2=Inlet, 3=Outlet
+    zone_id = np.zeros(len(data), dtype=np.uint8)
+    zone_id[flags[:, 1]] = 1
+    zone_id[flags[:, 2]] = 2
+    zone_id[flags[:, 3]] = 3
+
+    point_data = {
+        "U": data[:, 3:6],
+        "p": data[:, 6],
+        "y_wall": data[:, 7],
+        "is_fluid": flags[:, 0].astype(np.uint8),
+        "is_wall": flags[:, 1].astype(np.uint8),
+        "is_inlet": flags[:, 2].astype(np.uint8),
+        "is_outlet": flags[:, 3].astype(np.uint8),
+        "Zone_ID": zone_id,
+    }
+    point_data.update(extra)
+    return point_data
+
+def prediction_fields(data, pred):
+    U_err = pred[:, 0:3] - data[:, 3:6]
+    return {
+        "U_pred": pred[:, 0:3],
+        "p_pred": pred[:, 3],
+        "U_error": U_err.astype(np.float32),
+        "U_error_mag": np.linalg.norm(U_err, axis=1).astype(np.float32),
+        "p_error": (pred[:, 3] - data[:, 6]).astype(np.float32),
+    }
+
+def convert_case(job):
+    file_path, out_dir, fmt, level = job
+    case = os.path.splitext(os.path.basename(file_path))[0]
+    try:
+        data, shape_name, params, extra = load_case(file_path)
+        if data.ndim != 2 or data.shape[1] != 12:
+            return case, shape_name, None, f"Skipping {case}: Data shape {data.shape} mismatch (Expected N, 12)."
+
+        point_data = case_fields(data, extra)
+        if _PREDICTOR is not None:
+            point_data.update(prediction_fields(data, _PREDICTOR.predict(file_path, data)))
+
+        field_data = {k: np.array([float(v)]) for k, v in params.items()
+                      if isinstance(v, (bool, int, float, np.number))}
+        field_data["Shape_Name"] = str(shape_name)
+
+        out_path = os.path.join(out_dir, case + FORMAT_EXTENSIONS[fmt])
+        tmp_path = out_path + ".tmp"
+        writer = write_vtp if fmt == "vtp" else write_vtkhdf
+        writer(tmp_path, np.ascontiguousarray(data[:, 0:3]), point_data, field_data, level)
+        os.replace(tmp_path, out_path)
+        return case, shape_name, out_path, None
+    except Exception as e:
+        return case, None, None, f"Error converting {case}: {e}"
+
+# ==========================================
+# 5. Main
+# ==========================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export cases to compressed VTP / VTKHDF for ParaView.")
+    parser.add_argument("--glob", default=INPUT_GLOB, help="Case files to consider")
+    parser.add_argument("--query", default=None, help="SQL WHERE clause on the case catalog (replaces --glob)")
+    parser.add_argument("--where", action="append", default=[], help="Metadata filter, e.g. shape_name=valve")
+    parser.add_argument("--sample", type=int, default=10, help="Random subset size (0 = all selected)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--format", choices=list(FORMAT_EXTENSIONS), default="vtp")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--level", type=int, default=COMPRESSION_LEVEL, help="zlib/gzip level (1-9)")
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    parser.add_argument("--checkpoint", default=None, help="Model weights to overlay predictions")
+    parser.add_argument("--model", choices=["pointnet", "amg"], default="pointnet")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--target-norm", choices=["global", "shape", "sample"], default=None,
+                        help="Override the normalization the checkpoint was trained with")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.query:
+        from case_catalog import query_cases
+        files = query_cases(args.query, os.path.dirname(args.glob) or ".")
+    else:
+        files = sorted(glob.glob(args.glob))
+    if not files:
+        print(f"No files found for {args.query or args.glob}")
+        sys.exit(1)
+
+    cores = 1 if args.device.startswith("cuda") else args.cores
+
+    if args.where:
+        predicates = [parse_where(w) for w in args.where]
+        with Pool(cores) as pool:
+            files = [f for f in pool.map(_filter_job, [(f, predicates) for f in files]) if f]
+        print(f"{len(files)} cases match {args.where}")
+    if args.sample and len(files) > args.sample:
+        files = sorted(random.Random(args.seed).sample(files, args.sample))
+    if not files:
+        return
+
+    predictor_kwargs = None
+    if args.checkpoint:
+        predictor_kwargs = {"checkpoint": args.checkpoint, "model_kind": args.model, "device": args.device,
+                            "stats_dir": os.path.dirname(args.glob) or ".", "target_norm": args.target_norm,
+                            "threads": 1 if cores > 1 else None}
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    multiblock = args.format == "vtkhdf-multiblock"
+    case_dir = os.path.join(args.output_dir, ".cases_tmp") if multiblock else args.output_dir
+    os.makedirs(case_dir, exist_ok=True)
+
+    print(f"Converting {len(files)} cases to {args.format} on {cores} cores"
+          f"{' with predictions from ' + args.checkpoint if args.checkpoint else ''}...\n")
+
+    parts = []
+    jobs = [(f, case_dir, args.format, args.level) for f in files]
+    with Pool(cores, initializer=_init_worker, initargs=(predictor_kwargs,)) as pool:
+        for i, (case, shape_name, out_path, err) in enumerate(pool.imap_unordered(convert_case, jobs)):
+            if err: print(f"\n{err}")
+            else: parts.append((case, shape_name, out_path))
+            pct = ((i+1)/len(files))*100
+            sys.stdout.write(f"\rProgress: {pct:.1f}%")
+            sys.stdout.flush()
+
+    if multiblock and parts:
+        out_path = os.path.join(args.output_dir, "cases.vtkhdf")
+        combine_vtkhdf(parts, out_path)
+        shutil.rmtree(case_dir)
+        print(f"\nCombined {len(parts)} cases into {out_path}")
+    else:
+        print(f"\nDone! {len(parts)} files saved to ./{args.output_dir}/")
+    print("Open them in ParaView.")
+
+if __name__ == "__main__":
+    main()
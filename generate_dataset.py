@@ -1,15 +1,21 @@
+import argparse
 import os
 import shutil
+import socket
 import numpy as np
 import subprocess
 import textwrap
 import sys
-import random
-import itertools
+import time
+import functools
 from multiprocessing import Pool
 import pyvista as pv
 from scipy.spatial import cKDTree  # Efficient distance calculation
 
+from case_catalog import add_case
+from doe import base_space, extend_design, load_design, save_design
+from solver_backends import fv_solution, get_backend, load_solver_profiles
+
 # Import your shape generators
 import shapes.straight, shapes.bend, shapes.valve, shapes.obstacle
 import shapes.venturi, shapes.manifold
@@ -17,8 +23,14 @@ import shapes.venturi, shapes.manifold
 # --- Configuration ---
 TEMPLATE_DIR = "base_template"
 OUTPUT_DIR = "data_output"
+MOCK_OUTPUT_DIR = "data_mock"   # Mock-backend cases never go to OUTPUT_DIR (trainers read it)
 N_CORES = 10
-SAMPLES_PER_SHAPE = 4 
+SAMPLES_PER_SHAPE = 4           # Target design size per shape; raising it extends the design
+
+# Parameter design (bounds live in doe.py)
+DOE_METHOD = "sobol"            # "sobol" | "lhs" | "maximin"
+DOE_SEED = 0
+DESIGN_FILE = os.path.join(OUTPUT_DIR, "doe_design.json")
 
 LENGTHS = [5.0]
 DIAMETERS = [0.25]
@@ -27,6 +39,20 @@ REFINEMENTS = [2, 4, 6, 8]
 
 BASE_CELL_SIZE = 0.05 
 
+# Per-shape fvSolution written by tune_solver.py; shapes without a profile keep the template's
+SOLVER_PROFILES_FILE = "solver_profiles.json"
+
+# Run potentialFoam before simpleFoam, so SIMPLE starts from potential flow instead of
+# uniform fields. Off until benchmark_potential_init.py shows a gain for the shape
+POTENTIAL_INIT = {
+    "straight": False,
+    "bend": False,
+    "valve": False,
+    "obstacle": False,
+    "venturi": False,
+    "manifold": False,
+}
+
 SHAPE_HANDLERS = {
     "straight": shapes.straight.generate,
     "bend": shapes.bend.generate,
@@ -36,37 +62,27 @@ SHAPE_HANDLERS = {
     "manifold": shapes.manifold.generate
 }
 
-def get_random_params(shape_name):
-    p = {}
-    if shape_name == "valve":
-        p["valve_opening"] = round(random.uniform(0.15, 0.85), 2)
-        p["valve_thickness"] = round(random.uniform(0.1, 0.5), 2)
-    elif shape_name == "obstacle":
-        p["obs_size"] = round(random.uniform(0.2, 0.5), 2)
-        p["obs_offset"] = round(random.uniform(-0.25, 0.25), 2)
-    elif shape_name == "venturi":
-        p["throat_ratio"] = round(random.uniform(0.3, 0.7), 2)
-        p["conv_len_ratio"] = round(random.uniform(0.15, 0.35), 2)
-        p["div_len_ratio"] = round(random.uniform(0.3, 0.6), 2)
-    elif shape_name == "bend":
-        p["bend_angle"] = random.choice([45, 90])
-        p["bend_radius"] = round(random.uniform(1.0, 2.5), 2)
-    elif shape_name == "manifold":
-        p["branch_width_ratio"] = round(random.uniform(0.5, 0.9), 2)
-        p["branch_height_ratio"] = round(random.uniform(1.5, 3.0), 2)
-        
-    p["nu_val"] = round(random.uniform(0.8e-6, 1.3e-6), 9)
-    p["turb_intensity"] = round(random.uniform(0.01, 0.15), 3)
-    return p
-
 def write_foam_file(path, content):
     with open(path, "w") as f:
         f.write(textwrap.dedent(content))
 
-def generate_case_files(run_dir, shape_key, L, D, ref, Ux, params):
+_solver_profiles = None
+
+def solver_profile_for(shape_key):
+    global _solver_profiles
+    if _solver_profiles is None:
+        _solver_profiles = load_solver_profiles(SOLVER_PROFILES_FILE)
+    return _solver_profiles.get(shape_key)
+
+def generate_case_files(run_dir, shape_key, L, D, ref, Ux, params, solver_profile=None):
     os.makedirs(os.path.join(run_dir, "0"), exist_ok=True)
     os.makedirs(os.path.join(run_dir, "constant"), exist_ok=True)
     
+    # Tuned linear solvers / relaxation for this shape (tune_solver.py)
+    solver_profile = solver_profile or solver_profile_for(shape_key)
+    if solver_profile:
+        write_foam_file(os.path.join(run_dir, "system", "fvSolution"), fv_solution(solver_profile))
+    
     current_cell_size = BASE_CELL_SIZE / (1.5 ** ref)
     
     generator = SHAPE_HANDLERS[shape_key]
@@ -127,117 +143,217 @@ def get_patch_one_hot(name):
     if "outlet" in name: return [0, 0, 1]
     return [1, 0, 0] # Wall
 
-def run_case(p):
-    shape_key, L, D, Ux, ref, unique_id = p
-    case_params = get_random_params(shape_key)
+def extract_case_data(run_dir):
+    """Reads the latest time of a case into the (N, 12) point layout (cells + boundary faces)."""
+    touch_file = os.path.join(run_dir, "case.foam")
+    open(touch_file, 'a').close()
+    reader = pv.POpenFOAMReader(touch_file)
+    reader.set_active_time_value(reader.time_values[-1])
+    data = reader.read()
+    
+    # --- PREPARE FOR WALL DISTANCE CALCULATION ---
+    wall_points = []
+    if "boundary" in data.keys():
+        boundaries = data["boundary"]
+        for i in range(boundaries.n_blocks):
+            name = boundaries.get_block_name(i)
+            if name is None or "frontAndBack" in name or "empty" in name.lower(): continue
+            
+            # Check if it's a wall type (not inlet/outlet)
+            is_wall = ("walls" in name.lower()) or ("cylinder" in name.lower())
+            
+            # If explicit "walls" patch, OR if generic patch that isn't inlet/outlet
+            if is_wall or ("inlet" not in name.lower() and "outlet" not in name.lower()):
+                patch = boundaries[i]
+                if patch.n_cells > 0:
+                    wall_points.append(patch.cell_centers().points)
+    
+    # Build KDTree for Walls
+    kdtree = None
+    if wall_points:
+        all_wall_pts = np.vstack(wall_points)
+        kdtree = cKDTree(all_wall_pts)
+
+    # --- EXTRACT DATA ---
+    internal = data["internalMesh"]
+    n_fluid = internal.n_cells
+    f_pos = internal.cell_centers().points
+    
+    if "U" in internal.array_names: f_U = internal["U"]
+    else: f_U = np.zeros((n_fluid, 3))
+        
+    if "p" in internal.array_names: f_p = internal["p"]
+    else: f_p = np.zeros(n_fluid)
+    
+    # CALCULATE Y_WALL manually using KDTree
+    if kdtree:
+        f_ywall, _ = kdtree.query(f_pos)
+    else:
+        f_ywall = np.zeros(n_fluid)
+    
+    f_flags = np.tile([1, 0, 0, 0], (n_fluid, 1))
+    
+    fluid_data = np.column_stack((f_pos, f_U, f_p, f_ywall, f_flags))
+
+    # Boundary Data
+    boundary_data_list = []
+    if "boundary" in data.keys():
+        boundaries = data["boundary"]
+        for i in range(boundaries.n_blocks):
+            name = boundaries.get_block_name(i)
+            if name is None or "frontAndBack" in name or "empty" in name.lower(): continue
+            patch = boundaries[i]
+            if patch.n_cells == 0: continue
+            
+            n_b = patch.n_cells
+            b_pos = patch.cell_centers().points
+            
+            if "U" in patch.array_names: b_U = patch["U"]
+            else: b_U = np.zeros((n_b, 3))
+            
+            if "p" in patch.array_names: b_p = patch["p"]
+            else: b_p = np.zeros(n_b)
+            
+            # Wall distance at boundary is 0 (approx)
+            b_ywall = np.zeros(n_b) 
+            
+            type_flags = get_patch_one_hot(name)
+            b_flags = np.tile([0] + type_flags, (n_b, 1))
+            
+            b_chunk = np.column_stack((b_pos, b_U, b_p, b_ywall, b_flags))
+            boundary_data_list.append(b_chunk)
+
+    if boundary_data_list:
+        all_data = np.vstack([fluid_data] + boundary_data_list)
+    else:
+        all_data = fluid_data
+    return all_data
+
+def save_case(output_path, payload):
+    """
+    np.save through a per-process temp file + fsync + os.replace: a killed worker
+    never leaves a truncated .npy behind, and two workers that run the same job
+    (work_queue.py after a lease expired) each replace the file with a whole case.
+    """
+    tmp_path = f"{output_path}.tmp-{socket.gethostname()}-{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path): os.remove(tmp_path)
+
+def mesh_case(p, output_dir, backend=None):
+    """
+    Meshes a case without solving and saves its (N, 12) array (U/p are the initial
+    fields): the model inputs for a candidate, at blockMesh cost only.
+    """
+    shape_key, L, D, Ux, ref, case_params, case_name = p
+    backend = backend or get_backend()
+    run_dir = os.path.join("temp_runs", f"mesh_{case_name}")
+    output_path = os.path.join(output_dir, f"{case_name}.npy")
+    if os.path.exists(output_path): return None
+
+    try:
+        if os.path.exists(run_dir): shutil.rmtree(run_dir)
+        shutil.copytree(TEMPLATE_DIR, run_dir)
+        generate_case_files(run_dir, shape_key, L, D, ref, Ux, case_params)
+        backend.mesh(run_dir, {"shape": shape_key, "L": L, "D": D, "Ux": Ux, "ref": ref, "params": case_params})
+        save_case(output_path, {"data": extract_case_data(run_dir), "shape_name": shape_key,
+                                "params": {**case_params, "L": L, "D": D, "Ux": Ux, "ref": ref}})
+        return None
+    except subprocess.CalledProcessError as e:
+        return f"Err: {case_name} - CMD {e.cmd[0]} failed"
+    except Exception as e:
+        return f"Err: {case_name} - {str(e)}"
+    finally:
+        if os.path.exists(run_dir): shutil.rmtree(run_dir)
+
+def use_potential_init(shape_key, override=None):
+    """POTENTIAL_INIT for the shape unless override (True/False) is given."""
+    return POTENTIAL_INIT.get(shape_key, False) if override is None else override
+
+def run_potential_init(backend, run_dir, case):
+    """
+    potentialFoam pre-stage; if it fails, 0/ is restored and simpleFoam starts from
+    the uniform fields as usual (log.potentialFoam stays in the run dir).
+    """
+    zero_dir = os.path.join(run_dir, "0")
+    backup_dir = os.path.join(run_dir, "0.orig")
+    shutil.copytree(zero_dir, backup_dir)
+    try:
+        return {"ok": True, **backend.initialize(run_dir, case)}
+    except subprocess.CalledProcessError:
+        shutil.rmtree(zero_dir)
+        shutil.copytree(backup_dir, zero_dir)
+        return {"ok": False, "init_failed": True}
+    finally:
+        shutil.rmtree(backup_dir, ignore_errors=True)
+
+def run_case(p, output_dir=OUTPUT_DIR, catalog=True, backend=None, potential_init=None):
+    shape_key, L, D, Ux, ref, case_params, unique_id = p
+    backend = backend or get_backend()
+    case = {"shape": shape_key, "L": L, "D": D, "Ux": Ux, "ref": ref, "params": case_params}
     case_name = f"{shape_key}_{unique_id}"
+    if backend.name == "mock" and os.path.abspath(output_dir) == os.path.abspath(OUTPUT_DIR):
+        return f"Err: {case_name} - mock backend cannot write to {OUTPUT_DIR}/ (synthetic cases)"
     run_dir = os.path.join("temp_runs", case_name)
     # CHANGED: Extension from .npz to .npy
-    output_path = os.path.join(OUTPUT_DIR, f"{case_name}.npy")
+    output_path = os.path.join(output_dir, f"{case_name}.npy")
 
     if os.path.exists(output_path): return None
 
+    # Seconds per phase, saved with the case (benchmark_run_case.py reads them)
+    timings = {}
+    t = time.perf_counter()
+    def lap(phase):
+        nonlocal t
+        now = time.perf_counter()
+        timings[phase] = now - t
+        t = now
+
     try:
         if os.path.exists(run_dir): shutil.rmtree(run_dir)
         shutil.copytree(TEMPLATE_DIR, run_dir)
+        lap("copy_template")
         
         generate_case_files(run_dir, shape_key, L, D, ref, Ux, case_params)
+        lap("case_files")
         
-        # Run OpenFOAM
-        subprocess.run(["blockMesh"], cwd=run_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        subprocess.run(["simpleFoam"], cwd=run_dir, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Mesh + solve (OpenFOAM, or the mock backend)
+        backend.mesh(run_dir, case)
+        lap("mesh")
+        init = {}
+        if use_potential_init(shape_key, potential_init):
+            init = run_potential_init(backend, run_dir, case)
+            lap("initialize")
+        solver = {**backend.solve(run_dir, case), "potential_init": init.pop("ok", False), **init}
+        lap("solve")
         
-        # Read Data
-        touch_file = os.path.join(run_dir, "case.foam")
-        open(touch_file, 'a').close()
-        reader = pv.POpenFOAMReader(touch_file)
-        reader.set_active_time_value(reader.time_values[-1])
-        data = reader.read()
-        
-        # --- PREPARE FOR WALL DISTANCE CALCULATION ---
-        wall_points = []
-        if "boundary" in data.keys():
-            boundaries = data["boundary"]
-            for i in range(boundaries.n_blocks):
-                name = boundaries.get_block_name(i)
-                if name is None or "frontAndBack" in name or "empty" in name.lower(): continue
-                
-                # Check if it's a wall type (not inlet/outlet)
-                is_wall = ("walls" in name.lower()) or ("cylinder" in name.lower())
-                
-                # If explicit "walls" patch, OR if generic patch that isn't inlet/outlet
-                if is_wall or ("inlet" not in name.lower() and "outlet" not in name.lower()):
-                    patch = boundaries[i]
-                    if patch.n_cells > 0:
-                        wall_points.append(patch.cell_centers().points)
-        
-        # Build KDTree for Walls
-        kdtree = None
-        if wall_points:
-            all_wall_pts = np.vstack(wall_points)
-            kdtree = cKDTree(all_wall_pts)
-
-        # --- EXTRACT DATA ---
-        internal = data["internalMesh"]
-        n_fluid = internal.n_cells
-        f_pos = internal.cell_centers().points
-        
-        if "U" in internal.array_names: f_U = internal["U"]
-        else: f_U = np.zeros((n_fluid, 3))
-            
-        if "p" in internal.array_names: f_p = internal["p"]
-        else: f_p = np.zeros(n_fluid)
-        
-        # CALCULATE Y_WALL manually using KDTree
-        if kdtree:
-            f_ywall, _ = kdtree.query(f_pos)
-        else:
-            f_ywall = np.zeros(n_fluid)
-        
-        f_flags = np.tile([1, 0, 0, 0], (n_fluid, 1))
-        
-        fluid_data = np.column_stack((f_pos, f_U, f_p, f_ywall, f_flags))
-
-        # Boundary Data
-        boundary_data_list = []
-        if "boundary" in data.keys():
-            boundaries = data["boundary"]
-            for i in range(boundaries.n_blocks):
-                name = boundaries.get_block_name(i)
-                if name is None or "frontAndBack" in name or "empty" in name.lower(): continue
-                patch = boundaries[i]
-                if patch.n_cells == 0: continue
-                
-                n_b = patch.n_cells
-                b_pos = patch.cell_centers().points
-                
-                if "U" in patch.array_names: b_U = patch["U"]
-                else: b_U = np.zeros((n_b, 3))
-                
-                if "p" in patch.array_names: b_p = patch["p"]
-                else: b_p = np.zeros(n_b)
-                
-                # Wall distance at boundary is 0 (approx)
-                b_ywall = np.zeros(n_b) 
-                
-                type_flags = get_patch_one_hot(name)
-                b_flags = np.tile([0] + type_flags, (n_b, 1))
-                
-                b_chunk = np.column_stack((b_pos, b_U, b_p, b_ywall, b_flags))
-                boundary_data_list.append(b_chunk)
-
-        if boundary_data_list:
-            all_data = np.vstack([fluid_data] + boundary_data_list)
-        else:
-            all_data = fluid_data
+        all_data = extract_case_data(run_dir)
+        lap("extract")
 
         # CHANGED: Wrap data in a dictionary and use np.save
         save_payload = {
             "data": all_data,
             "shape_name": shape_key,
-            "params": case_params
+            "params": {**case_params, "L": L, "D": D, "Ux": Ux, "ref": ref},
+            "solver": solver,
+            "timings": timings,
         }
-        np.save(output_path, save_payload)
+        save_case(output_path, save_payload)
+        lap("save")
+        
+        # Register in the case catalog so tools can select cases without loading arrays
+        # (multi-host sweeps skip this: SQLite is not safe on network filesystems)
+        if not catalog:
+            return None
+        try:
+            add_case(output_path, all_data, shape_key, save_payload["params"], refinement=ref)
+        except Exception as e:
+            return f"Warn: {case_name} - catalog update failed ({e}); run case_catalog.py scan"
         
         return None
 
@@ -248,31 +364,75 @@ def run_case(p):
     finally:
         if os.path.exists(run_dir): shutil.rmtree(run_dir)
 
-if __name__ == "__main__":
+def build_tasks(output_dir=OUTPUT_DIR):
+    """
+    Extends each shape's space-filling design up to SAMPLES_PER_SHAPE points;
+    every design point whose output does not exist yet becomes a task.
+    """
+    design_file = os.path.join(output_dir, os.path.basename(DESIGN_FILE))
+    design = load_design(design_file)
+    if design["next_id"] is None:
+        # Continue after ids already used by cases generated before the design file
+        ids = [int(f.rsplit("_", 1)[1].split(".")[0]) for f in os.listdir(output_dir)
+               if f.endswith(".npy") and f.rsplit("_", 1)[-1].split(".")[0].isdigit()]
+        design["next_id"] = max(ids, default=-1) + 1
+    base = base_space(LENGTHS, DIAMETERS, VELOCITIES, REFINEMENTS)
+    
+    tasks = []
+    for shape in SHAPE_HANDLERS.keys():
+        entry = design["shapes"].setdefault(shape, {"method": DOE_METHOD, "seed": DOE_SEED, "points": []})
+        n_new = SAMPLES_PER_SHAPE - len(entry["points"])
+        if n_new > 0:
+            for point in extend_design(shape, n_new, DOE_METHOD, DOE_SEED, entry["points"], base):
+                point["id"] = design["next_id"]
+                design["next_id"] += 1
+                entry["points"].append(point)
+        for point in entry["points"]:
+            if not os.path.exists(os.path.join(output_dir, f"{shape}_{point['id']}.npy")):
+                tasks.append((shape, point["L"], point["D"], point["Ux"], point["ref"], point["params"], point["id"]))
+    save_design(design, design_file)
+    return tasks
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the CFD dataset.")
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    parser.add_argument("--backend", default="openfoam", choices=["openfoam", "mock"])
+    parser.add_argument("--mock-cells", type=int, default=20000)
+    parser.add_argument("--mock-delay", type=float, default=0.0, help="Seconds of simulated solver time")
+    parser.add_argument("--output-dir", default=None,
+                        help=f"Default: {OUTPUT_DIR} (openfoam) / {MOCK_OUTPUT_DIR} (mock)")
+    parser.add_argument("--potential-init", default="config", choices=["config", "all", "none"],
+                        help="potentialFoam pre-stage: per POTENTIAL_INIT, for every shape, or never")
+    args = parser.parse_args()
+    potential_init = {"config": None, "all": True, "none": False}[args.potential_init]
+    mock_kw = {"cells": args.mock_cells, "delay_s": args.mock_delay} if args.backend == "mock" else {}
+    backend = get_backend(args.backend, **mock_kw)
+    output_dir = args.output_dir or (MOCK_OUTPUT_DIR if args.backend == "mock" else OUTPUT_DIR)
+    if args.backend == "mock" and os.path.abspath(output_dir) == os.path.abspath(OUTPUT_DIR):
+        print(f"Refusing to write synthetic mock cases to {OUTPUT_DIR}/ (trainers would use them)")
+        sys.exit(1)
+
     if not os.path.exists("shapes"):
         print("Run setup_shapes.py first!")
         sys.exit(1)
 
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
     os.makedirs("temp_runs", exist_ok=True)
-    
-    tasks = []
-    ctr = 0
-    base_combos = list(itertools.product(LENGTHS, DIAMETERS, VELOCITIES, REFINEMENTS))
-    
-    for shape in SHAPE_HANDLERS.keys():
-        for _ in range(SAMPLES_PER_SHAPE):
-            L, D, U, Ref = random.choice(base_combos)
-            tasks.append((shape, L, D, U, Ref, ctr))
-            ctr += 1
+    tasks = build_tasks(output_dir)
             
-    print(f"Starting {len(tasks)} simulations on {N_CORES} cores.")
+    print(f"Starting {len(tasks)} simulations on {args.cores} cores.")
     
-    with Pool(N_CORES) as pool:
-        for i, res in enumerate(pool.imap_unordered(run_case, tasks)):
+    # Each finished case is in the catalog immediately (run_case -> add_case),
+    # so a trainer started with --follow picks it up while the rest still run
+    job = functools.partial(run_case, output_dir=output_dir, backend=backend, potential_init=potential_init)
+    with Pool(args.cores) as pool:
+        for i, res in enumerate(pool.imap_unordered(job, tasks)):
             if res: print(res)
             pct = ((i+1)/len(tasks))*100
             sys.stdout.write(f"\rProgress: {pct:.1f}%")
             sys.stdout.flush()
             
-    print("\nComplete.")
\ No newline at end of file
+    print("\nComplete.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+metrics_sink.py - Low-Overhead Training Metrics
+
+PURPOSE:
+    Replaces per-batch wandb.log(loss.item()) calls. Step metrics are kept as
+    running sums on the device they were computed on and only copied to the
+    host every `flush_every` steps (one sync per flush instead of per step).
+    Aggregated scalars are appended to a local JSONL file and, optionally,
+    forwarded to wandb.
+
+USAGE:
+    sink = MetricsSink("metrics/run.jsonl", flush_every=50, use_wandb=True)
+    for batch in loader:
+        ...
+        sink.add(batch_loss=loss)          # tensor stays on GPU
+        sink.step()
+    sink.log({"epoch": epoch, "val_loss": avg_val})   # written immediately
+    sink.close()
+
+OUTPUT:
+    One JSON object per line, e.g.
+    {"step": 500, "time": 1718000000.0, "batch_loss": 0.031, "batch_loss_count": 50}
+
+NOTES:
+    - Works fully offline; wandb is only imported when use_wandb=True.
+    - Non-finite values are excluded from the mean and counted separately
+      as '<name>_nonfinite' so a NaN batch never poisons the curve.
+"""
+
+import json
+import math
+import os
+import time
+
+import torch
+
+class MetricsSink:
+    def __init__(self, path, flush_every=50, use_wandb=True):
+        self.path = path
+        self.flush_every = max(1, int(flush_every))
+        self.use_wandb = use_wandb
+        self.global_step = 0
+
+        self._sums = {}
+        self._counts = {}
+        self._seen = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", buffering=1)
+
+    def add(self, **values):
+        """Accumulates step values without a host sync."""
+        for name, value in values.items():
+            if torch.is_tensor(value):
+                value = value.detach().float()
+                finite = torch.isfinite(value)
+                value = torch.where(finite, value, torch.zeros_like(value))
+                count = finite.to(torch.int64)
+            else:
+                finite = math.isfinite(value)
+                value = float(value) if finite else 0.0
+                count = int(finite)
+
+            if name in self._sums:
+                self._sums[name] = self._sums[name] + value
+                self._counts[name] = self._counts[name] + count
+                self._seen[name] += 1
+            else:
+                self._sums[name] = value
+                self._counts[name] = count
+                self._seen[name] = 1
+
+    def step(self):
+        self.global_step += 1
+        if self.global_step % self.flush_every == 0:
+            self.flush()
+
+    def flush(self):
+        if not self._sums:
+            return
+        names = list(self._sums)
+        device = next((v.device for v in self._sums.values() if torch.is_tensor(v)), "cpu")
+        # Single device->host transfer for all running sums and counts
+        packed = torch.stack([torch.as_tensor(self._sums[n], dtype=torch.float64, device=device) for n in names] +
+                             [torch.as_tensor(self._counts[n], dtype=torch.float64, device=device) for n in names])
+        values = packed.cpu().tolist()
+
+        record = {}
+        for i, name in enumerate(names):
+            total, count = values[i], int(values[len(names) + i])
+            record[name] = total / count if count > 0 else float("nan")
+            record[f"{name}_count"] = count
+            if count < self._seen[name]:
+                record[f"{name}_nonfinite"] = self._seen[name] - count
+
+        self._sums.clear()
+        self._counts.clear()
+        self._seen.clear()
+        self.log(record)
+
+    def log(self, metrics):
+        """Writes already-reduced scalars immediately (e.g. per-epoch summaries)."""
+        record = {"step": self.global_step, "time": time.time()}
+        record.update({k: float(v) if torch.is_tensor(v) else v for k, v in metrics.items()})
+        self._file.write(json.dumps(record) + "\n")
+
+        if self.use_wandb:
+            import wandb
+            if wandb.run is not None:
+                wandb.log({k: v for k, v in record.items() if k != "time"})
+
+    def close(self):
+        self.flush()
+        self._file.close()
@@ -0,0 +1,95 @@
+"""
+pipeline.py - Overlapped Generation + Training
+
+PURPOSE:
+    Runs generate_dataset.py (producer) and train_pointnetv1.py --follow (consumer)
+    at the same time on a fixed core split, so neither phase leaves the machine idle.
+    - The producer publishes every finished case to <data_dir>/catalog.sqlite as soon
+      as run_case saves it.
+    - The trainer re-reads the catalog at each epoch start and grows its dataset. Cases
+      are assigned to train/val by a hash of their name, so the split is deterministic
+      and a case never changes side as the dataset grows.
+    - On Linux each process (and its pool / loader workers) is pinned to its share of
+      cores with sched_setaffinity.
+
+USAGE:
+    python pipeline.py                              # 3/4 of the cores simulate, the rest train
+    python pipeline.py --sim-cores 12 --train-cores 4
+    python pipeline.py --resume                     # trainer resumes from weights/last.pth
+
+NOTES:
+    - The trainer starts once "follow_min_cases" cases exist (DEFAULT_CONFIG).
+    - When the generator finishes, training continues on the full dataset until
+      "epochs" is reached.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+def core_split(sim_cores=None, train_cores=None):
+    """(sim_cpus, train_cpus) lists of CPU ids."""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    if sim_cores is None and train_cores is None:
+        sim_cores = max(1, (3 * len(cpus)) // 4)
+    if sim_cores is None:
+        sim_cores = max(1, len(cpus) - train_cores)
+    if train_cores is None:
+        train_cores = max(1, len(cpus) - sim_cores)
+    if sim_cores + train_cores > len(cpus):
+        print(f"Warning: {sim_cores} + {train_cores} cores requested, {len(cpus)} available; sharing cores")
+        return cpus[:sim_cores], cpus[-train_cores:]
+    return cpus[:sim_cores], cpus[sim_cores:sim_cores + train_cores]
+
+def launch(cmd, cpus, env=None):
+    def pin():
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+    print(f"$ {' '.join(cmd)}   [cpus {cpus[0]}-{cpus[-1]}]")
+    return subprocess.Popen(cmd, preexec_fn=pin, env=env)
+
+def main():
+    parser = argparse.ArgumentParser(description="Overlap dataset generation and training.")
+    parser.add_argument("--sim-cores", type=int, default=None)
+    parser.add_argument("--train-cores", type=int, default=None)
+    parser.add_argument("--resume", action="store_true")
+    args = parser.parse_args()
+
+    sim_cpus, train_cpus = core_split(args.sim_cores, args.train_cores)
+    # Trainer share: half feeds the DataLoader workers, half runs torch ops
+    num_workers = len(train_cpus) // 2
+    threads = max(1, len(train_cpus) - num_workers)
+    print(f"Core split: {len(sim_cpus)} simulation | {len(train_cpus)} training "
+          f"({num_workers} loader workers, {threads} torch threads)")
+
+    producer = launch([sys.executable, "generate_dataset.py", "--cores", str(len(sim_cpus))], sim_cpus)
+    train_env = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    consumer = launch([sys.executable, "train_pointnetv1.py", "--follow",
+                       "--num-workers", str(num_workers), "--threads", str(threads)]
+                      + (["--resume"] if args.resume else []), train_cpus, env=train_env)
+
+    procs = {"generate_dataset": producer, "train_pointnetv1": consumer}
+    try:
+        while procs:
+            for name, proc in list(procs.items()):
+                code = proc.poll()
+                if code is None:
+                    continue
+                del procs[name]
+                print(f"\n{name} exited with code {code}")
+                if name == "generate_dataset" and "train_pointnetv1" in procs:
+                    # Training keeps going: the rest of its epochs see the complete dataset
+                    print("Generation finished; training continues on all cases.")
+            time.sleep(5)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.wait()
+    sys.exit(max(producer.returncode or 0, consumer.returncode or 0))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+precompute_graphs.py - Offline Graph Hierarchy Store for train_amg.py
+
+PURPOSE:
+    Case geometry never changes, so the graphs FluidAMG runs on (local radius
+    graph, FPS coarse sets, coarse kNN edges, high-frequency kNN graph) can be
+    built once per case instead of on every training step. This script builds
+    them for every case and stores them next to the point data.
+
+USAGE:
+    python precompute_graphs.py
+    Then set "graph_store_dir": "./extracted_data/graphs" in train_amg.DEFAULT_CONFIG.
+
+OUTPUT:
+    <GRAPH_DIR>/<case>/
+        edge_index_local.npy          [2, E] int64, radius graph (R_LOCAL, MAX_NEIGHBORS)
+        edge_index_hf.npy             [2, E] int64, kNN graph (K_HF) for HighFreqIndicator
+        global_index_<ratio>.npy      [M]    int64, FPS node ids, one per ratio in RATIOS
+        edge_index_global_<ratio>.npy [2, E] int64, kNN (K_GLOBAL) among those nodes
+        meta.json                     settings + source mtime (reruns skip unchanged cases;
+                                      train_amg.py ignores entries whose settings, node count
+                                      or source mtime do not match)
+
+NOTES:
+    - Positions are normalized exactly as FluidPyGDataset does, so indices line
+      up with the Data objects it returns.
+    - Arrays are plain uncompressed .npy so the dataset can memory-map them.
+    - FPS uses a fixed start point, so the store is deterministic.
+"""
+
+import glob
+import json
+import os
+import shutil
+import sys
+from multiprocessing import Pool
+
+import numpy as np
+import torch
+
+from train_amg import FluidPyGDataset, build_coarse_graph, graph_store_case_dir, graph_store_filenames
+from torch_geometric.nn import knn_graph, radius_graph
+
+# --- Configuration ---
+DATA_DIR = "./extracted_data"
+FILE_PATTERN = "*.npy"
+GRAPH_DIR = os.path.join(DATA_DIR, "graphs")
+N_CORES = min(8, os.cpu_count() or 1)
+
+R_LOCAL = 0.05
+MAX_NEIGHBORS = 32
+RATIOS = [0.05, 0.1, 0.2]
+K_GLOBAL = 8
+K_HF = 10
+
+SETTINGS = {"r_local": R_LOCAL, "max_num_neighbors": MAX_NEIGHBORS,
+            "ratios": RATIOS, "k_global": K_GLOBAL, "k_hf": K_HF}
+
+def is_up_to_date(case_dir, file_path):
+    meta_path = os.path.join(case_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return meta.get("source_mtime") == os.path.getmtime(file_path) and meta.get("settings") == SETTINGS
+
+def save_array(case_dir, fname, tensor):
+    np.save(os.path.join(case_dir, fname), tensor.cpu().numpy().astype(np.int64))
+
+def process_case(file_path):
+    case_dir = graph_store_case_dir(GRAPH_DIR, file_path)
+    if is_up_to_date(case_dir, file_path):
+        return None
+
+    # One thread per worker: the pool already uses every core
+    torch.set_num_threads(1)
+    tmp_dir = case_dir + ".tmp"
+    try:
+        pos = FluidPyGDataset([file_path]).get(0).pos
+
+        if os.path.exists(tmp_dir): shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+
+        names = graph_store_filenames(RATIOS[0])
+        save_array(tmp_dir, names["edge_index_local"],
+                   radius_graph(pos, r=R_LOCAL, max_num_neighbors=MAX_NEIGHBORS))
+        save_array(tmp_dir, names["edge_index_hf"], knn_graph(pos, k=K_HF))
+
+        for ratio in RATIOS:
+            names = graph_store_filenames(ratio)
+            global_index, edge_index_global = build_coarse_graph(pos, ratio=ratio, k=K_GLOBAL,
+                                                                 random_start=False)
+            save_array(tmp_dir, names["global_index"], global_index)
+            save_array(tmp_dir, names["edge_index_global"], edge_index_global)
+
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump({"num_nodes": int(pos.size(0)), "source_mtime": os.path.getmtime(file_path),
+                       "settings": SETTINGS}, f, indent=2)
+
+        # Swap in the finished directory so readers never see a partial store
+        if os.path.exists(case_dir): shutil.rmtree(case_dir)
+        os.replace(tmp_dir, case_dir)
+        return None
+
+    except Exception as e:
+        if os.path.exists(tmp_dir): shutil.rmtree(tmp_dir)
+        return f"Err: {os.path.basename(file_path)} - {e}"
+
+if __name__ == "__main__":
+    files = sorted(glob.glob(os.path.join(DATA_DIR, FILE_PATTERN)))
+    if not files:
+        print(f"No files found in {os.path.join(DATA_DIR, FILE_PATTERN)}")
+        sys.exit(1)
+
+    os.makedirs(GRAPH_DIR, exist_ok=True)
+    print(f"Precomputing graphs for {len(files)} cases on {N_CORES} cores -> {GRAPH_DIR}")
+
+    with Pool(N_CORES) as pool:
+        for i, res in enumerate(pool.imap_unordered(process_case, files)):
+            if res: print(res)
+            pct = ((i+1)/len(files))*100
+            sys.stdout.write(f"\rProgress: {pct:.1f}%")
+            sys.stdout.flush()
+
+    print("\nComplete.")
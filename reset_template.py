@@ -30,6 +30,8 @@ NOTES:
 import os
 import shutil
 
+from solver_backends import DEFAULT_SOLVER_PROFILE, fv_solution as render_fv_solution
+
 BASE_DIR = "base_template"
 
 # ==========================================
@@ -108,6 +110,7 @@ divSchemes
     div(phi,epsilon) bounded Gauss upwind;
     div(phi,omega)  bounded Gauss upwind;
     div((nuEff*dev2(T(grad(U))))) Gauss linear;
+    div(div(phi,U)) Gauss linear;   // potentialFoam -writep
 }
 laplacianSchemes { default Gauss linear corrected; }
 interpolationSchemes { default linear; }
@@ -117,54 +120,9 @@ snGradSchemes { default corrected; }
 wallDist { method meshWave; correctWalls true; }
 """
 
-# fvSolution
-fv_solution = """FoamFile
-{
-    version     2.0;
-    format      ascii;
-    class       dictionary;
-    object      fvSolution;
-}
-solvers
-{
-    p
-    {
-        solver          GAMG;
-        tolerance       1e-6;
-        relTol          0.1;
-        smoother        GaussSeidel;
-    }
-    "(U|k|epsilon|omega)"
-    {
-        solver          smoothSolver;
-        smoother        symGaussSeidel;
-        tolerance       1e-6;
-        relTol          0.1;
-    }
-}
-SIMPLE
-{
-    nNonOrthogonalCorrectors 0;
-    consistent      yes;
-    pRefCell        0;
-    pRefValue       0;
-    residualControl
-    {
-        p               1e-4;
-        U               1e-4;
-        "(k|epsilon|omega)" 1e-4;
-    }
-}
-relaxationFactors
-{
-    equations
-    {
-        U               0.9;
-        k               0.7;
-        epsilon         0.7;
-    }
-}
-"""
+# fvSolution: solver_backends.DEFAULT_SOLVER_PROFILE, also the baseline of tune_solver.py
+# (per-shape tuned profiles are written over it by generate_dataset.py)
+fv_solution = render_fv_solution(DEFAULT_SOLVER_PROFILE)
 
 # ==========================================
 # Step 4: Define Physical Properties
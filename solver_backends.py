@@ -0,0 +1,321 @@
+"""
+solver_backends.py - Pluggable Mesh/Solver Backends for run_case
+
+PURPOSE:
+    generate_dataset.run_case meshes and solves each case through a backend:
+    - openfoam : blockMesh + simpleFoam, as always (default). The solver log is kept
+                 in the run directory and the SIMPLE iteration count is reported.
+                 initialize() runs potentialFoam -writep first (potential-flow U/p in 0/).
+    - mock     : no OpenFOAM needed. Writes a structured 2D channel polyMesh of about
+                 `cells` cells and laminar Poiseuille U / linear p fields into a time
+                 directory, after an optional `delay_s` standing in for solver time.
+                 Everything after the solver (pyvista reader, y_wall, saving, catalog,
+                 cleanup) runs on these files exactly as on real results. initialize()
+                 is a no-op.
+
+USAGE:
+    backend = get_backend("mock", cells=20000, delay_s=0.5)
+    run_case(task, backend=backend)
+    python generate_dataset.py --backend mock --mock-cells 20000   # -> data_mock/, never data_output/
+    python benchmark_run_case.py                     # per-phase overhead with the mock
+    fv_solution(profile)                             # system/fvSolution text (tune_solver.py)
+
+NOTES:
+    - The mock ignores the shape's blockMeshDict: every case is a straight L x D channel
+      with patches inlet / outlet / walls / frontAndBack.
+    - Backends are plain picklable objects, so they can be passed to Pool workers
+      (functools.partial(run_case, backend=...)).
+    - solve() returns {"backend", "wall_s", "iterations", "converged"}; converged means
+      residualControl stopped simpleFoam before endTime.
+"""
+
+import json
+import os
+import re
+import subprocess
+import time
+
+import numpy as np
+
+# ==========================================
+# 1. OpenFOAM
+# ==========================================
+
+def run_logged(cmd, run_dir, log_name):
+    """Runs an OpenFOAM utility with its output in <run_dir>/<log_name>."""
+    with open(os.path.join(run_dir, log_name), "w") as log:
+        subprocess.run(cmd, cwd=run_dir, check=True, stdout=log, stderr=subprocess.STDOUT)
+
+def parse_iterations(log_path):
+    """Last 'Time = N' of a steady solver log (= SIMPLE iterations), or None."""
+    if not os.path.exists(log_path):
+        return None
+    with open(log_path) as f:
+        times = re.findall(r"^Time = (\d+)", f.read(), flags=re.MULTILINE)
+    return int(times[-1]) if times else None
+
+def parse_converged(log_path):
+    """True if residualControl ended the run ('SIMPLE solution converged in ...')."""
+    if not os.path.exists(log_path):
+        return False
+    with open(log_path) as f:
+        return "solution converged in" in f.read()
+
+class OpenFOAMBackend:
+    name = "openfoam"
+
+    def mesh(self, run_dir, case):
+        run_logged(["blockMesh"], run_dir, "log.blockMesh")
+
+    def initialize(self, run_dir, case):
+        """Potential-flow initial U and p in 0/ (log.potentialFoam)."""
+        t0 = time.perf_counter()
+        run_logged(["potentialFoam", "-writep"], run_dir, "log.potentialFoam")
+        return {"init_wall_s": time.perf_counter() - t0}
+
+    def solve(self, run_dir, case):
+        t0 = time.perf_counter()
+        run_logged(["simpleFoam"], run_dir, "log.simpleFoam")
+        log_path = os.path.join(run_dir, "log.simpleFoam")
+        return {"backend": self.name, "wall_s": time.perf_counter() - t0,
+                "iterations": parse_iterations(log_path), "converged": parse_converged(log_path)}
+
+# ==========================================
+# 2. Mock
+# ==========================================
+
+def foam_header(cls, loc, obj, note=None):
+    note = f" note \"{note}\";" if note else ""
+    return f"FoamFile {{ version 2.0; format ascii; class {cls}; location \"{loc}\"; object {obj};{note} }}\n"
+
+def _foam_list(rows, fmt):
+    return f"{len(rows)}\n(\n" + "\n".join(fmt(r) for r in rows) + "\n)\n"
+
+def _vec(v):
+    return f"({v[0]:.9g} {v[1]:.9g} {v[2]:.9g})"
+
+def _nonuniform(values, vector):
+    kind = "vector" if vector else "scalar"
+    body = " ".join(_vec(v) for v in values) if vector else " ".join(f"{v:.9g}" for v in values)
+    return f"nonuniform List<{kind}> {len(values)}({body})"
+
+class MockBackend:
+    """Synthetic channel mesh + Poiseuille solution in OpenFOAM format."""
+    name = "mock"
+
+    def __init__(self, cells=20000, delay_s=0.0, iterations=500):
+        self.cells = cells
+        self.delay_s = delay_s
+        self.iterations = iterations
+
+    def grid(self, case):
+        L, D = case["L"], case["D"]
+        ny = max(2, int(round(np.sqrt(self.cells * D / L))))
+        nx = max(2, int(round(self.cells / ny)))
+        return nx, ny, L, D
+
+    def mesh(self, run_dir, case):
+        nx, ny, L, D = self.grid(case)
+        dz = D / ny
+        mesh_dir = os.path.join(run_dir, "constant", "polyMesh")
+        os.makedirs(mesh_dir, exist_ok=True)
+
+        # Points p(i, j, k) = k * (nx+1)(ny+1) + j * (nx+1) + i
+        xs, ys = np.linspace(0, L, nx + 1), np.linspace(-D / 2, D / 2, ny + 1)
+        gx, gy = np.meshgrid(xs, ys)
+        layer = np.column_stack([gx.ravel(), gy.ravel()])
+        points = np.vstack([np.column_stack([layer, np.full(len(layer), z)]) for z in (-dz / 2, dz / 2)])
+        npl = (nx + 1) * (ny + 1)
+        P = lambda i, j, k: k * npl + j * (nx + 1) + i
+        C = lambda i, j: j * nx + i
+
+        # Internal faces in upper-triangular order (by owner, then neighbour); normals owner -> neighbour
+        faces, owner, neighbour = [], [], []
+        for j in range(ny):
+            for i in range(nx):
+                if i + 1 < nx:
+                    faces.append((P(i+1, j, 0), P(i+1, j+1, 0), P(i+1, j+1, 1), P(i+1, j, 1)))
+                    owner.append(C(i, j)); neighbour.append(C(i+1, j))
+                if j + 1 < ny:
+                    faces.append((P(i, j+1, 0), P(i, j+1, 1), P(i+1, j+1, 1), P(i+1, j+1, 0)))
+                    owner.append(C(i, j)); neighbour.append(C(i, j+1))
+        n_internal = len(faces)
+
+        # Boundary faces, outward normals, one contiguous block per patch
+        patches = []
+        def patch(name, ptype, new_faces, new_owners):
+            patches.append((name, ptype, len(new_faces), len(faces)))
+            faces.extend(new_faces)
+            owner.extend(new_owners)
+        patch("inlet", "patch", [(P(0, j, 0), P(0, j, 1), P(0, j+1, 1), P(0, j+1, 0)) for j in range(ny)],
+              [C(0, j) for j in range(ny)])
+        patch("outlet", "patch", [(P(nx, j, 0), P(nx, j+1, 0), P(nx, j+1, 1), P(nx, j, 1)) for j in range(ny)],
+              [C(nx-1, j) for j in range(ny)])
+        patch("walls", "wall",
+              [(P(i, 0, 0), P(i+1, 0, 0), P(i+1, 0, 1), P(i, 0, 1)) for i in range(nx)]
+              + [(P(i, ny, 0), P(i, ny, 1), P(i+1, ny, 1), P(i+1, ny, 0)) for i in range(nx)],
+              [C(i, 0) for i in range(nx)] + [C(i, ny-1) for i in range(nx)])
+        patch("frontAndBack", "empty",
+              [(P(i, j, 0), P(i, j+1, 0), P(i+1, j+1, 0), P(i+1, j, 0)) for j in range(ny) for i in range(nx)]
+              + [(P(i, j, 1), P(i+1, j, 1), P(i+1, j+1, 1), P(i, j+1, 1)) for j in range(ny) for i in range(nx)],
+              [C(i, j) for j in range(ny) for i in range(nx)] * 2)
+
+        loc = "constant/polyMesh"
+        with open(os.path.join(mesh_dir, "points"), "w") as f:
+            f.write(foam_header("vectorField", loc, "points") + _foam_list(points, _vec))
+        with open(os.path.join(mesh_dir, "faces"), "w") as f:
+            f.write(foam_header("faceList", loc, "faces")
+                    + _foam_list(faces, lambda fc: f"4({fc[0]} {fc[1]} {fc[2]} {fc[3]})"))
+        note = f"nPoints:{len(points)} nCells:{nx * ny} nFaces:{len(faces)} nInternalFaces:{n_internal}"
+        for obj, labels in (("owner", owner), ("neighbour", neighbour)):
+            with open(os.path.join(mesh_dir, obj), "w") as f:
+                f.write(foam_header("labelList", loc, obj, note) + _foam_list(labels, str))
+        with open(os.path.join(mesh_dir, "boundary"), "w") as f:
+            f.write(foam_header("polyBoundaryMesh", loc, "boundary")
+                    + _foam_list(patches, lambda p: f"{p[0]} {{ type {p[1]}; nFaces {p[2]}; startFace {p[3]}; }}"))
+
+    def initialize(self, run_dir, case):
+        return {"init_wall_s": 0.0}
+
+    def solve(self, run_dir, case):
+        t0 = time.perf_counter()
+        if self.delay_s > 0:
+            time.sleep(self.delay_s)
+        nx, ny, L, D = self.grid(case)
+        Ux, nu = case["Ux"], case["params"].get("nu_val", 1e-6)
+        dpdx = 12.0 * nu * Ux / D ** 2   # Laminar 2D channel: mean velocity Ux
+
+        def fields(x, y):
+            u = 1.5 * Ux * (1.0 - (2.0 * y / D) ** 2)
+            return np.column_stack([u, np.zeros_like(u), np.zeros_like(u)]), dpdx * (L - x)
+
+        # Cell centres (cell (i, j) -> j * nx + i) and boundary face centres per patch
+        xc = (np.arange(nx) + 0.5) * L / nx
+        yc = -D / 2 + (np.arange(ny) + 0.5) * D / ny
+        gx, gy = np.meshgrid(xc, yc)
+        U_int, p_int = fields(gx.ravel(), gy.ravel())
+        faces = {
+            "inlet": (np.zeros(ny), yc),
+            "outlet": (np.full(ny, L), yc),
+            "walls": (np.concatenate([xc, xc]), np.concatenate([np.full(nx, -D / 2), np.full(nx, D / 2)])),
+        }
+
+        time_dir = os.path.join(run_dir, str(self.iterations))
+        os.makedirs(time_dir, exist_ok=True)
+        for name, vector, dims, internal in (("U", True, "[0 1 -1 0 0 0 0]", U_int), ("p", False, "[0 2 -2 0 0 0 0]", p_int)):
+            bf = []
+            for patch, (x, y) in faces.items():
+                U_b, p_b = fields(x, y)
+                bf.append(f"    {patch} {{ type calculated; value {_nonuniform(U_b if vector else p_b, vector)}; }}")
+            bf.append("    frontAndBack { type empty; }")
+            cls = "volVectorField" if vector else "volScalarField"
+            with open(os.path.join(time_dir, name), "w") as f:
+                f.write(foam_header(cls, str(self.iterations), name)
+                        + f"dimensions {dims};\ninternalField {_nonuniform(internal, vector)};\n"
+                        + "boundaryField\n{\n" + "\n".join(bf) + "\n}\n")
+        return {"backend": self.name, "wall_s": time.perf_counter() - t0, "iterations": self.iterations,
+                "converged": True}
+
+# ==========================================
+# 3. fvSolution Profiles
+# ==========================================
+
+# Template fvSolution (reset_template.py writes fv_solution(DEFAULT_SOLVER_PROFILE));
+# GAMG agglomeration / coarsest level are OpenFOAM's defaults
+DEFAULT_SOLVER_PROFILE = {
+    "p_smoother": "GaussSeidel",      # GAMG smoother: GaussSeidel | DIC | DICGaussSeidel
+    "p_agglomerator": "faceAreaPair",
+    "p_coarsest": 10,                 # nCellsInCoarsestLevel
+    "p_tol": 1e-6,
+    "p_rel_tol": 0.1,
+    "u_tol": 1e-6,                    # U, k, epsilon, omega (smoothSolver)
+    "u_rel_tol": 0.1,
+    "relax_U": 0.9,
+    "relax_turb": 0.7,                # k, epsilon
+}
+
+def fv_solution(profile=None):
+    """system/fvSolution for a solver profile (missing keys take DEFAULT_SOLVER_PROFILE)."""
+    s = {**DEFAULT_SOLVER_PROFILE, **(profile or {})}
+    return f"""FoamFile
+{{
+    version     2.0;
+    format      ascii;
+    class       dictionary;
+    object      fvSolution;
+}}
+solvers
+{{
+    p
+    {{
+        solver          GAMG;
+        tolerance       {s["p_tol"]:g};
+        relTol          {s["p_rel_tol"]:g};
+        smoother        {s["p_smoother"]};
+        agglomerator    {s["p_agglomerator"]};
+        nCellsInCoarsestLevel {s["p_coarsest"]};
+    }}
+    "(U|k|epsilon|omega)"
+    {{
+        solver          smoothSolver;
+        smoother        symGaussSeidel;
+        tolerance       {s["u_tol"]:g};
+        relTol          {s["u_rel_tol"]:g};
+    }}
+    // potentialFoam pre-stage (generate_dataset.POTENTIAL_INIT)
+    Phi
+    {{
+        solver          GAMG;
+        smoother        GaussSeidel;
+        tolerance       1e-6;
+        relTol          0.01;
+    }}
+}}
+potentialFlow
+{{
+    nNonOrthogonalCorrectors 3;
+}}
+SIMPLE
+{{
+    nNonOrthogonalCorrectors 0;
+    consistent      yes;
+    pRefCell        0;
+    pRefValue       0;
+    residualControl
+    {{
+        p               1e-4;
+        U               1e-4;
+        "(k|epsilon|omega)" 1e-4;
+    }}
+}}
+relaxationFactors
+{{
+    equations
+    {{
+        U               {s["relax_U"]:g};
+        k               {s["relax_turb"]:g};
+        epsilon         {s["relax_turb"]:g};
+    }}
+}}
+"""
+
+def load_solver_profiles(path):
+    """{shape: profile} from tune_solver.py's output, or {} if no shape was tuned."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {shape: entry["profile"] for shape, entry in json.load(f)["shapes"].items()}
+
+# ==========================================
+# 4. Registry
+# ==========================================
+
+BACKENDS = {
+    "openfoam": OpenFOAMBackend,
+    "mock": MockBackend,
+}
+
+def get_backend(name="openfoam", **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown solver backend '{name}' (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name](**kwargs)
@@ -1,22 +1,30 @@
 import os
 import glob
+import json
+import math
 import datetime
+from collections import OrderedDict
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.utils.checkpoint import checkpoint
 import numpy as np
 import wandb
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 
 # PyG Imports
-from torch_geometric.data import Data, Dataset
+from torch_geometric.data import Batch, Data, Dataset
 from torch_geometric.loader import DataLoader
-from torch_geometric.nn import GATv2Conv, fps, radius_graph, knn_graph
+from torch_geometric.nn import GATv2Conv, fps, knn, radius_graph, knn_graph
+from torch_geometric.utils import softmax as scatter_softmax
 from torch_geometric.utils import to_dense_batch
 from torch_scatter import scatter_mean
 
+from case_catalog import query_cases
+from dataset_stats import lookup_target_norm, resolve_target_norms
+from metrics_sink import MetricsSink
+from step_profiler import StepProfiler
+from vis_worker import VisualizationWorker
+
 # ==========================================
 # 1. Configuration
 # ==========================================
@@ -24,6 +32,7 @@ DEFAULT_CONFIG = {
     "project_name": "ST_CFDAI_AMG",
     "data_dir": "./extracted_data",
     "file_pattern": "*.npy",
+    "catalog_query": None,        # SQL WHERE clause on <data_dir>/catalog.sqlite, replaces file_pattern
     "batch_size": 4,              # GNNs use more VRAM than PointNet
     "learning_rate": 5e-4,
     "epochs": 1000,
@@ -33,12 +42,113 @@ DEFAULT_CONFIG = {
     "r_local": 0.05,              # Radius for local turbulence graph
     "k_local": 20,                # Neighbors for high-freq nodes
     "ratio_global": 0.1,          # Keep 10% of nodes for global graph
+    "hf_fraction": 0.25,          # Top share of nodes per graph (by HF indicator) that get local attention
+    "varlen_attention": True,     # Padding-free physics-token attention (False: to_dense_batch path)
+    "checkpoint_activations": False,  # Recompute each layer in backward instead of storing activations
+    "memory_budget_gb": None,     # If set, batch size is derived from estimate_amg_memory()
+    "cache_graphs": False,        # Build graphs once per case in the dataset and reuse across epochs
+    "graph_cache_mb": 2048,       # LRU budget of that cache, per dataset copy (every DataLoader worker has one)
+    "graph_store_dir": None,      # Precomputed graphs from precompute_graphs.py (e.g. "./extracted_data/graphs")
+    "target_norm": "global",      # "global" | "shape": fixed mean/std from dataset_stats.py | "sample": raw targets
     "val_split": 0.2,
-    "vis_frequency": 50
+    "train_mode": "full",         # "full": one mesh per graph | "patch": spatial subdomain patches
+    "patch_nodes": 8192,          # Core nodes per patch (also tile size for full-mesh inference)
+    "patch_halo": 0.05,           # Halo width around each patch/tile (normalized coords, >= r_local)
+    "patches_per_case": 4,        # Patches drawn per case per epoch
+    "patch_batch_size": 16,
+    "vis_frequency": 50,
+    "vis_num_cases": 2,           # Fixed validation cases rendered each vis epoch
+    "log_every": 50,              # Steps between aggregated step-loss flushes
+    "metrics_dir": "./metrics",   # Local JSONL metrics log (always written)
+    "wandb_mode": "online",       # "online", "offline" or "disabled"
+    "profile": False,             # Per-phase step timing table each epoch
+    "profile_trace_steps": 0,     # >0: also record a torch.profiler trace window
+    "profile_trace_dir": "./profiler_traces"
 }
 
 # ==========================================
-# 2. The AMG Architecture Components
+# 2. Graph Construction
+# ==========================================
+
+GRAPH_KEYS = ("edge_index_local", "edge_index_global", "global_index", "edge_index_hf")
+
+def build_coarse_graph(pos, batch=None, ratio=0.2, k=8, random_start=True):
+    """FPS coarse set + kNN among the coarse nodes, mapped back to global node ids."""
+    global_index = fps(pos, batch, ratio=ratio, random_start=random_start)
+    batch_global = batch[global_index] if batch is not None else None
+    row, col = knn_graph(pos[global_index], k=k, batch=batch_global)
+    edge_index_global = torch.stack([global_index[row], global_index[col]], dim=0)
+    return global_index, edge_index_global
+
+def build_amg_graphs(pos, batch=None, r_local=0.05, max_num_neighbors=32,
+                     ratio_global=0.2, k_global=8, k_hf=10):
+    """
+    Builds every graph FluidAMG needs from node positions alone.
+    Geometry is fixed, so the result is valid for all layers (and all epochs of a case).
+    Key names contain 'index' so PyG batching offsets them by the node count.
+    """
+    # Local radius graph on the full mesh
+    edge_index_local = radius_graph(pos, r=r_local, batch=batch, max_num_neighbors=max_num_neighbors)
+    
+    # Coarse (global) graph
+    global_index, edge_index_global = build_coarse_graph(pos, batch, ratio=ratio_global, k=k_global)
+    
+    # Neighborhood for the high-frequency indicator
+    edge_index_hf = knn_graph(pos, k=k_hf, batch=batch)
+    
+    return {
+        "edge_index_local": edge_index_local,
+        "edge_index_global": edge_index_global,
+        "global_index": global_index,
+        "edge_index_hf": edge_index_hf,
+    }
+
+def graph_store_case_dir(graph_dir, file_path):
+    """Precomputed graphs for 'cases/foo.npy' live in '<graph_dir>/foo/'."""
+    return os.path.join(graph_dir, os.path.splitext(os.path.basename(file_path))[0])
+
+def graph_store_filenames(ratio_global):
+    return {
+        "edge_index_local": "edge_index_local.npy",
+        "edge_index_hf": "edge_index_hf.npy",
+        "global_index": f"global_index_{ratio_global:g}.npy",
+        "edge_index_global": f"edge_index_global_{ratio_global:g}.npy",
+    }
+
+def graph_store_settings(r_local):
+    """precompute_graphs.py settings a store must match; the rest are build_amg_graphs() defaults."""
+    return {"r_local": r_local, "max_num_neighbors": 32, "k_global": 8, "k_hf": 10}
+
+def load_graph_store(graph_dir, file_path, ratio_global, settings=None, num_nodes=None):
+    """
+    Memory-maps the precomputed graphs of one case (copy-on-write, so torch
+    shares the pages instead of copying). Returns None if the case has no
+    store entry for this ratio, or if meta.json shows it was built with other
+    settings, for another node count or from an older version of the case.
+    """
+    case_dir = graph_store_case_dir(graph_dir, file_path)
+    meta_path = os.path.join(case_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stored = meta.get("settings", {})
+    if settings and any(stored.get(k) != v for k, v in settings.items()):
+        return None
+    if num_nodes is not None and meta.get("num_nodes") != num_nodes:
+        return None
+    if meta.get("source_mtime") != os.path.getmtime(file_path):
+        return None
+    graphs = {}
+    for key, fname in graph_store_filenames(ratio_global).items():
+        path = os.path.join(case_dir, fname)
+        if not os.path.exists(path):
+            return None
+        graphs[key] = torch.from_numpy(np.load(path, mmap_mode='c'))
+    return graphs
+
+# ==========================================
+# 3. The AMG Architecture Components
 # ==========================================
 
 class HighFreqIndicator(nn.Module):
@@ -46,9 +156,10 @@ class HighFreqIndicator(nn.Module):
     Calculates which nodes are in 'high frequency' areas (turbulence/walls).
     Logic: Difference between a node and the average of its neighbors.
     """
-    def forward(self, x, pos, batch, k=10):
-        # 1. Build a quick KNN graph to check local neighborhood
-        edge_index = knn_graph(pos, k=k, batch=batch)
+    def forward(self, x, pos, batch, k=10, edge_index=None):
+        # 1. Build a quick KNN graph to check local neighborhood (unless one is supplied)
+        if edge_index is None:
+            edge_index = knn_graph(pos, k=k, batch=batch)
         row, col = edge_index
         
         # 2. Calculate mean of neighbors features
@@ -59,15 +170,54 @@ class HighFreqIndicator(nn.Module):
         indicator = torch.norm(x - x_neigh_mean, p=1, dim=-1)
         return indicator
 
+def select_topk_per_graph(score, batch, fraction):
+    """
+    Boolean mask of the ceil(fraction * n_g) highest-scoring nodes of every graph g.
+    Works on the flat [Total_N] layout without padding.
+    """
+    if batch is None:
+        batch = torch.zeros_like(score, dtype=torch.long)
+    num_nodes = torch.bincount(batch)
+    k = torch.ceil(num_nodes.float() * fraction).long()
+    ptr = torch.cumsum(num_nodes, 0) - num_nodes
+    
+    # Sort by score, then stably by graph -> nodes grouped per graph in descending score
+    perm = torch.argsort(score, descending=True)
+    perm = perm[torch.argsort(batch[perm], stable=True)]
+    rank = torch.arange(score.numel(), device=score.device) - ptr[batch[perm]]
+    
+    mask = torch.zeros_like(score, dtype=torch.bool)
+    mask[perm] = rank < k[batch[perm]]
+    return mask
+
+class CheapNodeUpdate(nn.Module):
+    """Per-node residual update for nodes outside the high-frequency set."""
+    def __init__(self, dim):
+        super().__init__()
+        self.lin = nn.Linear(dim, dim)
+        self.norm = nn.LayerNorm(dim)
+
+    def forward(self, x):
+        return self.norm(x + self.lin(x))
+
+def _mha_proj(mha, x, i):
+    """Applies the i-th (0=q, 1=k, 2=v) packed input projection of an nn.MultiheadAttention."""
+    C = mha.embed_dim
+    w = mha.in_proj_weight[i * C:(i + 1) * C]
+    b = mha.in_proj_bias[i * C:(i + 1) * C] if mha.in_proj_bias is not None else None
+    return F.linear(x, w, b)
+
 class PhysicsGraphBlock(nn.Module):
     """
     Projects nodes into latent 'Physics Tokens' (Inlet, Outlet, Wall concepts)
     and allows global communication.
     """
-    def __init__(self, in_dim, num_phys_tokens=32):
+    def __init__(self, in_dim, num_phys_tokens=32, varlen=True):
         super().__init__()
         self.num_phys = num_phys_tokens
         self.phys_tokens = nn.Parameter(torch.randn(1, num_phys_tokens, in_dim))
+        # varlen: attention over the flat [Total_N, C] tensor (no padding to N_max)
+        self.varlen = varlen
         
         # Attention for Nodes -> Physics
         self.attn_in = nn.MultiheadAttention(in_dim, num_heads=4, batch_first=True)
@@ -78,6 +228,13 @@ class PhysicsGraphBlock(nn.Module):
         self.norm2 = nn.LayerNorm(in_dim)
 
     def forward(self, x, batch):
+        if self.varlen:
+            out_flat = self._forward_varlen(x, batch)
+        else:
+            out_flat = self._forward_dense(x, batch)
+        return self.norm2(x + self.norm1(out_flat))
+
+    def _forward_dense(self, x, batch):
         # x: [Total_N, C]
         # We need to process this batch-wise for global tokens
         # Convert to dense [B, N_max, C]
@@ -97,8 +254,51 @@ class PhysicsGraphBlock(nn.Module):
         out_dense, _ = self.attn_out(query=x_dense, key=tokens, value=tokens)
         
         # Flatten back to [Total_N, C]
-        out_flat = out_dense[mask]
-        return self.norm2(x + self.norm1(out_flat))
+        return out_dense[mask]
+
+    def _forward_varlen(self, x, batch):
+        """
+        Same math as _forward_dense, using the same nn.MultiheadAttention weights,
+        but on the flat node tensor. Memory is O(Total_N * P) instead of O(B * N_max * P).
+        Relies on PyG batches storing each graph's nodes contiguously.
+        """
+        N, C = x.shape
+        H = self.attn_in.num_heads
+        d = C // H
+        P = self.num_phys
+        if batch is None:
+            batch = x.new_zeros(N, dtype=torch.long)
+        counts = torch.bincount(batch).tolist()
+        B = len(counts)
+        scale = d ** -0.5
+        
+        # 1. Nodes write to Physics Tokens
+        # Query: Tokens (identical for every graph), Key/Val: Nodes
+        tokens0 = self.phys_tokens[0]                                         # [P, C]
+        q = _mha_proj(self.attn_in, tokens0, 0).view(P, H, d)
+        k = _mha_proj(self.attn_in, x, 1).view(N, H, d)
+        v = _mha_proj(self.attn_in, x, 2).view(N, H, d)
+        scores = torch.einsum('nhd,phd->nhp', k, q) * scale                  # [N, H, P]
+        # Softmax over the nodes of each graph
+        alpha = scatter_softmax(scores, batch, num_nodes=B, dim=0)
+        # Weighted sum per graph (segment matmul over contiguous node ranges)
+        curr_tokens = torch.stack([
+            torch.einsum('nhp,nhd->phd', a_b, v_b)
+            for a_b, v_b in zip(torch.split(alpha, counts), torch.split(v, counts))
+        ]).reshape(B, P, C)
+        curr_tokens = self.attn_in.out_proj(curr_tokens)
+        tokens = tokens0.unsqueeze(0) + curr_tokens                          # [B, P, C]
+        
+        # 2. Physics Tokens write back to Nodes
+        # Query: Nodes, Key/Val: Tokens of the node's own graph
+        q = _mha_proj(self.attn_out, x, 0).view(N, H, d)
+        k = _mha_proj(self.attn_out, tokens, 1).view(B, P, H, d)
+        v = _mha_proj(self.attn_out, tokens, 2).view(B, P, H, d)
+        out = torch.cat([
+            torch.einsum('nhp,phd->nhd', torch.softmax(torch.einsum('nhd,phd->nhp', q_b, k[g]) * scale, dim=-1), v[g])
+            for g, q_b in enumerate(torch.split(q, counts))
+        ]).reshape(N, C)
+        return self.attn_out.out_proj(out)
 
 class GraphFormerBlock(nn.Module):
     """
@@ -116,9 +316,14 @@ class GraphFormerBlock(nn.Module):
         )
         self.norm2 = nn.LayerNorm(dim)
 
-    def forward(self, x, edge_index):
+    def forward(self, x, edge_index, x_dst=None):
         # 1. Graph Attention
-        h = self.gat(x, edge_index)
+        # x_dst given: bipartite update of x_dst = x[:len(x_dst)] only (sources are all of x)
+        if x_dst is None:
+            h = self.gat(x, edge_index)
+        else:
+            h = self.gat((x, x_dst), edge_index)
+            x = x_dst
         x = self.norm1(x + h)
         
         # 2. Feed Forward
@@ -128,10 +333,18 @@ class GraphFormerBlock(nn.Module):
 
 class FluidAMG(nn.Module):
     def __init__(self, in_channels=12, out_channels=4, model_dim=128, 
-                 num_layers=4, ratio_global=0.2):
+                 num_layers=4, ratio_global=0.2, r_local=0.05, hf_fraction=1.0,
+                 varlen_attention=True, checkpoint_activations=False, rebuild_graphs_per_layer=False):
         super().__init__()
         self.model_dim = model_dim
         self.ratio_global = ratio_global
+        self.r_local = r_local
+        # < 1.0: only the top hf_fraction nodes (per graph) run the local GATv2 block
+        self.hf_fraction = hf_fraction
+        # Per-layer activation checkpointing: keep only layer inputs, recompute in backward
+        self.checkpoint_activations = checkpoint_activations
+        # Old behavior, kept as a benchmark baseline: rebuild radius/FPS/kNN graphs in every layer
+        self.rebuild_graphs_per_layer = rebuild_graphs_per_layer
         
         # 1. Input Encoder
         # We assume input x has [x, y, z] in the first 3 columns if we need them, 
@@ -149,11 +362,14 @@ class FluidAMG(nn.Module):
         # 3. Layers
         self.layers = nn.ModuleList()
         for _ in range(num_layers):
-            self.layers.append(nn.ModuleDict({
-                'physics': PhysicsGraphBlock(model_dim),
+            blocks = {
+                'physics': PhysicsGraphBlock(model_dim, varlen=varlen_attention),
                 'local': GraphFormerBlock(model_dim),
                 'global': GraphFormerBlock(model_dim)
-            }))
+            }
+            if hf_fraction < 1.0:
+                blocks['cheap'] = CheapNodeUpdate(model_dim)
+            self.layers.append(nn.ModuleDict(blocks))
             
         # 4. Decoder
         self.decoder = nn.Sequential(
@@ -162,6 +378,14 @@ class FluidAMG(nn.Module):
             nn.Linear(model_dim, out_channels)
         )
 
+    def get_graphs(self, data):
+        """Uses graphs attached by the dataset if present, otherwise builds them once."""
+        if all(getattr(data, key, None) is not None for key in GRAPH_KEYS):
+            return {key: data[key] for key in GRAPH_KEYS}
+        with torch.no_grad():
+            return build_amg_graphs(data.pos, data.batch, r_local=self.r_local,
+                                    ratio_global=self.ratio_global)
+
     def forward(self, data):
         x, pos, batch = data.x, data.pos, data.batch
         
@@ -171,54 +395,171 @@ class FluidAMG(nn.Module):
         # Embedding
         h = self.encoder(x)
         
+        # pos never changes between layers: build every graph once per forward pass
+        graphs = self.get_graphs(data)
+        
         # Calculate High-Frequency Indicator once (or per layer)
         # We treat the input features as the signal to detect turbulence
-        hf_score = self.hf_indicator(h, pos, batch)
+        with torch.no_grad():
+            hf_score = self.hf_indicator(h, pos, batch, edge_index=graphs["edge_index_hf"])
+        
+        # Adaptive refinement: select the top hf_fraction nodes of each graph once and
+        # keep every local edge that ends at a selected node (messages from all neighbours).
+        # Nodes are reordered selected-first, so source i < n_hf is target i and the
+        # self-loops GATv2 adds in bipartite mode land on the right nodes.
+        ctx = {"batch": batch, "pos": pos, "graphs": graphs, "adaptive": self.hf_fraction < 1.0}
+        if ctx["adaptive"]:
+            hf_mask = select_topk_per_graph(hf_score, batch, self.hf_fraction)
+            ctx["hf_mask"] = hf_mask
+            ctx["hf_nodes"] = hf_mask.nonzero().view(-1)
+            ctx["lf_nodes"] = (~hf_mask).nonzero().view(-1)
+            ctx["hf_perm"] = torch.cat([ctx["hf_nodes"], ctx["lf_nodes"]])
+            ctx["hf_new_id"] = torch.empty_like(ctx["hf_perm"])
+            ctx["hf_new_id"][ctx["hf_perm"]] = torch.arange(h.size(0), device=h.device)
+            ctx["edge_index_hf_local"] = self._adaptive_local_edges(ctx, graphs["edge_index_local"])
         
         for i, layer in enumerate(self.layers):
-            
-            # --- A. Physics Graph (Global Context) ---
-            h = layer['physics'](h, batch)
-            
-            # --- B. Local Graph (High Frequency Focus) ---
-            # Select top K nodes with highest gradients/turbulence
-            # This is dynamic: the graph changes based on flow features
-            # (Simplified: we select top 25% nodes per batch)
-            # For simplicity in this implementation, we use KNN on ALL nodes 
-            # but weight them by attention in GAT. 
-            # To strictly follow AMG, we would subsample. 
-            # Here, we stick to a radius graph on full mesh for local detail:
-            edge_index_local = radius_graph(pos, r=0.05, batch=batch, max_num_neighbors=32)
-            h = layer['local'](h, edge_index_local)
-            
-            # --- C. Global Graph (FPS Coarsening) ---
-            # Sample subset of nodes to bridge long distances
-            idx_global = fps(pos, batch, ratio=self.ratio_global)
-            
-            # Global nodes exchange info
-            row, col = knn_graph(pos[idx_global], k=8, batch=batch[idx_global])
-            edge_index_global = torch.stack([idx_global[row], idx_global[col]], dim=0)
-            
-            # We only update the global nodes, then broadcast back?
-            # Standard GNO/AMG approach: Update global nodes, then interpolate back.
-            # Here: We just run GAT on the global edges connected in the full graph context
-            # (A simplification for stability):
-            h_global = h.clone()
-            h_global_out = layer['global'](h_global, edge_index_global)
-            
-            # Residual update only on selected global nodes
-            h[idx_global] = h_global_out[idx_global]
+            if self.checkpoint_activations and self.training:
+                h = checkpoint(self._layer_forward, layer, h, ctx, use_reentrant=False)
+            else:
+                h = self._layer_forward(layer, h, ctx)
 
         return self.decoder(h)
 
+    @staticmethod
+    def _adaptive_local_edges(ctx, edge_index_local):
+        """Local edges ending at a selected node, in selected-first node ids."""
+        edge_index_local = edge_index_local[:, ctx["hf_mask"][edge_index_local[1]]]
+        return ctx["hf_new_id"][edge_index_local]
+
+    def _layer_forward(self, layer, h, ctx):
+        batch, graphs = ctx["batch"], ctx["graphs"]
+        if self.rebuild_graphs_per_layer:
+            with torch.no_grad():
+                rebuilt = build_amg_graphs(ctx["pos"], batch, r_local=self.r_local,
+                                           ratio_global=self.ratio_global)
+            graphs = {**graphs, **{k: rebuilt[k] for k in ("edge_index_local", "edge_index_global",
+                                                          "global_index")}}
+            if ctx["adaptive"]:
+                ctx = {**ctx, "edge_index_hf_local": self._adaptive_local_edges(ctx, graphs["edge_index_local"])}
+        
+        # --- A. Physics Graph (Global Context) ---
+        h = layer['physics'](h, batch)
+        
+        # --- B. Local Graph (High Frequency Focus) ---
+        # Select top K nodes with highest gradients/turbulence
+        # This is dynamic: the selection changes based on flow features.
+        # Selected nodes run GATv2 over all their radius neighbours (only their rows
+        # are written back); the rest get a cheap per-node update.
+        if ctx["adaptive"]:
+            hf_nodes, lf_nodes = ctx["hf_nodes"], ctx["lf_nodes"]
+            h_src = h[ctx["hf_perm"]]
+            h_hf = layer['local'](h_src, ctx["edge_index_hf_local"], x_dst=h_src[:hf_nodes.numel()])
+            h_lf = layer['cheap'](h[lf_nodes])
+            h = h.index_copy(0, hf_nodes, h_hf).index_copy(0, lf_nodes, h_lf)
+        else:
+            # hf_fraction == 1.0: radius graph on the full mesh
+            h = layer['local'](h, graphs["edge_index_local"])
+        
+        # --- C. Global Graph (FPS Coarsening) ---
+        # Subset of nodes (FPS) bridges long distances; global nodes exchange info via kNN
+        idx_global = graphs["global_index"]
+        edge_index_global = graphs["edge_index_global"]
+        
+        # We only update the global nodes, then broadcast back?
+        # Standard GNO/AMG approach: Update global nodes, then interpolate back.
+        # Here: We just run GAT on the global edges connected in the full graph context
+        # (A simplification for stability):
+        h_global = h.clone()
+        h_global_out = layer['global'](h_global, edge_index_global)
+        
+        # Residual update only on selected global nodes
+        h[idx_global] = h_global_out[idx_global]
+        return h
+
+# ==========================================
+# Memory Budget
+# ==========================================
+
+def estimate_amg_memory(num_nodes, num_edges=None, model_dim=128, num_layers=4, heads=4,
+                        num_phys=32, ratio_global=0.2, k_global=8, hf_fraction=1.0,
+                        checkpoint_activations=False, num_params=None, bytes_per_float=4):
+    """
+    Rough peak training memory (bytes) of one FluidAMG step on `num_nodes` total nodes.
+    num_edges is the local radius-graph edge count (default: 32 neighbors per node).
+    Counts the activations autograd keeps per layer, graph index tensors and
+    parameters + grads + Adam state. Meant for sizing batches, not byte accuracy.
+    """
+    N, C, H, P = num_nodes, model_dim, heads, num_phys
+    E_local = num_edges if num_edges is not None else 32 * N
+    E_global = int(ratio_global * N) * k_global
+    
+    def gat_block(n_nodes, n_edges, n_in):
+        # GATv2Conv (concat=False): lin_l/lin_r over the input nodes [n, H, C],
+        # per-edge x_i + x_j and its activation [E, H, C], attention logits/softmax/dropout [E, H]
+        # plus self loops; then residual, 2 LayerNorms and the 2C-wide FFN
+        e = n_edges + n_nodes
+        return 2 * n_in * H * C + 2 * e * H * C + 3 * e * H + 8 * n_nodes * C
+    
+    physics = 4 * N * H * P + 8 * N * C                  # scores/softmax both ways + projections
+    n_local = int(hf_fraction * N)
+    local = gat_block(n_local, int(hf_fraction * E_local), N)   # sources: all nodes
+    if hf_fraction < 1.0:
+        local += 2 * (N - n_local) * C                   # cheap update (linear + norm)
+    global_ = gat_block(N, E_global, N) + N * C          # runs over all nodes + h.clone()
+    per_layer = (physics + local + global_) * bytes_per_float
+    
+    if checkpoint_activations:
+        activations = num_layers * N * C * bytes_per_float + per_layer
+    else:
+        activations = num_layers * per_layer
+    
+    io = N * (8 + 3 + 4 + 1 + 4 * C) * bytes_per_float   # inputs, targets, encoder/decoder
+    graphs = (E_local + E_global + 10 * N) * 2 * 8 + N * 8   # int64 edge indices
+    if num_params is None:
+        num_params = num_layers * (14 * C * C + 2 * H * C * C + P * C) + 4 * C * C
+    params = 4 * num_params * bytes_per_float            # weights, grads, Adam m and v
+    
+    return {
+        "activations": activations,
+        "graphs": graphs,
+        "io": io,
+        "params": params,
+        "total": activations + graphs + io + params,
+    }
+
+def auto_batch_size(budget_bytes, nodes_per_graph, max_batch=64, **estimate_kwargs):
+    """Largest batch of `nodes_per_graph`-node graphs whose estimate fits the budget (min 1)."""
+    batch = 1
+    while batch < max_batch and \
+            estimate_amg_memory((batch + 1) * nodes_per_graph, **estimate_kwargs)["total"] <= budget_bytes:
+        batch += 1
+    return batch
+
 # ==========================================
-# 3. PyG Data Handling
+# 4. PyG Data Handling
 # ==========================================
 
 class FluidPyGDataset(Dataset):
-    def __init__(self, file_list):
+    def __init__(self, file_list, graph_kwargs=None, graph_store_dir=None, ratio_global=0.2,
+                 target_norms=None, graph_cache_mb=2048, graph_store_settings=None):
         super().__init__()
         self.file_list = file_list
+        # {shape_name or None: (mean, std)} from dataset_stats.py; None keeps raw targets
+        self.target_norms = target_norms
+        # If set, graphs are built on CPU here and memoized per case, so with
+        # persistent workers each case's graphs are built only once per run.
+        # Each worker holds its own copy, so the LRU byte budget applies per worker.
+        self.graph_kwargs = graph_kwargs
+        self._graph_cache = OrderedDict()
+        self._graph_cache_bytes = 0
+        self.graph_cache_budget = graph_cache_mb * 1024 ** 2
+        # Precomputed store (precompute_graphs.py) takes priority over building
+        self.graph_store_dir = graph_store_dir
+        self.ratio_global = ratio_global
+        # Entries built with other settings are ignored (graphs are built instead)
+        self.graph_store_settings = graph_store_settings
+        self._store_warned = False
 
     def len(self):
         return len(self.file_list)
@@ -245,6 +586,9 @@ class FluidPyGDataset(Dataset):
         
         # Targets [N, 4]
         y = data_np[:, 3:7].astype(np.float32)
+        if self.target_norms is not None:
+            mean, std = lookup_target_norm(self.target_norms, self.file_list[idx])
+            y = (y - mean) / std
         
         # Masks [N]
         fluid_mask = data_np[:, 8].astype(bool)
@@ -256,122 +600,294 @@ class FluidPyGDataset(Dataset):
             y=torch.from_numpy(y),          # [N, 4]
             mask=torch.from_numpy(fluid_mask)
         )
+        
+        graphs = None
+        if self.graph_store_dir is not None:
+            graphs = load_graph_store(self.graph_store_dir, self.file_list[idx], self.ratio_global,
+                                      settings=self.graph_store_settings, num_nodes=data.num_nodes)
+            if graphs is None and not self._store_warned:
+                print(f"Graph store has no matching entry for {os.path.basename(self.file_list[idx])} "
+                      f"(missing, stale or built with other settings than {self.graph_store_settings}); "
+                      f"building graphs instead. Rerun precompute_graphs.py.")
+                self._store_warned = True
+        if graphs is not None:
+            for key, value in graphs.items():
+                data[key] = value
+        elif self.graph_kwargs is not None:
+            for key, value in self.cached_graphs(idx, data.pos).items():
+                data[key] = value
         return data
 
+    def cached_graphs(self, idx, pos):
+        """build_amg_graphs() memoized per case, evicting least recently used cases over budget."""
+        if idx in self._graph_cache:
+            self._graph_cache.move_to_end(idx)
+            return self._graph_cache[idx]
+        graphs = build_amg_graphs(pos, **self.graph_kwargs)
+        self._graph_cache[idx] = graphs
+        self._graph_cache_bytes += sum(t.numel() * t.element_size() for t in graphs.values())
+        while self._graph_cache_bytes > self.graph_cache_budget and len(self._graph_cache) > 1:
+            _, old = self._graph_cache.popitem(last=False)
+            self._graph_cache_bytes -= sum(t.numel() * t.element_size() for t in old.values())
+        return graphs
+
+class FluidPatchDataset(FluidPyGDataset):
+    """
+    Spatial subdomain patches, so graph size per step no longer depends on mesh resolution.
+    Each item is the ball of the `patch_nodes` nodes closest to a random seed node plus a
+    halo of width `halo`. Loss is only taken on core nodes (mask); the halo just gives
+    the local graphs their neighbors. Coordinates keep the whole-case normalization.
+    """
+    def __init__(self, file_list, patch_nodes=8192, halo=0.05, patches_per_case=4, target_norms=None):
+        super().__init__(file_list, target_norms=target_norms)
+        self.patch_nodes = patch_nodes
+        self.halo = halo
+        self.patches_per_case = patches_per_case
+
+    def len(self):
+        return len(self.file_list) * self.patches_per_case
+
+    def get(self, idx):
+        data = super().get(idx // self.patches_per_case)
+        N = data.num_nodes
+        if N <= self.patch_nodes:
+            return data
+        
+        center = data.pos[torch.randint(N, (1,))]
+        dist = (data.pos - center).norm(dim=1)
+        r_core = dist.kthvalue(self.patch_nodes).values
+        keep = dist <= r_core + self.halo
+        is_core = dist[keep] <= r_core
+        
+        return Data(
+            x=data.x[keep],
+            pos=data.pos[keep],
+            y=data.y[keep],
+            mask=data.mask[keep] & is_core
+        )
+
+@torch.no_grad()
+def predict_tiled(model, data, tile_nodes=8192, halo=0.05):
+    """
+    Full-mesh inference for a single graph with overlapping tiles.
+    Nodes are split into Voronoi cells around FPS centers (~tile_nodes each); every
+    cell is run together with the nodes within `halo` of its extent, and only the
+    cell's own predictions are kept.
+    """
+    pos = data.pos
+    N = pos.size(0)
+    if N <= tile_nodes:
+        return model(Data(x=data.x, pos=pos, batch=pos.new_zeros(N, dtype=torch.long)))
+    
+    n_tiles = math.ceil(N / tile_nodes)
+    centers = fps(pos, ratio=n_tiles / N, random_start=False)
+    _, owner = knn(pos[centers], pos, k=1)   # owner[i] = tile of node i
+    
+    out = None
+    local = torch.full((N,), -1, dtype=torch.long, device=pos.device)
+    for t in range(centers.numel()):
+        core = (owner == t).nonzero().view(-1)
+        if core.numel() == 0:
+            continue
+        dist = (pos - pos[centers[t]]).norm(dim=1)
+        tile = (dist <= dist[core].max() + halo).nonzero().view(-1)
+        
+        pred = model(Data(x=data.x[tile], pos=pos[tile], batch=pos.new_zeros(tile.numel(), dtype=torch.long)))
+        if out is None:
+            out = pred.new_zeros(N, pred.size(1))
+        local[tile] = torch.arange(tile.numel(), device=pos.device)
+        out[core] = pred[local[core]]
+    return out
+
 # ==========================================
-# 4. Visualization & Training
+# 5. Visualization & Training
 # ==========================================
 
-def log_visualizations(model, val_loader, device, epoch):
+def select_vis_cases(val_ds, num_cases):
+    """Collates a fixed CPU batch of validation graphs, reused for every vis epoch."""
+    return Batch.from_data_list([val_ds[i] for i in range(min(num_cases, len(val_ds)))])
+
+def log_visualizations(model, vis_batch, device, epoch, vis_worker, tile_nodes=None, halo=0.05):
     model.eval()
-    batch = next(iter(val_loader))
-    batch = batch.to(device)
     
     with torch.no_grad():
-        pred = model(batch)
-    
-    # Extract First Graph in Batch
-    # batch.batch is a vector [0,0,0... 1,1,1... ]
-    mask_graph0 = (batch.batch == 0) & batch.mask # Only fluid points of graph 0
-    
-    pos = batch.pos[mask_graph0].cpu().numpy()
-    target_p = batch.y[mask_graph0, 3].cpu().numpy() # Pressure
-    pred_p = pred[mask_graph0, 3].cpu().numpy()
+        vis_batch = vis_batch.to(device)
+        if tile_nodes is None:
+            pred = model(vis_batch).cpu()
+        else:
+            pred = torch.cat([predict_tiled(model, g, tile_nodes, halo) for g in vis_batch.to_data_list()]).cpu()
     
-    # 3D Plot
-    fig = plt.figure(figsize=(10, 5))
-    ax1 = fig.add_subplot(1, 2, 1, projection='3d')
-    p1 = ax1.scatter(pos[:,0], pos[:,1], pos[:,2], c=target_p, cmap='jet', s=2)
-    plt.colorbar(p1, ax=ax1)
-    ax1.set_title("Ground Truth Pressure")
+    panels = []
+    for g in range(vis_batch.num_graphs):
+        # Only fluid points of graph g
+        mask_graph = ((vis_batch.batch == g) & vis_batch.mask).cpu()
+        suffix = "" if g == 0 else f"_{g}"
+        panels.append({
+            "key": f"Vis/3D_Pressure{suffix}",
+            "coords": vis_batch.pos.cpu()[mask_graph].numpy(),
+            "target": vis_batch.y.cpu()[mask_graph, 3].numpy(),
+            "pred": pred[mask_graph, 3].numpy(),
+            "truth_title": "Ground Truth Pressure",
+            "pred_title": f"Predicted Pressure (Ep {epoch})",
+            "point_size": 2,
+            "colorbar": True,
+        })
     
-    ax2 = fig.add_subplot(1, 2, 2, projection='3d')
-    p2 = ax2.scatter(pos[:,0], pos[:,1], pos[:,2], c=pred_p, cmap='jet', s=2)
-    plt.colorbar(p2, ax=ax2)
-    ax2.set_title(f"Predicted Pressure (Ep {epoch})")
-    
-    wandb.log({"Vis/3D_Pressure": wandb.Image(fig), "epoch": epoch})
-    plt.close(fig)
+    vis_worker.submit(epoch, panels)
+
+def masked_mse(out, y, mask):
+    """MSE over fluid nodes only. Avoids boolean indexing, which forces a host sync."""
+    per_node = ((out - y) ** 2).mean(dim=-1)
+    m = mask.to(per_node.dtype)
+    return (per_node * m).sum() / m.sum().clamp(min=1)
+
+def log_rendered_visualizations(results):
+    for res in results:
+        images = {k: wandb.Image(v) for k, v in res["images"].items()}
+        wandb.log({**images, "epoch": res["epoch"]})
 
 def main():
     # Setup WandB
-    wandb.init(project=DEFAULT_CONFIG["project_name"], config=DEFAULT_CONFIG)
+    wandb.init(project=DEFAULT_CONFIG["project_name"], config=DEFAULT_CONFIG, mode=DEFAULT_CONFIG["wandb_mode"])
     config = wandb.config
     
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Using {device}")
     
     # Data Setup
-    all_files = sorted(glob.glob(os.path.join(config.data_dir, config.file_pattern)))
+    if config.catalog_query:
+        all_files = query_cases(config.catalog_query, config.data_dir)
+    else:
+        all_files = sorted(glob.glob(os.path.join(config.data_dir, config.file_pattern)))
     if not all_files: raise ValueError("No data found")
     
     split_idx = int(len(all_files) * (1 - config.val_split))
     train_files = all_files[:split_idx]
     val_files = all_files[split_idx:]
     
-    train_ds = FluidPyGDataset(train_files)
-    val_ds = FluidPyGDataset(val_files)
+    graph_kwargs = None
+    if config.cache_graphs:
+        graph_kwargs = {"r_local": config.r_local, "ratio_global": config.ratio_global}
+    target_norms = resolve_target_norms(config.data_dir, config.target_norm, all_files)
+    store_kwargs = {"graph_store_dir": config.graph_store_dir, "ratio_global": config.ratio_global,
+                    "target_norms": target_norms, "graph_cache_mb": config.graph_cache_mb,
+                    "graph_store_settings": graph_store_settings(config.r_local)}
+    patch_mode = config.train_mode == "patch"
+    if patch_mode:
+        # Train on patches; validation still runs on full meshes via overlapping tiles
+        train_ds = FluidPatchDataset(train_files, patch_nodes=config.patch_nodes,
+                                     halo=config.patch_halo, patches_per_case=config.patches_per_case,
+                                     target_norms=target_norms)
+        val_ds = FluidPyGDataset(val_files, target_norms=target_norms)
+    else:
+        train_ds = FluidPyGDataset(train_files, graph_kwargs=graph_kwargs, **store_kwargs)
+        val_ds = FluidPyGDataset(val_files, graph_kwargs=graph_kwargs, **store_kwargs)
+    train_batch_size = config.patch_batch_size if patch_mode else config.batch_size
+    if config.memory_budget_gb:
+        # Size batches for the largest case (or one patch) so no step exceeds the budget
+        if patch_mode:
+            nodes_per_graph = config.patch_nodes
+        else:
+            nodes_per_graph = max(np.load(f, mmap_mode='r').shape[0] for f in train_files)
+        estimate_kwargs = {"model_dim": config.model_dim, "num_layers": config.num_layers,
+                           "ratio_global": config.ratio_global, "hf_fraction": config.hf_fraction,
+                           "checkpoint_activations": config.checkpoint_activations}
+        train_batch_size = auto_batch_size(config.memory_budget_gb * 1e9, nodes_per_graph,
+                                           max_batch=train_batch_size, **estimate_kwargs)
+        est = estimate_amg_memory(train_batch_size * nodes_per_graph, **estimate_kwargs)
+        print(f"Memory budget {config.memory_budget_gb:.1f} GB -> batch size {train_batch_size} "
+              f"({nodes_per_graph} nodes/graph, est. peak {est['total'] / 1e9:.2f} GB, "
+              f"activations {est['activations'] / 1e9:.2f} GB)")
+    tile_nodes = config.patch_nodes if patch_mode else None
     
     # PyG DataLoader handles batching of graphs automatically
-    train_loader = DataLoader(train_ds, batch_size=config.batch_size, shuffle=True, num_workers=4)
+    # (persistent workers keep the per-case graph cache alive between epochs)
+    train_loader = DataLoader(train_ds, batch_size=train_batch_size, shuffle=True, num_workers=4,
+                              persistent_workers=True)
     val_loader = DataLoader(val_ds, batch_size=config.batch_size, shuffle=False)
     
     # Model Setup
     # Input channels = 8 (x,y,z, y_wall, 4 masks)
     model = FluidAMG(in_channels=8+3, out_channels=4, model_dim=config.model_dim, 
-                     num_layers=config.num_layers).to(device)
+                     num_layers=config.num_layers, ratio_global=config.ratio_global,
+                     r_local=config.r_local, hf_fraction=config.hf_fraction,
+                     varlen_attention=config.varlen_attention,
+                     checkpoint_activations=config.checkpoint_activations).to(device)
     
     print(f"Model Parameters: {sum(p.numel() for p in model.parameters())}")
     
     optimizer = torch.optim.Adam(model.parameters(), lr=config.learning_rate)
-    criterion = nn.MSELoss()
     
     wandb.watch(model, log_freq=100)
     
+    vis_worker = VisualizationWorker()
+    vis_batch = select_vis_cases(val_ds, config.vis_num_cases)
+    metrics = MetricsSink(
+        os.path.join(config.metrics_dir, f"{config.project_name}_{datetime.datetime.now():%Y%m%d_%H%M%S}.jsonl"),
+        flush_every=config.log_every, use_wandb=config.wandb_mode != "disabled")
+    profiler = StepProfiler(enabled=config.profile, device=device,
+                            trace_steps=config.profile_trace_steps, trace_dir=config.profile_trace_dir)
+    
     # Training Loop
     best_loss = float('inf')
     
     for epoch in range(config.epochs):
         model.train()
-        total_loss = 0
+        total_loss = torch.zeros((), device=device)
         steps = 0
         
-        for batch in train_loader:
-            batch = batch.to(device)
-            optimizer.zero_grad()
+        for batch in profiler.iterate(train_loader):
+            with profiler.phase("h2d"):
+                batch = batch.to(device)
+            with profiler.phase("optimizer"):
+                optimizer.zero_grad()
             
-            out = model(batch)
+            with profiler.phase("forward"):
+                out = model(batch)
             
             # Loss only on fluid domain
-            mask = batch.mask
-            loss = criterion(out[mask], batch.y[mask])
+            with profiler.phase("loss"):
+                loss = masked_mse(out, batch.y, batch.mask)
             
-            loss.backward()
-            optimizer.step()
+            with profiler.phase("backward"):
+                loss.backward()
+            with profiler.phase("optimizer"):
+                optimizer.step()
             
-            total_loss += loss.item()
+            with profiler.phase("logging"):
+                total_loss += loss.detach()
+                metrics.add(train_step_loss=loss)
+                metrics.step()
             steps += 1
-            wandb.log({"train_step_loss": loss.item()})
+            profiler.step()
             
-        avg_train_loss = total_loss / steps
+        avg_train_loss = total_loss.item() / steps
         
         # Validation
         model.eval()
-        val_loss = 0
+        val_loss = torch.zeros((), device=device)
         val_steps = 0
         with torch.no_grad():
-            for batch in val_loader:
-                batch = batch.to(device)
-                out = model(batch)
-                mask = batch.mask
-                loss = criterion(out[mask], batch.y[mask])
-                val_loss += loss.item()
-                val_steps += 1
+            if patch_mode:
+                for i in range(len(val_ds)):
+                    data = val_ds[i].to(device)
+                    out = predict_tiled(model, data, config.patch_nodes, config.patch_halo)
+                    val_loss += masked_mse(out, data.y, data.mask)
+                    val_steps += 1
+            else:
+                for batch in val_loader:
+                    batch = batch.to(device)
+                    out = model(batch)
+                    val_loss += masked_mse(out, batch.y, batch.mask)
+                    val_steps += 1
         
-        avg_val_loss = val_loss / val_steps
+        avg_val_loss = val_loss.item() / val_steps
         
         print(f"Epoch {epoch} | Train: {avg_train_loss:.5f} | Val: {avg_val_loss:.5f}")
-        wandb.log({"epoch": epoch, "train_loss": avg_train_loss, "val_loss": avg_val_loss})
+        step_profile = profiler.summary(epoch)
+        if step_profile:
+            metrics.log({f"profile/{k}_ms": v for k, v in step_profile.items()})
+        metrics.log({"epoch": epoch, "train_loss": avg_train_loss, "val_loss": avg_val_loss})
         
         # Checkpointing
         if avg_val_loss < best_loss:
@@ -381,8 +897,13 @@ def main():
             
         # Vis
         if epoch % config.vis_frequency == 0:
-            log_visualizations(model, val_loader, device, epoch)
+            log_visualizations(model, vis_batch, device, epoch, vis_worker,
+                               tile_nodes=tile_nodes, halo=config.patch_halo)
+        log_rendered_visualizations(vis_worker.drain())
 
+    log_rendered_visualizations(vis_worker.close())
+    profiler.close()
+    metrics.close()
     wandb.finish()
 
 if __name__ == "__main__":
@@ -8,6 +8,10 @@ PURPOSE:
 
 USAGE:
     python train_pointnetv1.py
+    python train_pointnetv1.py --resume                      # continue from weights/last.pth
+    python train_pointnetv1.py --resume weights/model_<date>_ep<N>.pth
+    python train_pointnetv1.py --follow      # grow the dataset from the catalog while generating
+                                             # (run both with pipeline.py)
 
 PREREQUISITES:
     1. Generate dataset using generate_dataset.py (data_output/ directory with .npy files)
@@ -22,6 +26,14 @@ CONFIGURATION (Edit DEFAULT_CONFIG, lines 20-34):
     scaling: Model width multiplier (0.25-2.0, default: 1.0)
     val_split: Validation split ratio (default: 0.2 = 20%)
     vis_frequency: Epoch interval for visualization logging (default: 99)
+    vis_num_cases: Number of fixed validation cases rendered each vis epoch (default: 2)
+    checkpoint_frequency: Epoch interval for periodic full checkpoints (default: 25)
+    seed: Seed for shuffling and point resampling (makes --resume exact)
+    log_every: Steps between aggregated batch-loss flushes (default: 50)
+    metrics_dir: Directory for the local JSONL metrics log (default: './metrics')
+    wandb_mode: "online", "offline" or "disabled" (local metrics are always written)
+    profile: Time every step phase and print a per-epoch breakdown (default: False)
+    profile_trace_steps: If > 0, also record a torch.profiler trace of that many steps
 
 ARCHITECTURE:
     PointNet segmentation network with:
@@ -31,20 +43,26 @@ ARCHITECTURE:
     
 TRAINING FEATURES:
     - Gradient clipping (max_norm=1.0) for stability
-    - Target normalization (velocity by magnitude, pressure by std)
+    - Target normalization: fixed dataset-wide mean/std from dataset_stats.py
+      ("target_norm": "global" | "shape"), or per sample ("sample": velocity by
+      magnitude, pressure by std)
     - ReduceLROnPlateau scheduler (patience=10, factor=0.5)
     - Masked loss on fluid points only (excludes boundaries)
+    - Validation on fixed farthest-point prefixes when build_lods.py has run ("lod_mode")
     - W&B logging (auto offline mode if no API key)
 
 OUTPUT:
-    - weights/best_model.pth : Best validation loss checkpoint
-    - weights/model_<date>_ep<N>.pth : Periodic checkpoints
+    - weights/best_model.pth : Best validation loss checkpoint (model state dict only)
+    - weights/last.pth : Full training state after the latest epoch (used by --resume)
+    - weights/model_<date>_ep<N>.pth : Periodic full training-state checkpoints
+    - metrics/<project>_<timestamp>.jsonl : Aggregated step and epoch metrics (always written)
     - wandb/ : Training logs and visualizations (if online)
     
 PERFORMANCE:
     - Expected val loss: ~0.02-0.04 (normalized MSE)
     - Training time: ~6-12 hours on GPU for 500 epochs
-    - Visualization: 3D scatter plots of pressure and velocity magnitude
+    - Visualization: 3D scatter plots of pressure and velocity magnitude, rendered in a
+      background process (vis_worker.py) so epochs never wait on matplotlib
 
 TROUBLESHOOTING:
     - Out of memory: Reduce batch_size or scaling parameter
@@ -64,20 +82,30 @@ train_pointnetv1.py - PointNet CFD Flow Predictor Training
 train_pointnetv1.py - PointNet CFD Flow Predictor Training
 """
 
+import argparse
 import datetime
+import hashlib
+import multiprocessing as mp
 import os
 import glob
+import time
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
 import wandb
-import matplotlib
-matplotlib.use('Agg') 
-import matplotlib.pyplot as plt
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, RandomSampler
 from sklearn.model_selection import train_test_split
 
+from case_catalog import query_cases
+from build_lods import lod_entry, load_lod_index, read_lod
+from case_codec import CASE_EXT, CompressedCase
+from dataset_stats import lookup_target_norm, resolve_target_norms
+from checkpointing import CheckpointWriter, build_checkpoint, load_checkpoint
+from metrics_sink import MetricsSink
+from step_profiler import StepProfiler
+from vis_worker import VisualizationWorker
+
 # ==========================================
 # 1. Configuration
 # ==========================================
@@ -86,6 +114,7 @@ DEFAULT_CONFIG = {
     "project_name": "ST_CFDAI",
     "data_dir": "./data_output",
     "file_pattern": "*.npy", 
+    "catalog_query": None,      # SQL WHERE clause on <data_dir>/catalog.sqlite, replaces file_pattern
     "batch_size": 32,
     "num_points": 4096,         
     "learning_rate": 1e-3,      
@@ -94,9 +123,23 @@ DEFAULT_CONFIG = {
     "scaling": 1.0,
     "val_split": 0.15,
     "vis_frequency": 10, 
+    "vis_num_cases": 2,
     "num_workers": 4,           
     "input_channels": 8,
-    "output_channels": 4 
+    "output_channels": 4,
+    "checkpoint_frequency": 25,
+    "seed": 42,
+    "log_every": 50,
+    "metrics_dir": "./metrics",
+    "wandb_mode": "online",
+    "profile": False,
+    "profile_trace_steps": 0,
+    "profile_trace_dir": "./profiler_traces",
+    "target_norm": "global",      # "global" | "shape": fixed stats from dataset_stats.py | "sample": per-sample
+    "lod_mode": "val",            # FPS prefixes from build_lods.py: "val" | "all" (train too) | None
+    "lod_train_factor": 4,        # "all": train points drawn from the lod_train_factor * num_points prefix
+    "follow_min_cases": 16,       # --follow: cases in the catalog before the first epoch
+    "follow_poll_seconds": 30     # --follow: wait between catalog polls while below follow_min_cases
 }
 
 os.makedirs("weights", exist_ok=True)
@@ -106,9 +149,24 @@ os.makedirs("weights", exist_ok=True)
 # ==========================================
 
 class FluidDataset(Dataset):
-    def __init__(self, file_list, num_points=4096):
+    def __init__(self, file_list, num_points=4096, seed=None, target_norms=None, lod_index=None, lod_factor=1):
         self.file_list = file_list
         self.num_points = num_points
+        # {case_name: entry} from build_lods.py: read FPS prefixes instead of the whole case.
+        # lod_factor 1 uses the num_points prefix itself (deterministic, e.g. validation);
+        # > 1 draws num_points at random from the lod_factor * num_points prefix.
+        self.lod_index = lod_index
+        self.lod_factor = lod_factor
+        # {shape_name or None: (mean, std)} from dataset_stats.py; None = per-sample normalization
+        self.target_norms = target_norms
+        # With a seed, the point subset of a sample depends only on (seed, epoch, idx),
+        # so worker processes stay reproducible across restarts.
+        # The epoch lives in shared memory so persistent workers see set_epoch().
+        self.seed = seed
+        self._epoch = mp.Value('i', 0)
+
+    def set_epoch(self, epoch):
+        self._epoch.value = epoch
 
     def load_file(self, file_path):
         try:
@@ -142,7 +200,48 @@ class FluidDataset(Dataset):
     def __len__(self):
         return len(self.file_list)
 
+    def _rng(self, idx):
+        if self.seed is not None:
+            return np.random.default_rng([self.seed, self._epoch.value, idx])
+        return np.random
+
+    def load_compressed(self, file_path, rng):
+        """Sampled rows of a .cfdz case; only the chunks holding them are decompressed."""
+        try:
+            case = CompressedCase(file_path)
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+            return None
+        # Same checks as below, answered from the header
+        if len(case) == 0 or case.nonfinite or case.max_abs_target > 1e10:
+            return None
+        return case.take(rng.choice(len(case), self.num_points, replace=len(case) < self.num_points))
+
+    def load_lod(self, file_path, idx):
+        """FPS-prefix sample, or None (no LOD or bad data) to fall back to the full case."""
+        try:
+            sample = read_lod(file_path, self.num_points * self.lod_factor, self.lod_index)
+        except Exception as e:
+            print(f"Error loading LOD of {file_path}: {e}")
+            return None
+        if sample is None or not np.all(np.isfinite(sample)) or np.max(np.abs(sample[:, 3:7])) > 1e10:
+            return None
+        if self.lod_factor > 1:
+            sample = sample[self._rng(idx).choice(sample.shape[0], self.num_points, replace=False)]
+        return sample
+
     def __getitem__(self, idx):
+        if self.lod_index:
+            sample = self.load_lod(self.file_list[idx], idx)
+            if sample is not None:
+                return self.process_sample(sample, idx)
+
+        if self.file_list[idx].endswith(CASE_EXT):
+            sample = self.load_compressed(self.file_list[idx], self._rng(idx))
+            if sample is None:
+                return self._get_empty_sample()
+            return self.process_sample(sample, idx)
+
         # 1. Load Data
         sample = self.load_file(self.file_list[idx])
         
@@ -164,13 +263,16 @@ class FluidDataset(Dataset):
         total_points = sample.shape[0]
 
         # 2. RESAMPLING
+        rng = self._rng(idx)
         if total_points >= self.num_points:
-            choice_idx = np.random.choice(total_points, self.num_points, replace=False)
+            choice_idx = rng.choice(total_points, self.num_points, replace=False)
         else:
-            choice_idx = np.random.choice(total_points, self.num_points, replace=True)
+            choice_idx = rng.choice(total_points, self.num_points, replace=True)
         
         sample = sample[choice_idx, :] 
+        return self.process_sample(sample, idx)
 
+    def process_sample(self, sample, idx):
         # 3. Process Features
         coords = sample[:, 0:3].astype(np.float32)
         
@@ -188,25 +290,29 @@ class FluidDataset(Dataset):
         x_in = x_in.transpose(1, 0) 
 
         # 4. Process Targets (u, v, w, p)
-        # Use float64 for stats calculation to prevent overflow warnings
-        y_out_raw = sample[:, 3:7].astype(np.float64)
-        
-        # Normalize Velocity
-        vel_mag = np.linalg.norm(y_out_raw[:, 0:3], axis=1, keepdims=True)
-        max_vel = np.max(vel_mag)
-        
-        # Normalize Pressure
-        p_mean = np.mean(y_out_raw[:, 3])
-        p_std = np.std(y_out_raw[:, 3])
-
-        # Apply Normalization (Back to float32)
         y_out = sample[:, 3:7].astype(np.float32)
 
-        if max_vel > 1e-6:
-            y_out[:, 0:3] /= max_vel
-        
-        if p_std > 1e-6:
-            y_out[:, 3] = (y_out[:, 3] - p_mean) / p_std
+        if self.target_norms is not None:
+            # Fixed dataset-wide normalizers: same physical scale for every sample
+            mean, std = lookup_target_norm(self.target_norms, self.file_list[idx])
+            y_out = (y_out - mean) / std
+        else:
+            # Use float64 for stats calculation to prevent overflow warnings
+            y_out_raw = sample[:, 3:7].astype(np.float64)
+            
+            # Normalize Velocity
+            vel_mag = np.linalg.norm(y_out_raw[:, 0:3], axis=1, keepdims=True)
+            max_vel = np.max(vel_mag)
+            
+            # Normalize Pressure
+            p_mean = np.mean(y_out_raw[:, 3])
+            p_std = np.std(y_out_raw[:, 3])
+
+            if max_vel > 1e-6:
+                y_out[:, 0:3] /= max_vel
+            
+            if p_std > 1e-6:
+                y_out[:, 3] = (y_out[:, 3] - p_mean) / p_std
             
         y_out = y_out.transpose(1, 0)
 
@@ -220,7 +326,7 @@ class FluidDataset(Dataset):
 # ==========================================
 
 class PointNetFluid(nn.Module):
-    def __init__(self, input_channels=8, output_channels=4, scaling=1.0):
+    def __init__(self, input_channels=8, output_channels=4, scaling=1.0, dropout=0.0):
         super(PointNetFluid, self).__init__()
         s = scaling
         self.conv1 = nn.Conv1d(input_channels, int(64*s), 1)
@@ -242,6 +348,8 @@ class PointNetFluid(nn.Module):
         self.conv8 = nn.Conv1d(int(256*s), int(128*s), 1)
         self.bn8 = nn.BatchNorm1d(int(128*s))
         self.conv9 = nn.Conv1d(int(128*s), output_channels, 1)
+        # Head dropout (no parameters, so checkpoints load with any rate); used for MC-dropout
+        self.drop = nn.Dropout(dropout)
 
     def forward(self, x):
         n_pts = x.size(2)
@@ -258,8 +366,8 @@ class PointNetFluid(nn.Module):
 
         x = torch.cat([local_feat, global_feat], dim=1)
 
-        x = F.relu(self.bn6(self.conv6(x)))
-        x = F.relu(self.bn7(self.conv7(x)))
+        x = self.drop(F.relu(self.bn6(self.conv6(x))))
+        x = self.drop(F.relu(self.bn7(self.conv7(x))))
         x = F.relu(self.bn8(self.conv8(x)))
         x = self.conv9(x)
         return x
@@ -268,101 +376,226 @@ class PointNetFluid(nn.Module):
 # 4. Utilities
 # ==========================================
 
-def create_comparison_plot(coords, target, pred, title_prefix):
-    if coords.shape[0] > 2000:
-        idx = np.random.choice(coords.shape[0], 2000, replace=False)
-        coords = coords[idx]
-        target = target[idx]
-        pred = pred[idx]
-
-    fig = plt.figure(figsize=(10, 5))
-    ax1 = fig.add_subplot(1, 2, 1, projection='3d')
-    sc1 = ax1.scatter(coords[:,0], coords[:,1], coords[:,2], c=target, cmap='jet', s=5, alpha=0.7)
-    ax1.set_title(f"Truth: {title_prefix}")
-    ax1.axis('off')
-    
-    ax2 = fig.add_subplot(1, 2, 2, projection='3d')
-    sc2 = ax2.scatter(coords[:,0], coords[:,1], coords[:,2], c=pred, cmap='jet', s=5, alpha=0.7)
-    ax2.set_title(f"Pred: {title_prefix}")
-    ax2.axis('off')
-    plt.tight_layout()
-    return fig
-
-def log_visualizations(model, val_loader, device, epoch):
+def select_vis_cases(val_ds, num_cases):
+    """Collates a fixed CPU batch of validation cases, reused for every vis epoch."""
+    samples = [val_ds[i] for i in range(min(num_cases, len(val_ds)))]
+    inputs, targets, masks = (torch.stack(t) for t in zip(*samples))
+    return inputs, targets, masks
+
+def log_visualizations(model, vis_batch, device, epoch, vis_worker):
     model.eval()
-    try:
-        inputs, targets, masks = next(iter(val_loader))
-    except StopIteration:
-        return
+    inputs, targets, _ = vis_batch
 
-    inputs, targets = inputs.to(device), targets.to(device)
-    
     with torch.no_grad():
-        preds = model(inputs)
-
-    idx = 0
-    coords = inputs[idx].cpu().numpy().transpose(1, 0)[:, 0:3]
-    y_true = targets[idx].cpu().numpy().transpose(1, 0)
-    y_pred = preds[idx].cpu().numpy().transpose(1, 0)
-    
-    fig_p = create_comparison_plot(coords, y_true[:, 3], y_pred[:, 3], "Pressure")
-    v_true = np.linalg.norm(y_true[:,0:3], axis=1)
-    v_pred = np.linalg.norm(y_pred[:,0:3], axis=1)
-    fig_v = create_comparison_plot(coords, v_true, v_pred, "Velocity Mag")
-
-    wandb.log({"Vis/Pressure": wandb.Image(fig_p), "Vis/Velocity": wandb.Image(fig_v), "epoch": epoch})
-    plt.close(fig_p)
-    plt.close(fig_v)
+        preds = model(inputs.to(device)).cpu().numpy()
+
+    panels = []
+    for idx in range(inputs.size(0)):
+        coords = inputs[idx].numpy().transpose(1, 0)[:, 0:3]
+        y_true = targets[idx].numpy().transpose(1, 0)
+        y_pred = preds[idx].transpose(1, 0)
+        suffix = "" if idx == 0 else f"_{idx}"
+
+        panels.append({"key": f"Vis/Pressure{suffix}", "coords": coords,
+                       "target": y_true[:, 3], "pred": y_pred[:, 3],
+                       "truth_title": "Truth: Pressure", "pred_title": "Pred: Pressure"})
+        panels.append({"key": f"Vis/Velocity{suffix}", "coords": coords,
+                       "target": np.linalg.norm(y_true[:, 0:3], axis=1),
+                       "pred": np.linalg.norm(y_pred[:, 0:3], axis=1),
+                       "truth_title": "Truth: Velocity Mag", "pred_title": "Pred: Velocity Mag"})
+
+    vis_worker.submit(epoch, panels)
+
+def masked_loss(loss_raw, masks):
+    """Mean loss over fluid points (all points if a batch has none), without a host sync."""
+    per_point = loss_raw.mean(dim=1)
+    m = masks.to(per_point.dtype)
+    n_valid = m.sum()
+    fluid_mean = (per_point * m).sum() / n_valid.clamp(min=1)
+    return torch.where(n_valid > 0, fluid_mean, per_point.mean())
+
+def guarded_step(optimizer, step_ok):
+    """optimizer.step() unless step_ok (bool tensor) is False, without a host sync on CUDA.
+
+    Fused Adam takes the flag as found_inf (the GradScaler protocol) and skips the
+    parameter, moment and step-count update on the device. Reading the flag on CPU
+    costs nothing, so the unfused CPU optimizer is gated in Python.
+    """
+    if optimizer.defaults.get("fused"):
+        optimizer.found_inf = (~step_ok).to(torch.float32)
+        optimizer.step()
+    elif step_ok:
+        optimizer.step()
+
+def log_rendered_visualizations(results):
+    for res in results:
+        images = {k: wandb.Image(v) for k, v in res["images"].items()}
+        wandb.log({**images, "epoch": res["epoch"]})
 
 # ==========================================
 # 5. Main Loop
 # ==========================================
 
 def get_file_list(config):
+    if config.catalog_query:
+        files = query_cases(config.catalog_query, config.data_dir)
+        if not files:
+            raise ValueError(f"No cases match catalog query: {config.catalog_query}")
+        return files
     pattern = os.path.join(config.data_dir, config.file_pattern)
     files = sorted(glob.glob(pattern))
     if not files:
         raise ValueError(f"No files found in {pattern}")
     return files
 
+def follow_file_list(config):
+    """Catalog cases that exist on disk (the generator publishes each case as it finishes)."""
+    try:
+        files = query_cases(config.catalog_query, config.data_dir)
+    except FileNotFoundError:
+        return []
+    return [f for f in files if os.path.exists(f)]
+
+def wait_for_cases(config):
+    while True:
+        files = follow_file_list(config)
+        # At least one validation case is needed (fixed vis batch, val loss)
+        if len(files) >= config.follow_min_cases and split_by_hash(files, config.val_split)[1]:
+            return files
+        print(f"Waiting for cases: {len(files)}/{config.follow_min_cases} in the catalog")
+        time.sleep(config.follow_poll_seconds)
+
+def split_by_hash(files, val_split):
+    """
+    Train/val split from a hash of each case name: a case keeps its side as the
+    dataset grows, whatever order cases arrive in.
+    """
+    def is_val(f):
+        h = hashlib.sha1(os.path.basename(f).encode()).digest()
+        return int.from_bytes(h[:4], "big") / 2**32 < val_split
+    return [f for f in files if not is_val(f)], [f for f in files if is_val(f)]
+
+def build_loaders(train_files, val_files, config, target_norms, loader_gen, num_workers, lod_index=None):
+    train_ds = FluidDataset(train_files, num_points=config.num_points, seed=config.seed,
+                            target_norms=target_norms,
+                            lod_index=lod_index if config.lod_mode == "all" else None,
+                            lod_factor=config.lod_train_factor)
+    val_ds = FluidDataset(val_files, num_points=config.num_points, seed=config.seed,
+                          target_norms=target_norms,
+                          lod_index=lod_index if config.lod_mode in ("val", "all") else None)
+    # Shuffle order comes from its own generator, re-seeded from (seed, epoch) every epoch:
+    # loader_gen also hands out worker base seeds whenever an iterator is created, which
+    # with persistent workers happens at a different epoch after --resume
+    sampler = RandomSampler(train_ds, generator=torch.Generator())
+    train_loader = DataLoader(train_ds, batch_size=config.batch_size, sampler=sampler,
+                              num_workers=num_workers, pin_memory=True, persistent_workers=num_workers > 0,
+                              generator=loader_gen)
+    val_loader = DataLoader(val_ds, batch_size=config.batch_size, shuffle=False, 
+                            num_workers=num_workers, pin_memory=True, persistent_workers=num_workers > 0)
+    return train_ds, val_ds, train_loader, val_loader
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the PointNet CFD flow predictor.")
+    parser.add_argument("--resume", nargs="?", const="weights/last.pth", default=None,
+                        help="Resume from a full checkpoint (default: weights/last.pth)")
+    parser.add_argument("--follow", action="store_true",
+                        help="Train while generate_dataset.py runs: re-read the catalog every epoch")
+    parser.add_argument("--num-workers", type=int, default=None, help="Override num_workers")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op CPU threads")
+    return parser.parse_args()
+
 def main():
-    wandb.init(project=DEFAULT_CONFIG["project_name"], config=DEFAULT_CONFIG, mode="online")
+    args = parse_args()
+    wandb.init(project=DEFAULT_CONFIG["project_name"], config=DEFAULT_CONFIG, mode=DEFAULT_CONFIG["wandb_mode"])
     config = wandb.config 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     print(f"Device: {device}")
 
-    all_files = get_file_list(config)
-    train_files, val_files = train_test_split(all_files, test_size=config.val_split, random_state=42)
+    torch.manual_seed(config.seed)
+    np.random.seed(config.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    num_workers = args.num_workers if args.num_workers is not None else config.num_workers
+
+    if args.follow:
+        all_files = wait_for_cases(config)
+        train_files, val_files = split_by_hash(all_files, config.val_split)
+    else:
+        all_files = get_file_list(config)
+        train_files, val_files = train_test_split(all_files, test_size=config.val_split, random_state=42)
     
-    train_ds = FluidDataset(train_files, num_points=config.num_points)
-    val_ds = FluidDataset(val_files, num_points=config.num_points)
+    target_norms = resolve_target_norms(config.data_dir, config.target_norm, all_files)
+    lod_index = load_lod_index(config.data_dir) if config.lod_mode else {}
+    if config.lod_mode:
+        n_lod = sum(lod_entry(lod_index, f) is not None for f in all_files)
+        print(f"LOD prefixes ({config.lod_mode}): {n_lod}/{len(all_files)} cases indexed"
+              + ("" if n_lod == len(all_files) else " - run build_lods.py (others sample randomly)"))
 
-    train_loader = DataLoader(train_ds, batch_size=config.batch_size, shuffle=True, 
-                              num_workers=config.num_workers, pin_memory=True, persistent_workers=True)
-    val_loader = DataLoader(val_ds, batch_size=config.batch_size, shuffle=False, 
-                            num_workers=config.num_workers, pin_memory=True, persistent_workers=True)
+    # Dedicated generator drives shuffling and worker seeding; saved in every checkpoint
+    loader_gen = torch.Generator()
+    loader_gen.manual_seed(config.seed)
+
+    train_ds, val_ds, train_loader, val_loader = build_loaders(
+        train_files, val_files, config, target_norms, loader_gen, num_workers, lod_index)
 
     model = PointNetFluid(input_channels=config.input_channels, 
                           output_channels=config.output_channels, 
                           scaling=config.scaling).to(device)
     
-    optimizer = torch.optim.Adam(model.parameters(), lr=config.learning_rate)
+    # Fused on CUDA: one kernel per step, and it can skip a bad step on the device (guarded_step)
+    optimizer = torch.optim.Adam(model.parameters(), lr=config.learning_rate, fused=device.type == "cuda")
     scheduler = torch.optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=15)
     criterion = nn.MSELoss(reduction='none')
 
     print(f"Training on {len(train_files)} files. Point count fixed to {config.num_points}.")
 
     best_val_loss = float('inf')
-
-    for epoch in range(config.epochs):
+    start_epoch = 0
+
+    if args.resume:
+        ckpt = load_checkpoint(args.resume, model, optimizer, scheduler, loader_gen, device=device)
+        start_epoch = ckpt["epoch"] + 1
+        best_val_loss = ckpt["best_val_loss"]
+        print(f"Resumed from {args.resume} at epoch {start_epoch} (best val {best_val_loss:.5f})")
+
+    ckpt_writer = CheckpointWriter()
+    vis_worker = VisualizationWorker()
+    vis_batch = select_vis_cases(val_ds, config.vis_num_cases)
+    run_stamp = datetime.datetime.now().strftime("%Y%m%d")
+    metrics = MetricsSink(
+        os.path.join(config.metrics_dir, f"{config.project_name}_{datetime.datetime.now():%Y%m%d_%H%M%S}.jsonl"),
+        flush_every=config.log_every, use_wandb=config.wandb_mode != "disabled")
+    profiler = StepProfiler(enabled=config.profile, device=device,
+                            trace_steps=config.profile_trace_steps, trace_dir=config.profile_trace_dir)
+
+    for epoch in range(start_epoch, config.epochs):
+        if args.follow:
+            new_files = follow_file_list(config)
+            if len(new_files) > len(all_files):
+                all_files = new_files
+                train_files, new_val_files = split_by_hash(all_files, config.val_split)
+                if new_val_files != val_files:
+                    # Val losses on different sets are not comparable
+                    best_val_loss = float('inf')
+                val_files = new_val_files
+                del train_loader, val_loader   # Shuts down the old persistent workers
+                train_ds, val_ds, train_loader, val_loader = build_loaders(
+                    train_files, val_files, config, target_norms, loader_gen, num_workers, lod_index)
+                print(f"Dataset grew to {len(all_files)} cases ({len(train_files)} train / {len(val_files)} val)")
+                metrics.log({"num_cases": len(all_files), "epoch": epoch})
+        train_ds.set_epoch(epoch)
+        train_loader.sampler.generator.manual_seed(config.seed * 1_000_003 + epoch)
         model.train()
-        train_loss_accum = 0.0
-        count = 0
+        # Epoch accumulators stay on-device; read once at the end of the epoch
+        train_loss_accum = torch.zeros((), device=device)
+        count = torch.zeros((), device=device)
+        n_train_steps = 0
         
-        for i, (inputs, targets, masks) in enumerate(train_loader):
-            inputs = inputs.to(device, non_blocking=True)
-            targets = targets.to(device, non_blocking=True)
-            masks = masks.to(device, non_blocking=True)
+        for i, (inputs, targets, masks) in enumerate(profiler.iterate(train_loader)):
+            with profiler.phase("h2d"):
+                inputs = inputs.to(device, non_blocking=True)
+                targets = targets.to(device, non_blocking=True)
+                masks = masks.to(device, non_blocking=True)
             
             # --- DEBUG: CHECK DATA INTEGRITY (Run once per epoch) ---
             if i == 0 and epoch == 0:
@@ -373,33 +606,41 @@ def main():
                 print("------------------------------\n")
             # ---------------------------------------------------------
 
-            optimizer.zero_grad()
-            outputs = model(inputs)
+            with profiler.phase("optimizer"):
+                optimizer.zero_grad()
+            with profiler.phase("forward"):
+                outputs = model(inputs)
+
+            with profiler.phase("loss"):
+                loss = masked_loss(criterion(outputs, targets), masks)
+                finite = torch.isfinite(loss)
 
-            loss_raw = criterion(outputs, targets) 
-            
-            # Robust Loss Calculation
-            valid_points = masks.sum()
-            if valid_points > 0:
-                loss = loss_raw.mean(dim=1)[masks].mean()
-            else:
-                loss = loss_raw.mean()
-
-            if not torch.isnan(loss):
+            with profiler.phase("backward"):
                 loss.backward()
-                torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
-                optimizer.step()
-                train_loss_accum += loss.item()
-                count += 1
-                wandb.log({"batch_loss": loss.item()})
-            else:
-                print(f"NaN loss detected at batch {i}")
-
-        avg_train = train_loss_accum / max(count, 1)
+            with profiler.phase("clip_grad"):
+                total_norm = torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+                # Skip the update on a non-finite loss or gradient: stepping Adam on
+                # zeroed gradients would still apply its momentum
+                step_ok = finite & torch.isfinite(total_norm)
+            with profiler.phase("optimizer"):
+                guarded_step(optimizer, step_ok)
+
+            with profiler.phase("logging"):
+                train_loss_accum += torch.where(finite, loss.detach(), 0.0)
+                count += finite
+                metrics.add(batch_loss=loss)
+                metrics.step()
+            n_train_steps += 1
+            profiler.step()
+
+        count = int(count.item())
+        avg_train = train_loss_accum.item() / max(count, 1)
+        if count < n_train_steps:
+            print(f"NaN loss detected in {n_train_steps - count} batches")
 
         model.eval()
-        val_loss_accum = 0.0
-        val_count = 0
+        val_loss_accum = torch.zeros((), device=device)
+        val_count = torch.zeros((), device=device)
         with torch.no_grad():
             for inputs, targets, masks in val_loader:
                 inputs = inputs.to(device, non_blocking=True)
@@ -407,30 +648,38 @@ def main():
                 masks = masks.to(device, non_blocking=True)
                 
                 outputs = model(inputs)
-                loss_raw = criterion(outputs, targets)
+                val_loss = masked_loss(criterion(outputs, targets), masks)
                 
-                if masks.sum() > 0:
-                    val_loss = loss_raw.mean(dim=1)[masks].mean()
-                else:
-                    val_loss = loss_raw.mean()
-                
-                if not torch.isnan(val_loss):
-                    val_loss_accum += val_loss.item()
-                    val_count += 1
+                finite = torch.isfinite(val_loss)
+                val_loss_accum += torch.where(finite, val_loss, 0.0)
+                val_count += finite
 
-        avg_val = val_loss_accum / max(val_count, 1)
+        avg_val = val_loss_accum.item() / max(val_count.item(), 1)
         scheduler.step(avg_val)
 
         print(f"Epoch {epoch+1} | Train: {avg_train:.5f} | Val: {avg_val:.5f}")
-        wandb.log({"train_loss": avg_train, "val_loss": avg_val, "epoch": epoch, "lr": optimizer.param_groups[0]['lr']})
+        step_profile = profiler.summary(epoch)
+        if step_profile:
+            metrics.log({f"profile/{k}_ms": v for k, v in step_profile.items()})
+        metrics.log({"train_loss": avg_train, "val_loss": avg_val, "epoch": epoch, "lr": optimizer.param_groups[0]['lr']})
 
         if avg_val < best_val_loss:
             best_val_loss = avg_val
-            torch.save(model.state_dict(), "weights/best_model.pth")
+            ckpt_writer.save(model.state_dict(), "weights/best_model.pth")
+
+        state = build_checkpoint(model, optimizer, scheduler, epoch, best_val_loss, config, loader_gen)
+        ckpt_writer.save(state, "weights/last.pth")
+        if (epoch + 1) % config.checkpoint_frequency == 0:
+            ckpt_writer.save(state, f"weights/model_{run_stamp}_ep{epoch+1}.pth")
             
         if epoch % config.vis_frequency == 0:
-            log_visualizations(model, val_loader, device, epoch)
+            log_visualizations(model, vis_batch, device, epoch, vis_worker)
+        log_rendered_visualizations(vis_worker.drain())
 
+    log_rendered_visualizations(vis_worker.close())
+    profiler.close()
+    metrics.close()
+    ckpt_writer.close()
     wandb.finish()
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+"""
+tune_solver.py - Per-Shape fvSolution Autotuner
+
+PURPOSE:
+    One fvSolution does not suit every shape: valves and obstacles need far more
+    SIMPLE iterations than straight pipes. For each shape this meshes a few
+    representative design points once, then solves them with small grids of
+    settings, one stage at a time (each stage starts from the best of the previous):
+    - relaxation : U and k/epsilon relaxation factors
+    - gamg       : GAMG smoother, agglomerator and coarsest-level size for p
+    - tolerances : relative tolerances of the p and U/k/epsilon solvers
+    The best profile per shape goes to solver_profiles.json, and
+    generate_dataset.generate_case_files writes it as system/fvSolution of every
+    case of that shape.
+
+USAGE:
+    python tune_solver.py                               # all shapes, 2 cases each
+    python tune_solver.py --shapes valve obstacle --cases-per-shape 3 --cores 6
+    python tune_solver.py --backend mock --cases-per-shape 1    # dry run of the harness
+
+OUTPUT:
+    solver_profiles.json:
+        stages : the grids that were searched
+        shapes : {shape: {"profile", "iterations", "wall_s", "baseline_iterations",
+                          "baseline_wall_s", "converged", "cases"}}
+    solver_tuning/trials.jsonl : one line per (shape, case, settings) solve.
+
+NOTES:
+    - A profile is ranked by how many of its cases did not converge (residualControl
+      before endTime), then by total simpleFoam wall time. The template settings are
+      always a candidate, so a tuned profile is never slower on the tuning cases.
+    - Each worker solves all trials of one case one after another, so trials of a
+      case share the same load; use --cores up to the number of physical cores.
+    - Shapes with the potentialFoam pre-stage (generate_dataset.POTENTIAL_INIT) are
+      tuned with it; 0/ is restored from 0.orig/ before every trial.
+    - Shapes not tuned in a run keep their entry. Delete solver_profiles.json to go
+      back to reset_template.py's fvSolution everywhere.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+from multiprocessing import Pool
+
+from doe import base_space, extend_design
+from generate_dataset import (DIAMETERS, DOE_METHOD, LENGTHS, REFINEMENTS, SHAPE_HANDLERS,
+                              SOLVER_PROFILES_FILE, TEMPLATE_DIR, VELOCITIES, generate_case_files,
+                              use_potential_init)
+from solver_backends import DEFAULT_SOLVER_PROFILE, fv_solution, get_backend
+
+# --- Configuration ---
+TUNE_DIR = "solver_tuning"
+CASES_PER_SHAPE = 2
+TUNE_SEED = 7                    # Different from DOE_SEED: tuning cases are not dataset cases
+TUNE_REFINEMENT = REFINEMENTS[len(REFINEMENTS) // 2]
+N_CORES = min(8, os.cpu_count() or 1)
+
+TUNING_STAGES = [
+    ("relaxation", {"relax_U": [0.7, 0.9, 0.95], "relax_turb": [0.5, 0.7, 0.9]}),
+    ("gamg", {"p_smoother": ["GaussSeidel", "DIC", "DICGaussSeidel"],
+              "p_agglomerator": ["faceAreaPair", "algebraicPair"],
+              "p_coarsest": [10, 100]}),
+    ("tolerances", {"p_rel_tol": [0.01, 0.05, 0.1], "u_rel_tol": [0.1, 0.3]}),
+]
+
+# ==========================================
+# 1. Trials
+# ==========================================
+
+def representative_cases(shape, n, ref):
+    """n design points of a shape at one refinement level, as run_case task tuples."""
+    base = base_space(LENGTHS, DIAMETERS, VELOCITIES, [ref])
+    points = extend_design(shape, n, DOE_METHOD, TUNE_SEED, [], base)
+    return [(shape, pt["L"], pt["D"], pt["Ux"], pt["ref"], pt["params"], f"tune{i}")
+            for i, pt in enumerate(points)]
+
+def clear_results(run_dir):
+    """Removes every time directory and restores 0/ (potentialFoam overwrites it)."""
+    orig = os.path.join(run_dir, "0.orig")
+    if os.path.exists(orig):
+        shutil.rmtree(os.path.join(run_dir, "0"), ignore_errors=True)
+        shutil.copytree(orig, os.path.join(run_dir, "0"))
+    for name in os.listdir(run_dir):
+        try:
+            t = float(name)
+        except ValueError:
+            continue
+        if t != 0:
+            shutil.rmtree(os.path.join(run_dir, name))
+
+def prepare_case(task, backend, run_root=os.path.join(TUNE_DIR, "runs"), solver_profile=DEFAULT_SOLVER_PROFILE):
+    """Template copy, case files and mesh of a tuning case; 0/ is kept as 0.orig/."""
+    shape, L, D, Ux, ref, params, case_id = task
+    run_dir = os.path.join(run_root, f"{shape}_{case_id}")
+    if os.path.exists(run_dir): shutil.rmtree(run_dir)
+    shutil.copytree(TEMPLATE_DIR, run_dir)
+    generate_case_files(run_dir, shape, L, D, ref, Ux, params, solver_profile=solver_profile)
+    backend.mesh(run_dir, {"shape": shape, "L": L, "D": D, "Ux": Ux, "ref": ref, "params": params})
+    shutil.copytree(os.path.join(run_dir, "0"), os.path.join(run_dir, "0.orig"))
+    return run_dir
+
+def run_trials(job):
+    """Worker: solves one case with every candidate profile; returns (task, [result])."""
+    task, profiles, backend = job
+    shape, L, D, Ux, ref, params, case_id = task
+    case = {"shape": shape, "L": L, "D": D, "Ux": Ux, "ref": ref, "params": params}
+    run_dir = os.path.join(TUNE_DIR, "runs", f"{shape}_{case_id}")
+    results = []
+    try:
+        if not os.path.exists(os.path.join(run_dir, "constant", "polyMesh")):
+            prepare_case(task, backend)
+    except Exception as e:
+        return task, [{"error": f"mesh: {e}"} for _ in profiles]
+
+    for profile in profiles:
+        try:
+            clear_results(run_dir)
+            with open(os.path.join(run_dir, "system", "fvSolution"), "w") as f:
+                f.write(fv_solution(profile))
+            if use_potential_init(shape):
+                backend.initialize(run_dir, case)
+            results.append(backend.solve(run_dir, case))
+        except subprocess.CalledProcessError as e:
+            results.append({"error": f"CMD {e.cmd[0]} failed"})
+        except Exception as e:
+            results.append({"error": str(e)})
+    return task, results
+
+def score(results):
+    """Sort key of one profile over a shape's cases: (failed or unconverged, total wall s)."""
+    bad = sum(1 for r in results if "error" in r or not r.get("converged"))
+    return bad, sum(r.get("wall_s", 0.0) for r in results if "error" not in r)
+
+def summarize(results):
+    ok = [r for r in results if "error" not in r]
+    n = max(len(ok), 1)
+    return {"iterations": sum(r["iterations"] or 0 for r in ok) / n,
+            "wall_s": sum(r["wall_s"] for r in ok) / n,
+            "converged": sum(1 for r in ok if r.get("converged"))}
+
+# ==========================================
+# 2. Staged Search
+# ==========================================
+
+def stage_candidates(best, grid):
+    """best with every combination of the stage's settings; best itself comes first."""
+    keys = list(grid)
+    candidates = [best]
+    for values in itertools.product(*(grid[k] for k in keys)):
+        cand = {**best, **dict(zip(keys, values))}
+        if cand not in candidates:
+            candidates.append(cand)
+    return candidates
+
+def tune(shapes, n_cases, ref, backend, cores, trials_log):
+    tasks = {shape: representative_cases(shape, n_cases, ref) for shape in shapes}
+    best = {shape: dict(DEFAULT_SOLVER_PROFILE) for shape in shapes}
+    baseline, best_summary = {}, {}
+
+    for stage, grid in TUNING_STAGES:
+        candidates = {shape: stage_candidates(best[shape], grid) for shape in shapes}
+        jobs = [(task, candidates[shape], backend) for shape in shapes for task in tasks[shape]]
+        n_solves = sum(len(c) * n_cases for c in candidates.values())
+        print(f"\nStage '{stage}': {n_solves} solves on {cores} cores...")
+
+        per_candidate = {shape: [[] for _ in candidates[shape]] for shape in shapes}
+        with Pool(cores) as pool:
+            for i, (task, results) in enumerate(pool.imap_unordered(run_trials, jobs)):
+                shape = task[0]
+                for j, r in enumerate(results):
+                    per_candidate[shape][j].append(r)
+                    trials_log.write(json.dumps({"stage": stage, "shape": shape, "case": task[-1],
+                                                 "profile": candidates[shape][j], **r}) + "\n")
+                trials_log.flush()
+                sys.stdout.write(f"\rProgress: {((i+1)/len(jobs))*100:.1f}%")
+                sys.stdout.flush()
+        print()
+
+        for shape in shapes:
+            # Candidate 0 is the incoming best (the template settings in the first stage)
+            if shape not in baseline:
+                baseline[shape] = summarize(per_candidate[shape][0])
+            j = min(range(len(candidates[shape])), key=lambda j: score(per_candidate[shape][j]))
+            best[shape] = candidates[shape][j]
+            best_summary[shape] = summarize(per_candidate[shape][j])
+            s = best_summary[shape]
+            print(f"  {shape:<10} {s['iterations']:>7.0f} it  {s['wall_s']:>8.1f} s  "
+                  f"{s['converged']}/{n_cases} converged")
+
+    return {shape: {"profile": best[shape],
+                    **best_summary[shape],
+                    **{f"baseline_{k}": v for k, v in baseline[shape].items() if k != "converged"},
+                    "cases": [t[-1] for t in tasks[shape]]}
+            for shape in shapes}
+
+def save_profiles(tuned, path):
+    shapes = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            shapes = json.load(f)["shapes"]
+    shapes.update(tuned)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"stages": {name: grid for name, grid in TUNING_STAGES}, "shapes": shapes},
+                  f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# ==========================================
+# 3. Main
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune fvSolution settings per shape.")
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPE_HANDLERS), choices=list(SHAPE_HANDLERS))
+    parser.add_argument("--cases-per-shape", type=int, default=CASES_PER_SHAPE)
+    parser.add_argument("--ref", type=int, default=TUNE_REFINEMENT, help="Refinement level of the tuning cases")
+    parser.add_argument("--cores", type=int, default=N_CORES)
+    parser.add_argument("--backend", default="openfoam", choices=["openfoam", "mock"])
+    parser.add_argument("--output", default=SOLVER_PROFILES_FILE)
+    parser.add_argument("--keep-runs", action="store_true", help="Keep solver_tuning/runs/ (meshes, logs)")
+    args = parser.parse_args()
+
+    if not os.path.exists("shapes") or not os.path.exists(TEMPLATE_DIR):
+        print("Run setup_shapes.py and reset_template.py first!")
+        sys.exit(1)
+
+    os.makedirs(os.path.join(TUNE_DIR, "runs"), exist_ok=True)
+    backend = get_backend(args.backend)
+    with open(os.path.join(TUNE_DIR, "trials.jsonl"), "a") as trials_log:
+        tuned = tune(args.shapes, args.cases_per_shape, args.ref, backend, args.cores, trials_log)
+    if not args.keep_runs:
+        shutil.rmtree(os.path.join(TUNE_DIR, "runs"), ignore_errors=True)
+
+    save_profiles(tuned, args.output)
+    print(f"\n{'shape':<10} {'baseline it':>12} {'tuned it':>9} {'baseline s':>11} {'tuned s':>8} {'speedup':>8}")
+    for shape, e in tuned.items():
+        speedup = e["baseline_wall_s"] / e["wall_s"] if e["wall_s"] > 0 else float("nan")
+        print(f"{shape:<10} {e['baseline_iterations']:>12.0f} {e['iterations']:>9.0f} "
+              f"{e['baseline_wall_s']:>11.1f} {e['wall_s']:>8.1f} {speedup:>7.2f}x")
+    print(f"Profiles -> {args.output} (applied by generate_dataset.py to new cases)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+vis_worker.py - Asynchronous Training Visualizations
+
+PURPOSE:
+    Renders truth-vs-prediction 3D scatter plots in a separate process so the
+    training loop never waits on matplotlib. The trainer snapshots predictions
+    for a fixed set of validation cases to CPU and submits them; the renderer
+    writes PNGs to OUTPUT_DIR and hands the paths back for wandb logging.
+
+USAGE:
+    worker = VisualizationWorker()
+    worker.submit(epoch, [{"key": "Vis/Pressure", "coords": xyz, "target": t, "pred": p,
+                           "truth_title": "Truth", "pred_title": "Pred"}])
+    for res in worker.drain():            # non-blocking, call once per epoch
+        wandb.log({k: wandb.Image(v) for k, v in res["images"].items()})
+    worker.close()
+
+NOTES:
+    - The renderer is started with 'spawn' so it never inherits a CUDA context.
+    - If the renderer falls behind by more than `max_pending` jobs, new jobs are
+      dropped instead of blocking training.
+    - This module must stay free of torch imports (it is re-imported in the child).
+"""
+
+import os
+import queue
+import multiprocessing as mp
+
+import numpy as np
+
+OUTPUT_DIR = "training_visuals"
+
+# ==========================================
+# Plotting
+# ==========================================
+
+def create_comparison_plot(coords, target, pred, truth_title, pred_title,
+                           point_size=5, colorbar=False, max_points=2000):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    if max_points and coords.shape[0] > max_points:
+        idx = np.random.choice(coords.shape[0], max_points, replace=False)
+        coords = coords[idx]
+        target = target[idx]
+        pred = pred[idx]
+
+    fig = plt.figure(figsize=(10, 5))
+    ax1 = fig.add_subplot(1, 2, 1, projection='3d')
+    sc1 = ax1.scatter(coords[:,0], coords[:,1], coords[:,2], c=target, cmap='jet', s=point_size, alpha=0.7)
+    ax1.set_title(truth_title)
+
+    ax2 = fig.add_subplot(1, 2, 2, projection='3d')
+    sc2 = ax2.scatter(coords[:,0], coords[:,1], coords[:,2], c=pred, cmap='jet', s=point_size, alpha=0.7)
+    ax2.set_title(pred_title)
+
+    if colorbar:
+        plt.colorbar(sc1, ax=ax1)
+        plt.colorbar(sc2, ax=ax2)
+    else:
+        ax1.axis('off')
+        ax2.axis('off')
+    plt.tight_layout()
+    return fig
+
+# ==========================================
+# Renderer Process
+# ==========================================
+
+def _render_loop(job_queue, result_queue, output_dir):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    os.makedirs(output_dir, exist_ok=True)
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        images = {}
+        for panel in job["panels"]:
+            try:
+                fig = create_comparison_plot(
+                    panel["coords"], panel["target"], panel["pred"],
+                    panel["truth_title"], panel["pred_title"],
+                    point_size=panel.get("point_size", 5),
+                    colorbar=panel.get("colorbar", False),
+                )
+                fname = panel["key"].replace("/", "_") + f"_ep{job['epoch']}.png"
+                path = os.path.join(output_dir, fname)
+                fig.savefig(path, dpi=100)
+                plt.close(fig)
+                images[panel["key"]] = path
+            except Exception as e:
+                print(f"Visualization failed for {panel['key']} (epoch {job['epoch']}): {e}")
+
+        result_queue.put({"epoch": job["epoch"], "images": images})
+
+# ==========================================
+# Parent-side Handle
+# ==========================================
+
+class VisualizationWorker:
+    def __init__(self, output_dir=OUTPUT_DIR, max_pending=2):
+        ctx = mp.get_context("spawn")
+        self._jobs = ctx.Queue(maxsize=max_pending)
+        self._results = ctx.Queue()
+        self._proc = ctx.Process(target=_render_loop, args=(self._jobs, self._results, output_dir),
+                                 name="VisualizationWorker", daemon=True)
+        self._proc.start()
+
+    def submit(self, epoch, panels):
+        """Queues CPU numpy panels for rendering. Never blocks."""
+        try:
+            self._jobs.put_nowait({"epoch": epoch, "panels": panels})
+        except queue.Full:
+            print(f"Visualization worker busy, skipping epoch {epoch}")
+
+    def drain(self):
+        """Returns all finished renders without waiting."""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def close(self, timeout=60):
+        """Stops the renderer after pending jobs finish and returns their results."""
+        results = []
+        self._jobs.put(None)
+        while self._proc.is_alive():
+            try:
+                results.append(self._results.get(timeout=1))
+            except queue.Empty:
+                timeout -= 1
+                if timeout <= 0:
+                    self._proc.terminate()
+                    break
+        self._proc.join()
+        return results + self.drain()
@@ -0,0 +1,380 @@
+"""
+work_queue.py - Multi-Host Work Queue on a Shared Filesystem
+
+PURPOSE:
+    Spreads the generate_dataset.py sweep over any number of machines that mount
+    the same directory. There is no server and no lock:
+    - claim   : a worker renames pending/<job>.json to claimed/<job>@<worker>.json;
+                rename is atomic, so exactly one worker wins each job
+    - lease   : while a job runs, a heartbeat thread touches the claimed file
+    - recover : a claimed file not touched for LEASE_S (its worker died or lost
+                the mount) is moved back to pending by whichever worker sees it first
+    - finish  : the result goes to done/<job>.json (or failed/ after MAX_ATTEMPTS)
+    Cases are written to the shared output tree given at submit time, through a
+    per-worker temp file that is fsynced and renamed into place
+    (generate_dataset.save_case). A killed worker leaves no partial .npy, and a
+    job that runs twice after a lease expired costs time: each run replaces the
+    case with a complete one.
+
+USAGE:
+    python work_queue.py submit --queue /shared/queue --output /shared/data_output
+    python work_queue.py worker --queue /shared/queue --cores 16      # on every host
+    python work_queue.py status --queue /shared/queue
+    python work_queue.py recover --queue /shared/queue                # requeue stale leases now
+    python work_queue.py selftest                                      # local multi-process test
+
+LAYOUT:
+    <queue>/config.json                      output_dir, lease settings
+    <queue>/pending/<job>.json               job spec (kind, task, attempts)
+    <queue>/claimed/<job>@<host>-<pid>.json  running; mtime = last heartbeat
+    <queue>/done/<job>.json, failed/<job>.json
+    <queue>/.clock                           touched to read the file server's time
+
+NOTES:
+    - Lease ages use the shared filesystem's clock (mtime of .clock), so host
+      clock skew does not expire live leases.
+    - Workers do not update catalog.sqlite (SQLite locking is unreliable on NFS);
+      run 'python case_catalog.py scan --data-dir <output>' when the sweep is done.
+    - temp_runs/ stays local to each host (relative to the worker's cwd).
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing import Process
+
+# --- Configuration ---
+LEASE_S = 600.0             # A claim without a heartbeat for this long is requeued
+HEARTBEAT_S = 30.0
+POLL_S = 10.0               # Idle wait while other workers still hold leases
+MAX_ATTEMPTS = 3
+
+STATES = ("pending", "claimed", "done", "failed")
+
+# ==========================================
+# 1. Queue Primitives
+# ==========================================
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def job_name(path):
+    """'valve_12@host-123.json' -> 'valve_12'."""
+    return os.path.basename(path).split("@", 1)[0].rsplit(".json", 1)[0]
+
+def write_json_atomic(path, obj):
+    tmp_path = f"{path}.tmp-{worker_id()}"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def fs_now(queue):
+    """Current time as seen by the shared filesystem."""
+    path = os.path.join(queue, ".clock")
+    with open(path, "a"):
+        pass
+    os.utime(path, None)
+    return os.stat(path).st_mtime
+
+def init_queue(queue, output_dir, lease_s=LEASE_S, heartbeat_s=HEARTBEAT_S):
+    for state in STATES:
+        os.makedirs(os.path.join(queue, state), exist_ok=True)
+    config_path = os.path.join(queue, "config.json")
+    config = read_json(config_path) if os.path.exists(config_path) else {}
+    config.update({"output_dir": os.path.abspath(output_dir), "lease_s": lease_s, "heartbeat_s": heartbeat_s})
+    write_json_atomic(config_path, config)
+    return config
+
+def load_config(queue):
+    return read_json(os.path.join(queue, "config.json"))
+
+def list_jobs(queue, state):
+    d = os.path.join(queue, state)
+    return sorted(f for f in os.listdir(d) if f.endswith(".json"))
+
+def known_jobs(queue):
+    return {job_name(f) for state in STATES for f in list_jobs(queue, state)}
+
+def submit_jobs(queue, jobs):
+    """jobs: {name: spec}. Names already anywhere in the queue are skipped."""
+    known = known_jobs(queue)
+    added = 0
+    for name, spec in jobs.items():
+        if name in known:
+            continue
+        write_json_atomic(os.path.join(queue, "pending", f"{name}.json"), {**spec, "attempts": 0})
+        added += 1
+    return added
+
+def claim(queue, wid):
+    """Atomically takes one pending job; returns (claimed_path, spec) or None."""
+    pending = list_jobs(queue, "pending")
+    random.shuffle(pending)   # Spread concurrent workers over different files
+    for fname in pending:
+        src = os.path.join(queue, "pending", fname)
+        dst = os.path.join(queue, "claimed", f"{job_name(fname)}@{wid}.json")
+        try:
+            # Lease starts now, not at submit time: touch before the rename so the claim
+            # never appears in claimed/ with an old mtime that recover_stale would take
+            os.utime(src, None)
+            os.rename(src, dst)
+            os.utime(dst, None)
+            return dst, read_json(dst)
+        except FileNotFoundError:
+            continue          # Another worker won this one, or recovered it meanwhile
+    return None
+
+def recover_stale(queue, lease_s):
+    """Moves claims older than lease_s back to pending (or to failed after MAX_ATTEMPTS)."""
+    now = fs_now(queue)
+    recovered = []
+    for fname in list_jobs(queue, "claimed"):
+        path = os.path.join(queue, "claimed", fname)
+        try:
+            age = now - os.stat(path).st_mtime
+        except FileNotFoundError:
+            continue
+        if age < lease_s:
+            continue
+        # Take the stale claim first so only one recoverer requeues it
+        grab = os.path.join(queue, "claimed", f"{fname}.recover-{worker_id()}")
+        try:
+            os.rename(path, grab)
+        except FileNotFoundError:
+            continue
+        name = job_name(fname)
+        spec = read_json(grab)
+        spec["attempts"] = spec.get("attempts", 0) + 1
+        spec.setdefault("history", []).append({"event": "lease_expired", "claim": fname, "age_s": round(age, 1)})
+        state = "failed" if spec["attempts"] >= MAX_ATTEMPTS else "pending"
+        if not os.path.exists(os.path.join(queue, "done", f"{name}.json")):
+            write_json_atomic(os.path.join(queue, state, f"{name}.json"), spec)
+        os.remove(grab)
+        recovered.append(name)
+    return recovered
+
+class Heartbeat:
+    """Touches the claimed file every interval; `lost` is set if the claim disappears."""
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.path, None)
+            except FileNotFoundError:
+                self.lost = True
+                return
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+def finish(queue, claimed_path, spec, result, elapsed, wid):
+    name = job_name(claimed_path)
+    spec = {**spec, "worker": wid, "elapsed_s": round(elapsed, 2), "result": result}
+    if result is None:
+        write_json_atomic(os.path.join(queue, "done", f"{name}.json"), spec)
+    else:
+        spec["attempts"] = spec.get("attempts", 0) + 1
+        spec.setdefault("history", []).append({"event": "error", "worker": wid, "result": result})
+        state = "failed" if spec["attempts"] >= MAX_ATTEMPTS else "pending"
+        write_json_atomic(os.path.join(queue, state, f"{name}.json"), spec)
+    try:
+        os.remove(claimed_path)
+    except FileNotFoundError:
+        pass                  # Lease expired meanwhile and someone requeued it
+
+# ==========================================
+# 2. Jobs
+# ==========================================
+
+def run_case_job(spec, output_dir):
+    from generate_dataset import run_case
+    os.makedirs("temp_runs", exist_ok=True)
+    t = spec["task"]
+    return run_case((t["shape"], t["L"], t["D"], t["Ux"], t["ref"], t["params"], t["id"]),
+                    output_dir=output_dir, catalog=False)
+
+def run_sleep_job(spec, output_dir):
+    """Test job: sleeps, then writes <output_dir>/<name>.txt with the worker id."""
+    time.sleep(spec["task"]["seconds"])
+    path = os.path.join(output_dir, f"{spec['task']['name']}.txt")
+    with open(path, "a") as f:
+        f.write(worker_id() + "\n")
+    return None
+
+JOB_KINDS = {
+    "case": run_case_job,
+    "sleep": run_sleep_job,
+}
+
+# ==========================================
+# 3. Worker
+# ==========================================
+
+def worker_loop(queue):
+    config = load_config(queue)
+    lease_s, heartbeat_s = config["lease_s"], config["heartbeat_s"]
+    wid = worker_id()
+    n_done = 0
+    while True:
+        recover_stale(queue, lease_s)
+        got = claim(queue, wid)
+        if got is None:
+            if not list_jobs(queue, "claimed") and not list_jobs(queue, "pending"):
+                break         # Queue drained
+            time.sleep(min(POLL_S, lease_s / 4))
+            continue
+
+        claimed_path, spec = got
+        name = job_name(claimed_path)
+        if os.path.exists(os.path.join(queue, "done", f"{name}.json")):
+            os.remove(claimed_path)   # Finished by an earlier holder of an expired lease
+            continue
+
+        beat = Heartbeat(claimed_path, heartbeat_s)
+        t0 = time.time()
+        try:
+            result = JOB_KINDS[spec["kind"]](spec, config["output_dir"])
+        except Exception as e:
+            result = f"Err: {name} - {e}"
+        finally:
+            beat.stop()
+        if beat.lost:
+            print(f"[{wid}] lease on {name} was lost while running")
+        finish(queue, claimed_path, spec, result, time.time() - t0, wid)
+        if result: print(f"[{wid}] {result}")
+        n_done += 1
+    print(f"[{wid}] queue drained after {n_done} jobs")
+
+def run_workers(queue, n):
+    procs = [Process(target=worker_loop, args=(queue,)) for _ in range(n)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+def print_status(queue):
+    config = load_config(queue)
+    now = fs_now(queue)
+    counts = {state: len(list_jobs(queue, state)) for state in STATES}
+    print(f"Queue {queue} -> {config['output_dir']}")
+    print("  " + "  ".join(f"{state}: {n}" for state, n in counts.items()))
+    for fname in list_jobs(queue, "claimed"):
+        age = now - os.stat(os.path.join(queue, "claimed", fname)).st_mtime
+        flag = "  STALE" if age >= config["lease_s"] else ""
+        print(f"  {fname[:-5]:<50} heartbeat {age:7.1f}s ago{flag}")
+    return counts
+
+# ==========================================
+# 4. Local Self-Test
+# ==========================================
+
+def selftest(n_jobs=40, n_workers=4):
+    """
+    Several worker processes drain a temp queue of sleep jobs while one claim is
+    abandoned (as if its host died); checks that every job finishes exactly once.
+    """
+    root = tempfile.mkdtemp(prefix="work_queue_test_")
+    queue, output = os.path.join(root, "queue"), os.path.join(root, "out")
+    os.makedirs(output)
+    init_queue(queue, output, lease_s=2.0, heartbeat_s=0.25)
+    rng = random.Random(0)
+    jobs = {f"job_{i:03d}": {"kind": "sleep", "task": {"name": f"job_{i:03d}", "seconds": rng.uniform(0.05, 0.3)}}
+            for i in range(n_jobs)}
+    submit_jobs(queue, jobs)
+
+    # A "dead" worker: claims a job and never heartbeats or finishes
+    dead = claim(queue, "deadhost-0")
+    print(f"Abandoned claim: {os.path.basename(dead[0])}")
+
+    # Separate interpreters, as on separate hosts
+    t0 = time.time()
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--queue", queue, "--cores", "1"])
+             for _ in range(n_workers)]
+    codes = [p.wait() for p in procs]
+    elapsed = time.time() - t0
+
+    done = {job_name(f) for f in list_jobs(queue, "done")}
+    runs = {}
+    for name in jobs:
+        path = os.path.join(output, f"{name}.txt")
+        runs[name] = len(open(path).read().split()) if os.path.exists(path) else 0
+    workers = {read_json(os.path.join(queue, "done", f))["worker"] for f in list_jobs(queue, "done")}
+
+    checks = {
+        "workers exited cleanly": all(c == 0 for c in codes),
+        "every job done": done == set(jobs),
+        "every output written exactly once": all(n == 1 for n in runs.values()),
+        "nothing left pending/claimed/failed": not any(list_jobs(queue, s) for s in ("pending", "claimed", "failed")),
+        "abandoned claim recovered": job_name(dead[0]) in done,
+        "work spread over workers": len(workers) > 1,
+    }
+    print(f"\n{n_jobs} jobs, {n_workers} workers, {elapsed:.1f}s, {len(workers)} workers did work")
+    for check, ok in checks.items():
+        print(f"  {'PASS' if ok else 'FAIL'}  {check}")
+    shutil.rmtree(root)
+    return all(checks.values())
+
+# ==========================================
+# 5. Main
+# ==========================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-filesystem work queue for the CFD sweep.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("submit", help="Queue every design point without an output (generate_dataset.build_tasks)")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--output", required=True, help="Shared output tree for the .npy cases")
+    p.add_argument("--lease", type=float, default=LEASE_S)
+    p.add_argument("--heartbeat", type=float, default=HEARTBEAT_S)
+    p = sub.add_parser("worker", help="Run worker processes on this host until the queue is drained")
+    p.add_argument("--queue", required=True)
+    p.add_argument("--cores", type=int, default=os.cpu_count() or 1)
+    for name in ("status", "recover"):
+        sub.add_parser(name).add_argument("--queue", required=True)
+    p = sub.add_parser("selftest", help="Local test: several workers against a temp queue")
+    p.add_argument("--jobs", type=int, default=40)
+    p.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        from generate_dataset import build_tasks
+        os.makedirs(args.output, exist_ok=True)
+        init_queue(args.queue, args.output, args.lease, args.heartbeat)
+        jobs = {f"{shape}_{uid}": {"kind": "case", "task": {"shape": shape, "L": L, "D": D, "Ux": Ux,
+                                                             "ref": ref, "params": params, "id": uid}}
+                for shape, L, D, Ux, ref, params, uid in build_tasks(args.output)}
+        print(f"Queued {submit_jobs(args.queue, jobs)} new jobs ({len(jobs)} without output)")
+    elif args.command == "worker":
+        run_workers(args.queue, args.cores)
+    elif args.command == "status":
+        print_status(args.queue)
+    elif args.command == "recover":
+        recovered = recover_stale(args.queue, load_config(args.queue)["lease_s"])
+        print(f"Requeued {len(recovered)} stale jobs: {', '.join(recovered)}")
+    else:
+        sys.exit(0 if selftest(args.jobs, args.workers) else 1)
+
+if __name__ == "__main__":
+    main()